@@ -0,0 +1,197 @@
+"""绘图全流程基准测试
+
+使用本地模拟绘画服务和本地模拟 LLM，构造 OneBot 群消息事件交给 NoneBot 分发，每个任务在独立的群中发起，
+由 handle_draw 跑完整的绘图流程：冷却与槽位检查 -> 参数解析与违禁词过滤 -> 提示词优化 -> 生成图片
+-> 图片后处理 -> 经出站消息队列发送。发送通过一个模拟的 WebSocket 连接完成，
+适配器照常序列化请求并等待回执，只是不经过网络。
+输出吞吐量，插件自身记录的参数解析、违禁词过滤、提示词优化、生成、后处理和发送各阶段 p50/p95/p99，
+以及首条回复和出图的端到端延迟。
+
+用法：
+    python -m benchmarks.bench_draw --jobs 200 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from typing import Dict
+
+from .common import format_stage_table, prepare_workdir
+
+SELF_ID = "10000"
+
+
+async def start_stub_llm(latency: float, jitter: float) -> asyncio.AbstractServer:
+    """启动一个只实现 /v1/chat/completions 的最小 HTTP 服务"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                headers = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in headers.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                body = json.loads(await reader.readexactly(length)) if length else {}
+                await asyncio.sleep(max(0.0, random.uniform(latency - jitter, latency + jitter)))
+                prompt = body.get("messages", [{}])[-1].get("content", "")[-40:]
+                payload = json.dumps({
+                    "choices": [{"message": {"role": "assistant", "content": f"masterpiece, best quality, {prompt}"}}]
+                }).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+class FakeWebSocket:
+    """代替 OneBot 实现的反向 WebSocket 连接：记录各群收到首条回复和图片的时间，延迟 latency 秒后回执"""
+
+    def __init__(self, adapter, latency: float):
+        self.adapter = adapter
+        self.latency = latency
+        self.first_reply: Dict[int, float] = {}
+        self.image_reply: Dict[int, float] = {}
+        self.sent = 0
+
+    async def send(self, data: str) -> None:
+        request = json.loads(data)
+        params = request["params"]
+        now = time.perf_counter()
+        # 每个任务在独立的群中发起，按群号区分回复属于哪个任务
+        group_id = params.get("group_id")
+        if group_id is not None:
+            self.first_reply.setdefault(group_id, now)
+            if any(segment.get("type") == "image" for segment in params.get("message", [])):
+                self.image_reply[group_id] = now
+        self.sent += 1
+        asyncio.get_running_loop().create_task(self._reply(request["echo"]))
+
+    async def _reply(self, echo: str) -> None:
+        await asyncio.sleep(self.latency)
+        self.adapter._result_store.add_result({
+            "status": "ok", "retcode": 0, "data": {"message_id": self.sent}, "echo": echo
+        })
+
+
+async def run(args: argparse.Namespace):
+    server = await start_stub_llm(args.llm_latency, args.llm_latency / 2)
+    port = server.sockets[0].getsockname()[1]
+
+    prepare_workdir({
+        "oai": {"api_base": f"http://127.0.0.1:{port}"},
+        "draw": {
+            "default_service": "stub",
+            "cooldown": 0,
+            "max_concurrent": args.concurrency,
+            "progress_updates": 0,
+            "journal": {"enable": False},
+            "hedge": {"enable": False},
+            "prompt_optimizer": {"skip_english": False},
+            "postprocess": {"enable": not args.no_postprocess},
+            "stub": {
+                "enable": True,
+                "latency": args.latency,
+                "latency_mean": args.latency_mean,
+                "latency_jitter": args.latency_jitter,
+                "failure_rate": args.failure_rate,
+                "seed": 42,
+            },
+        },
+    })
+
+    import nonebot
+    nonebot.init(log_level="WARNING")
+    from nonebot.adapters.onebot.v11 import Adapter, Bot, GroupMessageEvent, Message
+    from nonebot.message import handle_event
+
+    driver = nonebot.get_driver()
+    driver.register_adapter(Adapter)
+    nonebot.load_plugin("plugins.draw")
+    from plugins import draw as draw_plugin
+    from utils.perf import perf
+
+    adapter = nonebot.get_adapter(Adapter)
+    websocket = FakeWebSocket(adapter, args.send_latency)
+    adapter.connections[SELF_ID] = websocket
+    bot = Bot(adapter, SELF_ID)
+    perf.configure({"window": 86400, "max_samples": args.jobs * 4})
+    perf.reset()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    started: Dict[int, float] = {}
+
+    def group_of(index: int) -> int:
+        return 1 + index
+
+    def make_event(index: int) -> GroupMessageEvent:
+        text = f"{draw_plugin.DRAW_COMMAND} {args.prompt} {index} -s 横 -n 20 -m stub"
+        user_id = 100000 + index
+        return GroupMessageEvent(
+            time=int(time.time()), self_id=int(SELF_ID), post_type="message", sub_type="normal",
+            user_id=user_id, message_type="group", message_id=index + 1,
+            message=Message(text), original_message=Message(text), raw_message=text, font=0,
+            sender={"user_id": user_id, "nickname": f"bench{index}"},
+            group_id=group_of(index), to_me=False
+        )
+
+    async def job(index: int):
+        async with semaphore:
+            started[index] = time.perf_counter()
+            await handle_event(bot, make_event(index))
+
+    begin = time.perf_counter()
+    await asyncio.gather(*(job(i) for i in range(args.jobs)))
+    elapsed = time.perf_counter() - begin
+
+    server.close()
+    stages = defaultdict(list)
+    # 插件在各阶段记录的耗时：参数解析、违禁词过滤、提示词优化、生成、后处理、发送
+    for stage in ("parse", "filter", "prompt_opt", "image_gen", "postprocess", "send"):
+        stages[stage] = perf.values(stage)
+    for index, start in started.items():
+        group_id = group_of(index)
+        if group_id in websocket.first_reply:
+            stages["first_reply"].append(websocket.first_reply[group_id] - start)
+        if group_id in websocket.image_reply:
+            stages["total"].append(websocket.image_reply[group_id] - start)
+
+    completed = len(stages["total"])
+    print(
+        f"jobs={args.jobs} concurrency={args.concurrency} "
+        f"completed={completed} without_image={args.jobs - completed} messages={websocket.sent}"
+    )
+    print(f"elapsed={elapsed:.2f}s throughput={completed / elapsed:.2f} jobs/s\n")
+    print(format_stage_table(stages))
+
+    from utils.process_pool import shutdown_pool
+    shutdown_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="绘图全流程基准测试")
+    parser.add_argument("--jobs", type=int, default=100, help="总任务数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发数，同时也是绘图槽位数")
+    parser.add_argument("--prompt", default="一只在雪地里的红狐狸", help="提示词")
+    parser.add_argument("--latency", default="lognormal", choices=["fixed", "uniform", "lognormal"])
+    parser.add_argument("--latency-mean", type=float, default=0.5, help="模拟绘画服务平均延迟(秒)")
+    parser.add_argument("--latency-jitter", type=float, default=0.3)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="模拟绘画服务失败率")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="模拟 LLM 平均延迟(秒)")
+    parser.add_argument("--send-latency", type=float, default=0.01, help="模拟 OneBot 回执延迟(秒)")
+    parser.add_argument("--no-postprocess", action="store_true", help="关闭图片后处理")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
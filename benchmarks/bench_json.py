@@ -0,0 +1,149 @@
+"""JSON 序列化基准测试
+
+用与线上相同结构和大小的数据（聊天请求体、模型响应、聊天日志元数据、OneBot 事件帧、
+对话历史），对比标准库 json 与 orjson 的序列化、反序列化耗时，并显示 utils.jsonlib 当前使用的实现。
+未安装 orjson 时只测试标准库。
+
+用法：
+    python -m benchmarks.bench_json --repeat 20000
+"""
+import argparse
+import json
+import time
+
+import tomli
+
+from .common import ROOT, percentile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def build_payloads() -> dict:
+    with open(ROOT / "config.example.toml", "rb") as f:
+        system_prompt = tomli.load(f)["oai"]["system_prompt"]
+    question = "冰冰你觉得今天晚上吃火锅还是烧烤比较好？顺便推荐一下附近好吃的店"
+    answer = "火锅！天冷就该涮起来🔥 烧烤留给夏天，附近那家老码头评价不错，记得早点去排队~"
+    history = []
+    for _ in range(3):
+        history += [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+    request = {
+        "model": "gpt-3.5-turbo",
+        "messages": [{"role": "system", "content": system_prompt}, *history, {"role": "user", "content": question}],
+        "temperature": 0.5,
+        "max_tokens": 1000,
+    }
+    response = {
+        "id": "chatcmpl-9xYzAbCdEfGhIjKlMnOpQrStUvWx",
+        "object": "chat.completion",
+        "created": 1760000000,
+        "model": "gpt-3.5-turbo-0125",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": answer * 2},
+            "logprobs": None,
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 412, "completion_tokens": 86, "total_tokens": 498},
+        "system_fingerprint": "fp_0123456789",
+    }
+    meta = {
+        "timestamp": 1760000000.123456,
+        "date": "2025-10-09",
+        "time": "20:13:20",
+        "user_id": "123456789",
+        "user_name": "路过的群友",
+        "platform": "qq",
+        "chat_type": "group",
+        "group_id": "987654321",
+        "group_name": "冰冰的粉丝群",
+        "model": "gpt-3.5-turbo",
+        "history_length": 6,
+        "response_time": 1.234,
+        "tokens": {"prompt": 412, "completion": 86, "total": 498},
+    }
+    event = {
+        "time": 1760000000,
+        "self_id": 10001,
+        "post_type": "message",
+        "message_type": "group",
+        "sub_type": "normal",
+        "message_id": 1234567890,
+        "group_id": 987654321,
+        "user_id": 123456789,
+        "anonymous": None,
+        "message": [
+            {"type": "at", "data": {"qq": "10001"}},
+            {"type": "text", "data": {"text": " " + question}},
+        ],
+        "raw_message": "[CQ:at,qq=10001] " + question,
+        "font": 0,
+        "sender": {"user_id": 123456789, "nickname": "路过的群友", "card": "", "role": "member"},
+    }
+    return {
+        "chat_request": request,
+        "chat_response": response,
+        "log_meta": meta,
+        "onebot_event": event,
+        "history": history,
+    }
+
+
+def stdlib_dumps(obj, indent=False) -> bytes:
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def orjson_dumps(obj, indent=False) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+
+
+def measure(func, repeat: int) -> float:
+    """每次调用的耗时中位数（微秒），分成 20 批计时以减少计时器开销"""
+    batch = max(1, repeat // 20)
+    samples = []
+    for _ in range(20):
+        start = time.perf_counter()
+        for _ in range(batch):
+            func()
+        samples.append((time.perf_counter() - start) / batch)
+    return percentile(samples, 0.5) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON 序列化基准测试")
+    parser.add_argument("--repeat", type=int, default=20000, help="每项测试的调用次数")
+    args = parser.parse_args()
+
+    import sys
+    sys.path.insert(0, str(ROOT))
+    from utils import jsonlib
+
+    print(f"utils.jsonlib 当前实现：{jsonlib.BACKEND}")
+    if orjson is None:
+        print("未安装 orjson，只测试标准库（pip install orjson 或 uv sync --extra fast）")
+    print()
+    print(f"{'payload':<16}{'bytes':>8}{'op':>8}{'json us':>10}{'orjson us':>11}{'speedup':>9}")
+    for name, payload in build_payloads().items():
+        # 日志元数据按现有格式带缩进输出
+        indent = name == "log_meta"
+        encoded = stdlib_dumps(payload, indent)
+        rows = [
+            ("dumps", lambda: stdlib_dumps(payload, indent), lambda: orjson_dumps(payload, indent)),
+            ("loads", lambda: json.loads(encoded), lambda: orjson.loads(encoded)),
+        ]
+        for op, stdlib_func, orjson_func in rows:
+            base = measure(stdlib_func, args.repeat)
+            if orjson is not None:
+                fast = measure(orjson_func, args.repeat)
+                extra = f"{fast:>11.2f}{base / fast:>8.1f}x"
+            else:
+                extra = f"{'-':>11}{'-':>9}"
+            print(f"{name:<16}{len(encoded):>8}{op:>8}{base:>10.2f}{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""钞票图片合成基准测试
+
+对不同金额重复调用 merge_money_images，输出每次合成耗时和画布尺寸，
+用于确认合成耗时不随金额增长。
+
+用法：
+    python -m benchmarks.bench_money --repeat 20
+"""
+import argparse
+import time
+
+from .common import percentile, prepare_workdir
+
+AMOUNTS = [1, 7, 100, 388, 1314, 10_000, 1_000_000, 999_999_999]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="钞票图片合成基准测试")
+    parser.add_argument("--repeat", type=int, default=20, help="每个金额重复次数")
+    parser.add_argument("--amounts", type=int, nargs="*", default=AMOUNTS, help="测试金额")
+    args = parser.parse_args()
+
+    prepare_workdir({"money": {"max_amount": max(args.amounts)}})
+    import nonebot
+    from nonebot.adapters.onebot.v11 import Adapter
+    nonebot.init(log_level="WARNING")
+    nonebot.get_driver().register_adapter(Adapter)
+    nonebot.load_plugin("plugins.money")
+    from plugins.money import money
+
+    print(f"{'amount':>12}{'bills':>12}{'canvas':>14}{'p50 ms':>10}{'max ms':>10}")
+    for amount in args.amounts:
+        samples = []
+        image = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            image = money.merge_money_images(amount)
+            samples.append(time.perf_counter() - start)
+        bills = sum(money.decompose_amount(amount).values())
+        canvas = f"{image.width}x{image.height}"
+        print(
+            f"{amount:>12}{bills:>12}{canvas:>14}"
+            f"{percentile(samples, 0.5) * 1000:>10.2f}{max(samples) * 1000:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
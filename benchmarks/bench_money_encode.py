@@ -0,0 +1,55 @@
+"""钞票图片编码基准测试
+
+用自带的钞票图片合成不同金额的图片，对比各编码器的编码耗时和输出体积
+（含 base64 后的发送体积）。
+
+用法：
+    python -m benchmarks.bench_money_encode --repeat 10
+"""
+import argparse
+import time
+
+from .common import percentile, prepare_workdir
+
+AMOUNTS = [5, 388, 1314, 999_999_999]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="钞票图片编码基准测试")
+    parser.add_argument("--repeat", type=int, default=10, help="每种组合重复次数")
+    parser.add_argument("--amounts", type=int, nargs="*", default=AMOUNTS, help="测试金额")
+    parser.add_argument("--formats", nargs="*", default=None, help="测试的编码格式，默认全部")
+    args = parser.parse_args()
+
+    prepare_workdir({"money": {"max_amount": max(args.amounts)}})
+    import nonebot
+    from nonebot.adapters.onebot.v11 import Adapter
+    nonebot.init(log_level="WARNING")
+    nonebot.get_driver().register_adapter(Adapter)
+    nonebot.load_plugin("plugins.money")
+    from plugins.money import money
+    from plugins.money.encoders import DEFAULT_FORMAT, ENCODERS, encode, resolve_encoder
+
+    formats = args.formats or list(ENCODERS)
+    print(f"默认编码：{DEFAULT_FORMAT}\n")
+    print(f"{'amount':>12}{'canvas':>12}{'format':>14}{'p50 ms':>10}{'max ms':>10}{'KB':>10}{'base64 KB':>12}")
+    for amount in args.amounts:
+        image = money.merge_money_images(amount)
+        canvas = f"{image.width}x{image.height}"
+        for name in formats:
+            encoder, options = resolve_encoder({"format": name})
+            samples = []
+            data = b""
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                data = encode(image, encoder, options)
+                samples.append(time.perf_counter() - start)
+            print(
+                f"{amount:>12}{canvas:>12}{name:>14}"
+                f"{percentile(samples, 0.5) * 1000:>10.2f}{max(samples) * 1000:>10.2f}"
+                f"{len(data) / 1024:>10.1f}{(len(data) + 2) // 3 * 4 / 1024:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
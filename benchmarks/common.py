@@ -0,0 +1,79 @@
+"""基准测试共用工具"""
+import json
+import math
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import tomli
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """最近秩法计算分位数"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, math.ceil(q * len(ordered)) - 1)
+    return ordered[index]
+
+
+def format_stage_table(stages: Dict[str, List[float]]) -> str:
+    """按阶段输出 p50/p95/p99（毫秒）"""
+    lines = [f"{'stage':<12}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}"]
+    for name, samples in stages.items():
+        lines.append(
+            f"{name:<12}{len(samples):>8}"
+            f"{percentile(samples, 0.50) * 1000:>10.2f}"
+            f"{percentile(samples, 0.95) * 1000:>10.2f}"
+            f"{percentile(samples, 0.99) * 1000:>10.2f}"
+        )
+    return "\n".join(lines)
+
+
+def dump_toml(data: dict, prefix: str = "") -> str:
+    """把嵌套字典写成 TOML（只支持配置文件里用到的类型）"""
+    def value(v):
+        if isinstance(v, bool):
+            return "true" if v else "false"
+        if isinstance(v, (int, float)):
+            return repr(v)
+        if isinstance(v, str):
+            # JSON 字符串转义与 TOML 基本字符串兼容
+            return json.dumps(v, ensure_ascii=False)
+        if isinstance(v, list):
+            return "[" + ", ".join(value(i) for i in v) + "]"
+        raise TypeError(f"不支持的类型: {type(v)}")
+
+    scalars = [f"{k} = {value(v)}" for k, v in data.items() if not isinstance(v, dict)]
+    tables = []
+    for k, v in data.items():
+        if isinstance(v, dict):
+            name = f"{prefix}.{k}" if prefix else k
+            tables.append(f"\n[{name}]\n" + dump_toml(v, name))
+    return "\n".join(scalars) + "\n" + "".join(tables)
+
+
+def merge(base: dict, overrides: dict) -> dict:
+    for key, val in overrides.items():
+        if isinstance(val, dict) and isinstance(base.get(key), dict):
+            merge(base[key], val)
+        else:
+            base[key] = val
+    return base
+
+
+def prepare_workdir(overrides: Optional[dict] = None) -> Path:
+    """以 config.example.toml 为模板生成临时配置并切换到该目录（插件从当前目录读取 config.toml）"""
+    with open(ROOT / "config.example.toml", "rb") as f:
+        config = tomli.load(f)
+    merge(config, overrides or {})
+    workdir = Path(tempfile.mkdtemp(prefix="llmq-bench-"))
+    (workdir / "config.toml").write_text(dump_toml(config), encoding="utf-8")
+    os.chdir(workdir)
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    return workdir
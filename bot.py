@@ -1,13 +1,139 @@
-import nonebot
-from nonebot.adapters.onebot.v11 import Adapter as ONEBOT_V11Adapter
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
 
-nonebot.init(debug=True)
+import tomli
 
-driver = nonebot.get_driver()
-driver.register_adapter(ONEBOT_V11Adapter)
 
-nonebot.load_builtin_plugins("echo")
-nonebot.load_plugins("plugins")
+def load_workers_config() -> dict:
+    """读取 config.toml 中的 [workers] 配置"""
+    config_file = Path("config.toml")
+    if not config_file.exists():
+        return {}
+    with open(config_file, "rb") as f:
+        return tomli.load(f).get("workers", {})
+
+
+def load_server_config() -> dict:
+    """读取 config.toml 中的 [server] 配置"""
+    config_file = Path("config.toml")
+    if not config_file.exists():
+        return {}
+    with open(config_file, "rb") as f:
+        return tomli.load(f).get("server", {})
+
+
+def select_loop(name: str) -> str:
+    """选择 uvicorn 使用的事件循环：auto 在安装了 uvloop 时使用 uvloop，uvloop 未安装时退回 asyncio"""
+    if name not in ("auto", "asyncio", "uvloop"):
+        raise ValueError(f"不支持的事件循环: {name}，可选：auto, asyncio, uvloop")
+    if name == "asyncio":
+        return name
+    try:
+        import uvloop  # noqa: F401
+        return "uvloop"
+    except ImportError:
+        if name == "uvloop":
+            print("未安装 uvloop，使用 asyncio 事件循环（pip install uvloop 或 uv sync --extra fast）")
+        return "asyncio"
+
+
+def supervise(count: int, base_port: int, shard: str) -> None:
+    """启动并守护 count 个工作进程，异常退出的进程会被重新拉起"""
+    stopping = False
+    processes = {}
+
+    def spawn(index: int) -> subprocess.Popen:
+        env = {
+            **os.environ,
+            "BOT_WORKER_INDEX": str(index),
+            "BOT_WORKER_COUNT": str(count),
+            "BOT_WORKER_SHARD": shard,
+            "PORT": str(base_port + index),
+        }
+        print(f"启动工作进程 {index}，端口 {base_port + index}")
+        return subprocess.Popen([sys.executable, __file__], env=env)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            process.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(count):
+        processes[index] = spawn(index)
+
+    while processes:
+        time.sleep(1)
+        for index, process in list(processes.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            if stopping or code == 0:
+                del processes[index]
+            else:
+                print(f"工作进程 {index} 异常退出（{code}），正在重启")
+                processes[index] = spawn(index)
+
+
+def run_worker() -> None:
+    import nonebot
+    from nonebot.adapters.onebot.v11 import Adapter as ONEBOT_V11Adapter
+    from nonebot.log import logger
+
+    from utils import jsonlib
+    from utils.workers import WORKER_COUNT, WORKER_INDEX, is_worker, owns_event
+
+    if is_worker():
+        nonebot.init(debug=True, port=int(os.environ["PORT"]))
+    else:
+        nonebot.init(debug=True)
+
+    driver = nonebot.get_driver()
+    driver.register_adapter(ONEBOT_V11Adapter)
+
+    # 入口过滤：重连重试造成的重复消息和断线期间积压的旧消息不再处理
+    from utils.ingest import event_filter
+    event_filter.install()
+
+    # 按群分片：OneBot 实现同时连接所有工作进程，每个进程只处理属于自己的群和私聊
+    if is_worker() and os.environ.get("BOT_WORKER_SHARD") == "group":
+        from nonebot.exception import IgnoredException
+        from nonebot.message import event_preprocessor
+
+        @event_preprocessor
+        async def filter_other_shards(event):
+            if not owns_event(event):
+                raise IgnoredException("由其他工作进程处理")
+
+    if is_worker():
+        from utils.state import get_state
+        logger.info(f"工作进程 {WORKER_INDEX}/{WORKER_COUNT} 已启动")
+        if not get_state().shared:
+            logger.warning("多进程运行时应使用可共享的状态存储（[state] backend = \"sqlite\"），否则各进程状态互不相通")
+
+    loop = select_loop(load_server_config().get("loop", "auto"))
+    logger.info(f"事件循环：{loop}，JSON：{jsonlib.BACKEND}")
+
+    nonebot.load_builtin_plugins("echo")
+    nonebot.load_plugins("plugins")
+    nonebot.run(loop=loop)
+
 
 if __name__ == "__main__":
-    nonebot.run()
\ No newline at end of file
+    workers_config = load_workers_config()
+    worker_count = int(workers_config.get("count", 1))
+    if worker_count > 1 and "BOT_WORKER_INDEX" not in os.environ:
+        supervise(
+            worker_count,
+            int(workers_config.get("base_port", os.environ.get("PORT", 8080))),
+            workers_config.get("shard", "connection")
+        )
+    else:
+        run_worker()
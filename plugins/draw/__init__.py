@@ -1,4 +1,4 @@
-from nonebot import on_message, on_command
+from nonebot import on_message, on_command, get_driver
 from nonebot.adapters.onebot.v11 import Message, MessageEvent, MessageSegment, GroupMessageEvent, PrivateMessageEvent, Bot
 from nonebot.plugin import PluginMetadata
 from nonebot.rule import Rule, to_me
@@ -12,14 +12,27 @@ from nonebot.log import logger
 from datetime import datetime, timedelta
 import re
 import random
+import time
 from nonebot.exception import FinishedException
-import json
 from nonebot.matcher import Matcher
 from nonebot.params import CommandArg
 
 from .drawing_manager import DrawingManager
 from .services.siliconflow import SiliconFlowService
-from .services.fal import FALService
+from .services.fal import FALService, JobFailed
+from .services.stub import StubDrawingService
+from .content_filter import KeywordMatcher
+from .journal import JobJournal
+from .prompt_classifier import should_skip_optimization
+from utils.dispatcher import dispatcher
+from utils.image_pipeline import ImagePipeline, compose_grid
+from utils.perf import perf
+from utils.process_pool import run_in_pool
+from utils import jsonlib
+from utils.http import get_client
+from utils.shutdown import coordinator
+from utils.state import get_state
+from utils.workers import worker_path
 
 __plugin_meta__ = PluginMetadata(
     name="AI绘图",
@@ -54,10 +67,23 @@ MAX_RETRIES = draw_config.get("max_retries", 3)
 RETRY_DELAY = draw_config.get("retry_delay", 5)
 COOLDOWN = draw_config.get("cooldown", 60)
 TIMEOUT = draw_config.get("timeout", 60)
+MAX_BATCH = draw_config.get("max_batch", 4)
+PROGRESS_UPDATES = draw_config.get("progress_updates", 2)  # 每次绘图最多转发的进度消息数
+PROGRESS_INTERVAL = draw_config.get("progress_interval", 15)  # 两条进度消息的最小间隔(秒)
+
+# 快速预览配置
+preview_config = draw_config.get("preview", {})
+PREVIEW_STEPS = preview_config.get("steps", 4)
+PREVIEW_PARALLEL = preview_config.get("parallel", True)  # 预览与完整图并行生成
 
 # 获取提示词优化配置
 PROMPT_OPTIMIZER_MODEL = draw_config["prompt_optimizer"]["model"]
 PROMPT_TEMPLATE = draw_config["prompt_optimizer"]["template"]
+# 已足够详细的英文提示词跳过优化
+SKIP_ENGLISH = draw_config["prompt_optimizer"].get("skip_english", True)
+SKIP_MIN_WORDS = draw_config["prompt_optimizer"].get("min_words", 8)
+# 提示词优化统计：调用次数、总耗时、跳过次数
+optimizer_stats = {"calls": 0, "total_time": 0.0, "skipped": 0, "raw": 0}
 
 # 获取图片尺寸配置
 IMAGE_SIZES = draw_config["image_sizes"]
@@ -65,14 +91,29 @@ IMAGE_SIZES = draw_config["image_sizes"]
 # 内容过滤配置
 CONTENT_FILTER = draw_config["content_filter"]
 FORBIDDEN_KEYWORDS = draw_config["forbidden_keywords"]
+# 预编译违禁词匹配器
+keyword_matcher = KeywordMatcher(FORBIDDEN_KEYWORDS)
+
+# 出站图片后处理配置
+post_processor = ImagePipeline.from_config(draw_config.get("postprocess", {}))
 
 logger.info(f"画图命令已加载，触发命令为：{DRAW_COMMAND}")
 logger.info(f"可用图片尺寸：{IMAGE_SIZES}")
 
-# 用于存储用户最后一次使用时间
-last_use_time: Dict[int, datetime] = {}
-# 用于控制并发
-drawing_lock = asyncio.Lock()
+# 开关、默认服务、冷却时间和并发槽位保存在状态存储中，多个工作进程共享
+state = get_state()
+SETTINGS = "draw.settings"
+COOLDOWNS = "draw.cooldown"
+# 同时进行的绘图任务数，所有工作进程合计
+MAX_CONCURRENT = draw_config.get("max_concurrent", 1)
+# 槽位超时后自动释放，防止进程崩溃后一直占用
+SLOT_TTL = TIMEOUT * (MAX_RETRIES + 1) + 60
+
+async def is_drawing_enabled() -> bool:
+    return await state.get(SETTINGS, "enabled", drawing_enabled)
+
+async def get_default_service() -> str:
+    return await state.get(SETTINGS, "default_service", draw_config.get("default_service", "siliconflow"))
 
 # 修改尺寸类型映射
 SIZE_TYPE_MAP = {
@@ -133,14 +174,15 @@ draw = on_message(
 )
 
 @draw.handle()
+@coordinator.tracked("draw")
 async def handle_draw(bot: Bot, event: MessageEvent):
-    global drawing_enabled  # 确保使用全局变量
     msg = event.get_plaintext().strip()
+    enabled = await is_drawing_enabled()
     
     # 记录日志
     logger.info(f"收到消息 - 用户ID: {event.user_id}, 群ID: {event.group_id if isinstance(event, GroupMessageEvent) else 'private'}")
     logger.info(f"原始消息: {msg}")
-    logger.info(f"当前绘图功能状态: {'启用' if drawing_enabled else '禁用'}")
+    logger.info(f"当前绘图功能状态: {'启用' if enabled else '禁用'}")
     
     # 处理 /draw 管理命令
     if msg.startswith("/draw"):
@@ -157,14 +199,19 @@ async def handle_draw(bot: Bot, event: MessageEvent):
         try:
             # 没有参数时示帮助信息
             if not cmd_text:
-                status = "开启" if drawing_enabled else "关闭"
+                status = "开启" if enabled else "关闭"
                 help_text = f"""当前绘图功能状态：{status}
 
 可用命令：
 /draw true - 开启绘图功能
 /draw false - 关闭绘图功能
 /draw model - 显示可用模型列表
-/draw model <模型名称> - 切换到指定模型"""
+/draw model <模型名称> - 切换到指定模型
+/draw reload - 重新加载违禁词配置
+/draw status - 查看绘画服务健康状态
+
+服务状态：
+{drawing_manager.health_report()}"""
                 logger.info("发送帮助信息")
                 await bot.send(event=event, message=help_text)
                 return
@@ -174,9 +221,10 @@ async def handle_draw(bot: Bot, event: MessageEvent):
             cmd = args[0].lower()
             
             if cmd in ["true", "false"]:
-                drawing_enabled = (cmd == "true")
-                logger.info(f"绘图功能已{'开启' if drawing_enabled else '关闭'}")
-                await bot.send(event=event, message=f"绘图功能已{'开启' if drawing_enabled else '关闭'}")
+                enabled = (cmd == "true")
+                await state.set(SETTINGS, "enabled", enabled)
+                logger.info(f"绘图功能已{'开启' if enabled else '关闭'}")
+                await bot.send(event=event, message=f"绘图功能已{'开启' if enabled else '关闭'}")
                 
             elif cmd == "model":
                 if len(args) == 1:  # 显示可用模型列表
@@ -184,8 +232,10 @@ async def handle_draw(bot: Bot, event: MessageEvent):
                         "flux1": "Silicon Flow的FLUX.1模型",
                         "flux1.1": "FAL的FLUX 1.1-ultra模型"
                     }
+                    if "stub" in SERVICE_TYPE_MAP:
+                        models["stub"] = "本地模拟服务（压测用）"
                     model_list = "\n".join(f"- {k}: {v}" for k, v in models.items())
-                    current_model = draw_config.get("default_service", "siliconflow")
+                    current_model = await get_default_service()
                     response = (
                         f"当前使用的模型：{current_model}\n\n"
                         f"可用模型列表：\n{model_list}\n\n"
@@ -204,10 +254,28 @@ async def handle_draw(bot: Bot, event: MessageEvent):
                         await bot.send(event=event, message=response)
                         return
                         
-                    old_model = draw_config.get("default_service", "siliconflow")
-                    draw_config["default_service"] = SERVICE_TYPE_MAP[new_model]
+                    old_model = await get_default_service()
+                    await state.set(SETTINGS, "default_service", SERVICE_TYPE_MAP[new_model])
                     logger.info(f"切换模型: {old_model} -> {SERVICE_TYPE_MAP[new_model]}")
                     await bot.send(event=event, message=f"已切换到模型：{new_model}")
+                    
+            elif cmd == "status":
+                current_model = await get_default_service()
+                busy = await state.slot_usage("draw")
+                await bot.send(
+                    event=event,
+                    message=(
+                        f"当前服务：{current_model}\n"
+                        f"进行中的任务：{busy}/{MAX_CONCURRENT}\n\n"
+                        f"服务状态：\n{drawing_manager.health_report()}\n\n"
+                        f"提示词优化：\n{optimizer_report()}"
+                    )
+                )
+                
+            elif cmd == "reload":
+                reload_filter_config()
+                logger.info("违禁词配置已重新加载")
+                await bot.send(event=event, message=f"已重新加载违禁词配置，共 {len(keyword_matcher)} 个违禁词")
             else:
                 logger.warning(f"无效的命令参数: {cmd}")
                 await bot.send(event=event, message="无效的命令参数，请使用 /draw 查看帮助信息")
@@ -219,7 +287,7 @@ async def handle_draw(bot: Bot, event: MessageEvent):
     # 处理绘图命令
     elif msg.startswith(DRAW_COMMAND):
         # 检查功能是否启用
-        if not drawing_enabled:
+        if not enabled:
             logger.info("绘图功能已禁用，拒绝请求")
             await draw.finish("听不见···听不见···")
             return
@@ -229,20 +297,22 @@ async def handle_draw(bot: Bot, event: MessageEvent):
         
         try:
             # 检查冷却时间
-            if user_id in last_use_time:
-                elapsed = datetime.now() - last_use_time[user_id]
-                if elapsed.total_seconds() < COOLDOWN:
-                    await draw.finish(f"绘图功能冷却中，请在{int(COOLDOWN - elapsed.total_seconds())}秒后再试")
-                    return
+            remaining = await state.cooldown_remaining(COOLDOWNS, str(user_id), COOLDOWN)
+            if remaining > 0:
+                await draw.finish(f"绘图功能冷却中，请在{int(remaining)}秒后再试")
+                return
 
             # 检查并发
-            if drawing_lock.locked():
+            if await state.slot_usage("draw") >= MAX_CONCURRENT:
                 await draw.finish("别人在画，你急也没用")
                 return
 
             # 获取原始消息和解析参数
             command_text = msg[len(DRAW_COMMAND):].strip()
-            prompt, args = parse_args(command_text)
+            default_service = await get_default_service()
+            parse_start = time.monotonic()
+            prompt, args = parse_args(command_text, default_service)
+            perf.record("parse", time.monotonic() - parse_start)
             
             logger.info(f"处理画图请求，原始消息：{msg}")
             logger.info(f"解析结果 - 提示词：{prompt}，参数：{args}")
@@ -254,7 +324,10 @@ async def handle_draw(bot: Bot, event: MessageEvent):
                     "参数说明：\n"
                     "-s [横/竖/正] 指定图片方向\n"
                     "-n [步数] 指定生成步数(1-100)\n"
-                    "-m [flux1/flux1.1] 指定模型版本"
+                    "-m [flux1/flux1.1] 指定模型版本\n"
+                    f"-c [数量] 一次生成多张图片(1-{MAX_BATCH})\n"
+                    "-p 先发送快速预览图，再发送完整图\n"
+                    "-raw 不优化提示词，直接使用原文"
                 )
                 return
 
@@ -263,13 +336,38 @@ async def handle_draw(bot: Bot, event: MessageEvent):
                 await draw.finish(random.choice(FILTER_MESSAGES))
                 return
 
-            async with drawing_lock:
+            # 占用绘图槽位，检查之后可能已被其他请求占满
+            slot = await state.acquire_slot("draw", MAX_CONCURRENT, SLOT_TTL)
+            if slot is None:
+                await draw.finish("别人在画，你急也没用")
+                return
+
+            try:
+                preview_task = None
                 try:
                     # 发送开始绘制的提示
                     await draw.send(random.choice(DRAWING_START_MESSAGES))
                     
-                    # 优化提示词
-                    optimized_prompt = await optimize_prompt(prompt)
+                    # 优化提示词，-raw 或已足够详细的英文提示词直接使用
+                    if args["raw"]:
+                        optimizer_stats["raw"] += 1
+                        optimized_prompt = prompt
+                        logger.info("使用 -raw 参数，跳过提示词优化")
+                    elif SKIP_ENGLISH and (skip_result := should_skip_optimization(prompt, SKIP_MIN_WORDS))[0]:
+                        optimizer_stats["skipped"] += 1
+                        optimized_prompt = prompt
+                        logger.info(f"跳过提示词优化：{skip_result[1]}")
+                    else:
+                        optimize_start = time.monotonic()
+                        try:
+                            optimized_prompt = await optimize_prompt(prompt)
+                        except FinishedException:
+                            # 优化失败时已回复用户
+                            perf.incr("prompt_opt.errors")
+                            raise
+                        optimizer_stats["calls"] += 1
+                        optimizer_stats["total_time"] += time.monotonic() - optimize_start
+                        perf.record("prompt_opt", time.monotonic() - optimize_start)
                     
                     # 如果优化后的提示词为空，直接返回（因为optimize_prompt已经发送了提示消息）
                     if not optimized_prompt:
@@ -280,16 +378,66 @@ async def handle_draw(bot: Bot, event: MessageEvent):
                         await draw.finish(random.choice(FILTER_MESSAGES))
                         return
                     
-                    # 使用绘画管理器生成图片
-                    image_data, inference_time = await drawing_manager.generate_image(
-                        args["service"],
-                        optimized_prompt,
-                        args["size"],
-                        args["steps"]
-                    )
+                    # 快速预览：先用极低步数出图发送，再生成完整图
+                    preview_service = drawing_manager.services.get(args["service"])
+                    if (
+                        args["preview"]
+                        and args["count"] == 1
+                        and preview_service is not None
+                        and preview_service.preview_steps is not None
+                        and args["steps"] > preview_service.preview_steps
+                    ):
+                        if PREVIEW_PARALLEL:
+                            preview_task = asyncio.create_task(
+                                send_preview(args["service"], optimized_prompt, args["size"], start_time)
+                            )
+                        else:
+                            await send_preview(args["service"], optimized_prompt, args["size"], start_time)
+                    
+                    # 使用绘画管理器生成图片，排队进度会转发给用户
+                    progress_callback = make_progress_relay()
+                    # 记录请求者和目标会话，重启后可把结果发回原会话
+                    job_context = {
+                        "self_id": bot.self_id,
+                        "user_id": user_id,
+                        "group_id": event.group_id if isinstance(event, GroupMessageEvent) else None,
+                        "prompt": prompt,
+                        "count": args["count"],
+                    }
+                    final_start = time.monotonic()
+                    if args["count"] > 1:
+                        images, inference_time = await drawing_manager.generate_images(
+                            args["service"],
+                            optimized_prompt,
+                            args["size"],
+                            args["steps"],
+                            args["count"],
+                            progress_callback=progress_callback,
+                            job_context=job_context
+                        )
+                        # 多张图片在进程池中拼成一张网格图
+                        image_data = await run_in_pool(compose_grid, images, timeout=TIMEOUT)
+                    else:
+                        image_data, inference_time = await drawing_manager.generate_image(
+                            args["service"],
+                            optimized_prompt,
+                            args["size"],
+                            args["steps"],
+                            progress_callback=progress_callback,
+                            job_context=job_context
+                        )
+                    
+                    perf.record("image_gen", time.monotonic() - final_start)
+                    logger.info(f"完整图生成用时：{time.monotonic() - final_start:.1f}秒")
+                    # 完整图已完成，不再需要尚未发出的预览图
+                    if preview_task is not None and not preview_task.done():
+                        preview_task.cancel()
+                    
+                    # 压缩、转换图片后再发送
+                    image_data = await post_processor.process(image_data)
                     
                     # 更新用户最后使用时间
-                    last_use_time[user_id] = datetime.now()
+                    await state.start_cooldown(COOLDOWNS, str(user_id), COOLDOWN)
                     
                     # 计算总用时
                     total_time = (datetime.now() - start_time).total_seconds()
@@ -298,7 +446,7 @@ async def handle_draw(bot: Bot, event: MessageEvent):
                     msg_text = (
                         f"\n这是你要的：{prompt}\n"  # 使用 f-string
                         f"优化后的提示词：{optimized_prompt}\n"
-                        f"参数：尺寸={args['size']}, 步数={args['steps']}\n"
+                        f"参数：尺寸={args['size']}, 步数={args['steps']}, 数量={args['count']}\n"
                         f"总用时：{total_time:.1f}秒"
                     )
                     
@@ -311,10 +459,15 @@ async def handle_draw(bot: Bot, event: MessageEvent):
                     await draw.finish(msg)
                     
                 except Exception as e:
+                    # 生成失败时不再发送预览图
+                    if preview_task is not None and not preview_task.done():
+                        preview_task.cancel()
                     # 忽略 FinishedException
                     if not isinstance(e, FinishedException):
                         logger.error(f"生成图片过程中发生错误: {e}", exc_info=True)
                         await draw.finish(random.choice(ERROR_MESSAGES))
+            finally:
+                await state.release_slot("draw", slot)
                 
         except Exception as e:
             # 忽略 FinishedException
@@ -322,10 +475,72 @@ async def handle_draw(bot: Bot, event: MessageEvent):
                 logger.error(f"处理绘图请求时发生错误: {e}", exc_info=True)
                 await draw.finish(random.choice(ERROR_MESSAGES))
 
+async def send_preview(service_name: str, prompt: str, size: str, start_time: datetime):
+    """生成并发送低步数预览图，失败时只记录日志"""
+    try:
+        preview_start = time.monotonic()
+        preview_data, _ = await drawing_manager.services[service_name].generate_preview(prompt, size)
+        preview_data = await post_processor.process(preview_data)
+        logger.info(f"预览图生成用时：{time.monotonic() - preview_start:.1f}秒")
+        elapsed = (datetime.now() - start_time).total_seconds()
+        await draw.send(Message([
+            MessageSegment.image(preview_data),
+            MessageSegment.text(f"\n预览图（{elapsed:.1f}秒），完整版马上就好")
+        ]))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"预览图生成失败: {e}")
+
+def optimizer_report() -> str:
+    """提示词优化的调用与跳过统计"""
+    calls = optimizer_stats["calls"]
+    avg_time = optimizer_stats["total_time"] / calls if calls else 0.0
+    skipped = optimizer_stats["skipped"] + optimizer_stats["raw"]
+    total = calls + skipped
+    skip_rate = skipped / total * 100 if total else 0.0
+    return (
+        f"- 调用 {calls} 次，平均 {avg_time:.1f}秒\n"
+        f"- 跳过 {optimizer_stats['skipped']} 次，-raw {optimizer_stats['raw']} 次，跳过率 {skip_rate:.0f}%\n"
+        f"- 预计节省 {skipped * avg_time:.1f}秒"
+    )
+
+async def perf_report() -> str:
+    """/perf 中的绘图部分：槽位占用、提示词优化跳过率和对冲统计"""
+    busy = await state.slot_usage("draw")
+    skipped = optimizer_stats["skipped"] + optimizer_stats["raw"]
+    total = optimizer_stats["calls"] + skipped
+    hedge = drawing_manager.hedge_stats
+    return (
+        f"- 进行中：{busy}/{MAX_CONCURRENT}\n"
+        f"- 提示词优化跳过率：{skipped / total * 100 if total else 0:.0f}%\n"
+        f"- 对冲：发起 {hedge['started']}，备用胜出 {hedge['won']}"
+    )
+
+perf.add_source("绘图", perf_report)
+
+def make_progress_relay():
+    """创建进度转发回调，限制每次绘图转发的进度消息数量和频率"""
+    sent = 0
+    last_sent = 0.0
+
+    async def relay(text: str):
+        nonlocal sent, last_sent
+        now = time.monotonic()
+        if sent >= PROGRESS_UPDATES or (sent and now - last_sent < PROGRESS_INTERVAL):
+            return
+        sent += 1
+        last_sent = now
+        await draw.send(f"冰冰{text}...")
+
+    return relay
+
 # 添加提示词优化函数
 async def optimize_prompt(prompt: str, max_retries: int = 3) -> str:
     """优化提示词，失败时重试"""
     for retry_count in range(max_retries):
+        if retry_count:
+            perf.incr("prompt_opt.retries")
         try:
             headers = {
                 "Authorization": f"Bearer {config['oai']['api_key']}",
@@ -343,79 +558,79 @@ async def optimize_prompt(prompt: str, max_retries: int = 3) -> str:
             logger.info(f"开始优化提示词 (第{retry_count + 1}次尝试): {prompt}")
             
             try:
-                async with httpx.AsyncClient() as client:
-                    async def request():
-                        response = await client.post(
-                            f"{config['oai']['api_base']}/v1/chat/completions",
-                            headers=headers,
-                            json={
-                                "model": PROMPT_OPTIMIZER_MODEL,
-                                "messages": messages,
-                                "temperature": 0.7,
-                                "max_tokens": 200
-                            },
-                            timeout=30.0
-                        )
-                        return response
+                client = get_client()
+                async def request():
+                    response = await client.post(
+                        f"{config['oai']['api_base']}/v1/chat/completions",
+                        headers=headers,
+                        content=jsonlib.dumpb({
+                            "model": PROMPT_OPTIMIZER_MODEL,
+                            "messages": messages,
+                            "temperature": 0.7,
+                            "max_tokens": 200
+                        }),
+                        timeout=30.0
+                    )
+                    return response
 
-                    # 添加30秒超时
-                    response = await asyncio.wait_for(request(), timeout=30.0)
+                # 添加30秒超时
+                response = await asyncio.wait_for(request(), timeout=30.0)
+                
+                if response.status_code != 200:
+                    logger.error(f"提示词优化失败，状态码：{response.status_code}")
+                    if retry_count == max_retries - 1:
+                        await draw.finish(random.choice([
+                            "你是不是画了上面不该画的？",
+                            "中间层崩了~~",
+                            "这个内容不太合适呢",
+                            "换个别的画吧~"
+                        ]))
+                        return ""
+                    continue
                     
-                    if response.status_code != 200:
-                        logger.error(f"提示词优化失败，状态码：{response.status_code}")
-                        if retry_count == max_retries - 1:
-                            await draw.finish(random.choice([
-                                "你是不是画了上面不该画的？",
-                                "中间层崩了~~",
-                                "这个内容不太合适呢",
-                                "换个别的画吧~"
-                            ]))
-                            return ""
+                result = jsonlib.response_json(response)
+                optimized_prompt = result["choices"][0]["message"]["content"].strip()
+                
+                # 如果优化后的提示词为空，尝试重试
+                if not optimized_prompt:
+                    if retry_count < max_retries - 1:
+                        logger.warning(f"提示词优化返回空，进行第{retry_count + 2}次尝试")
+                        await asyncio.sleep(1)  # 等待1秒后重试
                         continue
-                        
-                    result = response.json()
-                    optimized_prompt = result["choices"][0]["message"]["content"].strip()
-                    
-                    # 如果优化后的提示词为空，尝试重试
-                    if not optimized_prompt:
-                        if retry_count < max_retries - 1:
-                            logger.warning(f"提示词优化返回空，进行第{retry_count + 2}次尝试")
-                            await asyncio.sleep(1)  # 等待1秒后重试
-                            continue
-                        else:
-                            await draw.finish(random.choice([
-                                "你是不是画了上面不该画的？",
-                                "中间层崩了~~",
-                                "这个内容不太合适呢",
-                                "换个别的画吧~"
-                            ]))
-                            return ""
-                    
-                    # 清理优化后的提示词
-                    optimized_prompt = optimized_prompt.replace("\n", " ").strip()
-                    optimized_prompt = re.sub(r'^(?:Input:|Output:)\s*', '', optimized_prompt)
-                    optimized_prompt = re.sub(r'\s*(?:Input:|Output:)\s*', '', optimized_prompt)
-                    
-                    logger.info(f"原始提示词: {prompt}")
-                    logger.info(f"优化后提示词: {optimized_prompt}")
-                    
-                    # 如果清理后的提示词为空，尝试重试
-                    if not optimized_prompt:
-                        if retry_count < max_retries - 1:
-                            logger.warning(f"清理后提示词为空，进行第{retry_count + 2}次尝试")
-                            await asyncio.sleep(1)
-                            continue
-                        else:
-                            await draw.finish(random.choice([
-                                "你是不是画了上面不该画的？",
-                                "中间层崩了~~",
-                                "这个内容不太合适呢",
-                                "换个别的画吧~"
-                            ]))
-                            return ""
-                    
-                    return optimized_prompt
-                    
+                    else:
+                        await draw.finish(random.choice([
+                            "你是不是画了上面不该画的？",
+                            "中间层崩了~~",
+                            "这个内容不太合适呢",
+                            "换个别的画吧~"
+                        ]))
+                        return ""
+                
+                # 清理优化后的提示词
+                optimized_prompt = optimized_prompt.replace("\n", " ").strip()
+                optimized_prompt = re.sub(r'^(?:Input:|Output:)\s*', '', optimized_prompt)
+                optimized_prompt = re.sub(r'\s*(?:Input:|Output:)\s*', '', optimized_prompt)
+                
+                logger.info(f"原始提示词: {prompt}")
+                logger.info(f"优化后提示词: {optimized_prompt}")
+                
+                # 如果清理后的提示词为空，尝试重试
+                if not optimized_prompt:
+                    if retry_count < max_retries - 1:
+                        logger.warning(f"清理后提示词为空，进行第{retry_count + 2}次尝试")
+                        await asyncio.sleep(1)
+                        continue
+                    else:
+                        await draw.finish(random.choice([
+                            "你是不是画了上面不该画的？",
+                            "中间层崩了~~",
+                            "这个内容不太合适呢",
+                            "换个别的画吧~"
+                        ]))
+                        return ""
+                
+                return optimized_prompt
+                
             except asyncio.TimeoutError:
                 logger.error(f"提示词优化超时 (第{retry_count + 1}次尝试)")
                 if retry_count == max_retries - 1:
@@ -444,16 +659,19 @@ async def optimize_prompt(prompt: str, max_retries: int = 3) -> str:
             
     return ""  # 所有重试都失败后返回空字符串
 
-def parse_args(text: str) -> Tuple[str, dict]:
-    """解析命令参数"""
+def parse_args(text: str, default_service: Optional[str] = None) -> Tuple[str, dict]:
+    """解析命令参数，未指定 -m 时使用 default_service（默认取配置文件中的值）"""
     # 初始化默认值
     args = {
         "size": IMAGE_SIZE,
         "steps": NUM_INFERENCE_STEPS,
-        "service": draw_config.get("default_service", "siliconflow")  # 从配置读取默认服务
+        "service": default_service or draw_config.get("default_service", "siliconflow"),
+        "count": 1,
+        "preview": False,
+        "raw": False
     }
     
-    pattern = r'^(.*?)(?:\s+-[snm]\s+\S+)*$'
+    pattern = r'^(.*?)(?:\s+-[snmc]\s+\S+|\s+-p|\s+-raw)*$'
     match = re.match(pattern, text.strip())
     
     if not match:
@@ -465,6 +683,9 @@ def parse_args(text: str) -> Tuple[str, dict]:
     size_match = re.search(r'-s\s+(\S+)', text)
     steps_match = re.search(r'-n\s+(\d+)', text)
     model_match = re.search(r'-m\s+(\S+)', text)  # 新增模型参数
+    count_match = re.search(r'-c\s+(\d+)', text)  # 生成数量参数
+    preview_match = re.search(r'(?:^|\s)-p(?=\s|$)', text)  # 快速预览开关
+    raw_match = re.search(r'(?:^|\s)-raw(?=\s|$)', text)  # 跳过提示词优化
     
     # 处理尺寸参数
     if size_match:
@@ -490,6 +711,19 @@ def parse_args(text: str) -> Tuple[str, dict]:
             args["service"] = SERVICE_TYPE_MAP[model_type]
             logger.info(f"使用模型：{args['service']}")
             
+    # 处理数量参数
+    if count_match:
+        count = int(count_match.group(1))
+        if 1 <= count <= MAX_BATCH:
+            args["count"] = count
+            logger.info(f"生成数量：{count}")
+            
+    if preview_match:
+        args["preview"] = True
+        
+    if raw_match:
+        args["raw"] = True
+            
     return prompt, args
 
 def retry_on_error(max_retries: int = None, retry_delay: int = None):
@@ -517,12 +751,23 @@ def check_content(prompt: str) -> bool:
     if not CONTENT_FILTER:
         return True
         
-    for keyword in FORBIDDEN_KEYWORDS:
-        if keyword.lower() in prompt.lower():
-            logger.warning(f"检测到违禁词: {keyword}")
-            return False
+    start = time.monotonic()
+    keyword = keyword_matcher.search(prompt)
+    perf.record("filter", time.monotonic() - start)
+    if keyword is not None:
+        logger.warning(f"检测到违禁词: {keyword}")
+        return False
     return True
 
+def reload_filter_config():
+    """重新读取配置文件中的违禁词并重建匹配器"""
+    global CONTENT_FILTER, FORBIDDEN_KEYWORDS, keyword_matcher
+    with open(config_file, "rb") as f:
+        new_draw_config = tomli.load(f)["draw"]
+    CONTENT_FILTER = new_draw_config["content_filter"]
+    FORBIDDEN_KEYWORDS = new_draw_config["forbidden_keywords"]
+    keyword_matcher = KeywordMatcher(FORBIDDEN_KEYWORDS)
+
 # 初始化绘画管理器
 drawing_manager = DrawingManager()
 
@@ -533,10 +778,18 @@ silicon_flow = SiliconFlowService(
     model=draw_config.get("model", "black-forest-labs/FLUX.1-dev"),
     timeout=TIMEOUT,
     max_retries=MAX_RETRIES,
-    retry_delay=RETRY_DELAY
+    retry_delay=RETRY_DELAY,
+    preview_steps=PREVIEW_STEPS
 )
 drawing_manager.register_service("siliconflow", silicon_flow)
 
+# 进行中任务日志，重启后恢复 FAL 任务
+journal_config = draw_config.get("journal", {})
+job_journal = JobJournal(
+    worker_path(journal_config.get("path", "data/draw_jobs.json")),
+    ttl=journal_config.get("ttl", 3600)
+) if journal_config.get("enable", True) else None
+
 fal_service = FALService(
     api_key=draw_config["fal"]["api_key"],
     model=draw_config["fal"]["model"],
@@ -547,6 +800,78 @@ fal_service = FALService(
     aspect_ratios=draw_config["fal"]["aspect_ratios"],
     timeout=TIMEOUT,
     max_retries=MAX_RETRIES,
-    retry_delay=RETRY_DELAY
+    retry_delay=RETRY_DELAY,
+    progress_interval=PROGRESS_INTERVAL,
+    journal=job_journal
 )
-drawing_manager.register_service("fal", fal_service)
\ No newline at end of file
+drawing_manager.register_service("fal", fal_service)
+
+# 本地模拟服务，用于压测，默认不注册
+stub_config = draw_config.get("stub", {})
+if stub_config.get("enable", False):
+    stub_service = StubDrawingService(
+        latency=stub_config.get("latency", "fixed"),
+        latency_mean=stub_config.get("latency_mean", 1.0),
+        latency_jitter=stub_config.get("latency_jitter", 0.5),
+        failure_rate=stub_config.get("failure_rate", 0.0),
+        seed=stub_config.get("seed"),
+        preview_steps=PREVIEW_STEPS
+    )
+    drawing_manager.register_service("stub", stub_service, fallback=False)
+    SERVICE_TYPE_MAP["stub"] = "stub"
+    logger.info("已注册本地模拟绘画服务 stub")
+
+# 对冲配置：主服务过慢时同时请求备用服务
+drawing_manager.configure_hedging(draw_config.get("hedge", {}))
+# 熔断配置：服务连续失败时自动降级到其他服务
+drawing_manager.configure_health(draw_config.get("health", {}))
+
+driver = get_driver()
+# 退出时等待进行中的绘图完成
+coordinator.install()
+dispatcher.install()
+
+@driver.on_bot_connect
+async def resume_pending_jobs(bot: Bot):
+    """机器人连接后恢复上次未完成的 FAL 任务，并把结果发回原会话
+
+    每次重连都会触发，只恢复启动时从任务日志读入且尚未恢复的任务，运行中提交的任务仍由原协程处理。
+    """
+    if job_journal is None:
+        return
+    for entry in job_journal.take_restored(bot.self_id):
+        asyncio.create_task(resume_job(bot, entry))
+
+@coordinator.tracked("draw")
+async def resume_job(bot: Bot, entry: dict):
+    request_id = entry["request_id"]
+    logger.info(f"恢复绘图任务: {request_id}")
+    try:
+        images = await asyncio.wait_for(
+            fal_service.resume(request_id, entry.get("model")),
+            timeout=TIMEOUT
+        )
+        if len(images) > 1:
+            image_data = await run_in_pool(compose_grid, images, timeout=TIMEOUT)
+        else:
+            image_data = images[0]
+        image_data = await post_processor.process(image_data)
+        message = Message([
+            MessageSegment.image(image_data),
+            MessageSegment.text(f"\n冰冰刚才重启了，这是你之前要的：{entry.get('prompt', '')}")
+        ])
+        if entry.get("group_id"):
+            message.insert(0, MessageSegment.at(entry["user_id"]))
+            await bot.send_group_msg(group_id=entry["group_id"], message=message)
+        else:
+            await bot.send_private_msg(user_id=entry["user_id"], message=message)
+        logger.info(f"已投递恢复的绘图任务: {request_id}")
+    except JobFailed as e:
+        logger.error(f"恢复的绘图任务 {request_id} 已在远端失败: {e}")
+    except Exception as e:
+        # 网络错误、超时或发送失败时保留任务日志，下次连接或重启后再试
+        logger.error(f"恢复绘图任务 {request_id} 失败，稍后重试: {e}")
+        job_journal.restored.add(request_id)
+        return
+    # 只有投递成功或远端明确失败时才删除；关机取消时保留，重启后继续恢复
+    job_journal.remove(request_id)
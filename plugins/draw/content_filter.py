@@ -0,0 +1,70 @@
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+
+def normalize_text(text: str) -> str:
+    """统一全角/半角并忽略大小写"""
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+class KeywordMatcher:
+    """基于 Aho-Corasick 自动机的多关键词匹配器，扫描耗时只与文本长度相关"""
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = []
+        # 每个状态的转移表、失配指针和命中的关键词下标
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Optional[int]] = [None]
+
+        for keyword in keywords:
+            pattern = normalize_text(str(keyword).strip())
+            if not pattern:
+                continue
+            self._add(pattern, len(self.keywords))
+            self.keywords.append(keyword)
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def _add(self, pattern: str, index: int) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+            state = next_state
+        if self._output[state] is None:
+            self._output[state] = index
+
+    def _build(self) -> None:
+        """广度优先计算失配指针，并把后缀状态的命中结果合并进来"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                if self._output[next_state] is None:
+                    self._output[next_state] = self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> Optional[str]:
+        """返回文本中第一个命中的关键词，没有命中返回 None"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in normalize_text(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state] is not None:
+                return self.keywords[output[state]]
+        return None
@@ -1,16 +1,134 @@
-from typing import Dict, Optional
-from .services.base import DrawingService
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+from .services.base import DrawingService, SUPERSEDED
 from .services.siliconflow import SiliconFlowService
+from .health import CircuitOpen, ServiceHealth
 from nonebot.log import logger
 
+from utils.perf import perf
+
 class DrawingManager:
     def __init__(self):
         self.services: Dict[str, DrawingService] = {}
-        
-    def register_service(self, name: str, service: DrawingService):
-        """注册绘画服务"""
+        # 每个服务最近成功请求的耗时，用于计算对冲阈值
+        self.latencies: Dict[str, Deque[float]] = {}
+        # 对冲（同时请求备用服务）配置，默认关闭
+        self.hedge_enabled = False
+        self.hedge_percentile = 0.9
+        self.hedge_min_samples = 5
+        self.hedge_min_delay = 5.0
+        self.hedge_budget = 0.0
+        self.service_costs: Dict[str, float] = {}
+        self.latency_window = 50
+        self.hedge_stats = {"started": 0, "won": 0, "skipped_budget": 0}
+        # 服务健康状态与熔断配置
+        self.health: Dict[str, ServiceHealth] = {}
+        # 不参与降级和对冲的服务
+        self.no_fallback: set[str] = set()
+        self.fallback_enabled = True
+        self.failure_threshold = 3
+        self.breaker_cooldown = 120.0
+
+    def register_service(self, name: str, service: DrawingService, fallback: bool = True):
+        """注册绘画服务，注册顺序即自动降级时的尝试顺序；fallback 为 False 时只在被指定时使用"""
         self.services[name] = service
-        
+        if not fallback:
+            self.no_fallback.add(name)
+        self.latencies[name] = deque(maxlen=self.latency_window)
+        self.health[name] = ServiceHealth(self.failure_threshold, self.breaker_cooldown)
+
+    def configure_health(self, config: Optional[dict]):
+        """从 [draw.health] 配置段设置熔断与降级参数"""
+        config = config or {}
+        self.fallback_enabled = config.get("fallback", True)
+        self.failure_threshold = int(config.get("failure_threshold", 3))
+        self.breaker_cooldown = float(config.get("cooldown", 120))
+        for health in self.health.values():
+            health.failure_threshold = self.failure_threshold
+            health.cooldown = self.breaker_cooldown
+
+    def health_report(self) -> str:
+        """生成各服务健康状态文本"""
+        return "\n".join(f"- {name}: {health.describe()}" for name, health in self.health.items())
+
+    def _candidates(self, service_name: str) -> list[str]:
+        """返回本次请求依次尝试的服务，熔断中的服务会被跳过"""
+        if service_name not in self.services:
+            logger.error(f"未找到服务: {service_name}")
+            raise ValueError(f"未知的服务: {service_name}")
+        if not self.fallback_enabled:
+            return [service_name]
+        ordered = [service_name] + [
+            name for name in self.services
+            if name != service_name and name not in self.no_fallback
+        ]
+        candidates = [name for name in ordered if self.health[name].available()]
+        if not candidates:
+            raise RuntimeError("所有绘画服务均处于熔断状态")
+        if candidates[0] != service_name:
+            logger.warning(f"服务 {service_name} 熔断中，改用 {candidates[0]}")
+        return candidates
+
+    def _record_failure(self, service_name: str):
+        if self.health[service_name].record_failure():
+            logger.warning(f"服务 {service_name} 连续失败 {self.health[service_name].consecutive_failures} 次，已熔断")
+
+    def configure_hedging(self, config: Optional[dict]):
+        """从 [draw.hedge] 配置段设置对冲参数"""
+        config = config or {}
+        self.hedge_enabled = config.get("enable", False)
+        self.hedge_percentile = float(config.get("percentile", 0.9))
+        self.hedge_min_samples = int(config.get("min_samples", 5))
+        self.hedge_min_delay = float(config.get("min_delay", 5))
+        self.hedge_budget = float(config.get("budget", 0))
+        self.service_costs = {k: float(v) for k, v in config.get("costs", {}).items()}
+        self.latency_window = int(config.get("window", 50))
+        for name, samples in self.latencies.items():
+            self.latencies[name] = deque(samples, maxlen=self.latency_window)
+
+    def latency_percentile(self, service_name: str, percentile: float) -> Optional[float]:
+        """返回服务最近耗时的分位数，样本不足时返回 None"""
+        samples = self.latencies.get(service_name)
+        if not samples or len(samples) < self.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(percentile * len(ordered)))
+        return ordered[index]
+
+    def _pick_backup(self, service_name: str) -> Optional[str]:
+        """选择预算允许的备用服务"""
+        primary_cost = self.service_costs.get(service_name, 1.0)
+        for name in self.services:
+            if name == service_name or name in self.no_fallback or not self.health[name].available():
+                continue
+            if primary_cost + self.service_costs.get(name, 1.0) <= self.hedge_budget:
+                return name
+        return None
+
+    async def _generate(self, service_name: str, prompt: str, size: str, steps: int, **kwargs) -> tuple[bytes, float]:
+        """调用单个服务并记录耗时"""
+        service = self.services[service_name]
+        health = self.health[service_name]
+        # 候选列表生成后状态可能已变化，熔断恢复期只有一个请求能成为试探请求
+        if not health.acquire():
+            raise CircuitOpen(f"服务 {service_name} 熔断中")
+        start = time.monotonic()
+        try:
+            result = await service.generate_image(prompt, size, steps, **kwargs)
+        except asyncio.CancelledError:
+            health.release()
+            raise
+        except Exception as e:
+            logger.error(f"服务 {service_name} 生成图片失败: {str(e)}", exc_info=True)
+            self._record_failure(service_name)
+            raise
+        latency = time.monotonic() - start
+        self.latencies[service_name].append(latency)
+        self.health[service_name].record_success(latency)
+        return result
+
     async def generate_image(
         self,
         service_name: str,
@@ -19,15 +137,103 @@ class DrawingManager:
         steps: int,
         **kwargs
     ) -> tuple[bytes, float]:
-        """使用指定服务生成图片"""
-        if service_name not in self.services:
-            logger.error(f"未找到服务: {service_name}")
-            raise ValueError(f"未知的服务: {service_name}")
-            
-        service = self.services[service_name]
+        """使用指定服务生成图片，失败或熔断时按注册顺序降级到其他服务"""
+        error: Optional[Exception] = None
+        for index, name in enumerate(self._candidates(service_name)):
+            if index:
+                perf.incr("image_gen.retries")
+            try:
+                return await self._generate_hedged(name, prompt, size, steps, **kwargs)
+            except Exception as e:
+                error = e
+                logger.warning(f"服务 {name} 生成失败，尝试下一个服务")
+        perf.incr("image_gen.errors")
+        raise error
+
+    async def _generate_hedged(
+        self,
+        service_name: str,
+        prompt: str,
+        size: str,
+        steps: int,
+        **kwargs
+    ) -> tuple[bytes, float]:
+        """开启对冲时，慢请求会同时交给备用服务"""
+        if not self.hedge_enabled or len(self.services) < 2:
+            return await self._generate(service_name, prompt, size, steps, **kwargs)
+
+        threshold = self.latency_percentile(service_name, self.hedge_percentile)
+        delay = max(self.hedge_min_delay, threshold or 0.0)
+        primary = asyncio.create_task(self._generate(service_name, prompt, size, steps, **kwargs))
+        tasks = {primary: service_name}
         try:
-            result = await service.generate_image(prompt, size, steps, **kwargs)
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or threshold is None:
+                # 已完成，或样本不足无法判断是否过慢
+                return await primary
+
+            backup_name = self._pick_backup(service_name)
+            if backup_name is None:
+                self.hedge_stats["skipped_budget"] += 1
+                return await primary
+
+            logger.info(f"服务 {service_name} 超过 {delay:.1f} 秒未完成，同时请求备用服务 {backup_name}")
+            self.hedge_stats["started"] += 1
+            backup = asyncio.create_task(self._generate(backup_name, prompt, size, steps, **kwargs))
+            tasks[backup] = backup_name
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.hedge_stats["won"] += 1
+                        logger.info(f"对冲请求由 {tasks[task]} 先完成")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # 取消仍在运行的请求
+            for task in tasks:
+                if not task.done():
+                    task.cancel(SUPERSEDED)
+
+    async def generate_images(
+        self,
+        service_name: str,
+        prompt: str,
+        size: str,
+        steps: int,
+        count: int,
+        **kwargs
+    ) -> tuple[list[bytes], float]:
+        """使用指定服务一次生成多张图片"""
+        if count <= 1:
+            image, inference_time = await self.generate_image(service_name, prompt, size, steps, **kwargs)
+            return [image], inference_time
+
+        error: Optional[Exception] = None
+        for index, name in enumerate(self._candidates(service_name)):
+            if index:
+                perf.incr("image_gen.retries")
+            service = self.services[name]
+            if not self.health[name].acquire():
+                error = CircuitOpen(f"服务 {name} 熔断中")
+                continue
+            try:
+                result = await service.generate_images(prompt, size, steps, count, **kwargs)
+            except asyncio.CancelledError:
+                self.health[name].release()
+                raise
+            except Exception as e:
+                logger.error(f"服务 {name} 批量生成图片失败: {str(e)}", exc_info=True)
+                self._record_failure(name)
+                error = e
+                continue
+            # 批量请求耗时不计入单张图片的耗时统计
+            self.health[name].record_success()
             return result
-        except Exception as e:
-            logger.error(f"服务 {service_name} 生成图片失败: {str(e)}", exc_info=True)
-            raise 
\ No newline at end of file
+        perf.incr("image_gen.errors")
+        raise error
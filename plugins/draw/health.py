@@ -0,0 +1,103 @@
+import time
+from typing import Optional
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_NAMES = {
+    CLOSED: "正常",
+    OPEN: "熔断",
+    HALF_OPEN: "试探",
+}
+
+
+class CircuitOpen(RuntimeError):
+    """服务熔断中，或已有试探请求在进行"""
+
+
+class ServiceHealth:
+    """记录单个绘画服务的成功率、EWMA 耗时和连续失败次数，并提供熔断判断
+
+    熔断冷却结束后只放行一个试探请求，其余请求在试探结束前仍按熔断处理；
+    试探成功后恢复正常，失败则重新熔断。
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 120, alpha: float = 0.3):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ewma_latency: Optional[float] = None
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+
+    @property
+    def success_rate(self) -> Optional[float]:
+        total = self.successes + self.failures
+        return self.successes / total if total else None
+
+    def available(self) -> bool:
+        """是否可以接受请求，只做判断不改变状态；实际调用前需通过 acquire() 占用"""
+        if self.state == CLOSED:
+            return True
+        if self.probing:
+            return False
+        return self.state == HALF_OPEN or time.monotonic() - self.opened_at >= self.cooldown
+
+    def acquire(self) -> bool:
+        """调用服务前占用：正常时总是成功，熔断冷却结束后只有第一个请求成为试探请求"""
+        if not self.available():
+            return False
+        if self.state != CLOSED:
+            self.state = HALF_OPEN
+            self.probing = True
+        return True
+
+    def release(self) -> None:
+        """调用被取消、没有结果时释放试探名额，下一个请求继续试探"""
+        self.probing = False
+
+    def record_success(self, latency: Optional[float] = None) -> None:
+        """记录成功，latency 为空时不更新平均耗时"""
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.probing = False
+        if latency is None:
+            return
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency = self.alpha * latency + (1 - self.alpha) * self.ewma_latency
+
+    def record_failure(self) -> bool:
+        """记录失败，返回本次是否触发熔断"""
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.probing = False
+        if self.state == HALF_OPEN or (
+            self.state == CLOSED and self.consecutive_failures >= self.failure_threshold
+        ):
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def describe(self) -> str:
+        rate = f"{self.success_rate * 100:.0f}%" if self.success_rate is not None else "-"
+        latency = f"{self.ewma_latency:.1f}秒" if self.ewma_latency is not None else "-"
+        text = (
+            f"{STATE_NAMES[self.state]}，成功率 {rate} ({self.successes}/{self.successes + self.failures})，"
+            f"平均耗时 {latency}，连续失败 {self.consecutive_failures}"
+        )
+        if self.probing:
+            text += "，试探请求进行中"
+        elif self.state == OPEN:
+            remaining = max(0, self.cooldown - (time.monotonic() - self.opened_at))
+            text += f"，{remaining:.0f}秒后重试"
+        return text
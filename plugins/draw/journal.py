@@ -0,0 +1,70 @@
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Set
+
+from nonebot.log import logger
+
+from utils import jsonlib
+
+
+class JobJournal:
+    """记录进行中的绘图任务，重启后据此恢复轮询并投递结果"""
+
+    def __init__(self, path: str, ttl: float = 3600):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.entries: Dict[str, dict] = {}
+        # 启动时从磁盘读入、尚未恢复的任务；运行中新增的任务由提交它的协程自己轮询
+        self.restored: Set[str] = set()
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "rb") as f:
+                self.entries = {entry["request_id"]: entry for entry in jsonlib.loads(f.read())}
+            self.restored = set(self.entries)
+        except Exception as e:
+            logger.error(f"读取绘图任务日志失败: {e}")
+            self.entries = {}
+
+    def _save(self) -> None:
+        """先写临时文件再替换，避免写到一半时崩溃损坏日志"""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(jsonlib.dumpb(list(self.entries.values())))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"写入绘图任务日志失败: {e}")
+
+    def add(self, request_id: str, **fields) -> None:
+        self.entries[request_id] = {"request_id": request_id, "created_at": time.time(), **fields}
+        self._save()
+
+    def remove(self, request_id: str) -> None:
+        if self.entries.pop(request_id, None) is not None:
+            self._save()
+
+    def pending(self) -> List[dict]:
+        """返回所有未过期的任务，过期任务直接丢弃"""
+        now = time.time()
+        pending = [entry for entry in self.entries.values() if now - entry["created_at"] <= self.ttl]
+        expired = len(self.entries) - len(pending)
+        if expired:
+            logger.info(f"丢弃 {expired} 个过期的绘图任务")
+            self.entries = {entry["request_id"]: entry for entry in pending}
+            self._save()
+        return pending
+
+    def take_restored(self, self_id: str) -> List[dict]:
+        """取出启动时读入的、属于该机器人的未过期任务，每个任务只取出一次，重连时不会重复恢复"""
+        entries = [
+            entry for entry in self.pending()
+            if entry["request_id"] in self.restored and entry.get("self_id") == self_id
+        ]
+        self.restored.difference_update(entry["request_id"] for entry in entries)
+        return entries
@@ -0,0 +1,31 @@
+import re
+from typing import Tuple
+
+# 中日韩文字及全角字符，出现时需要交给优化器翻译
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z'-]*")
+
+
+def classify_prompt(prompt: str) -> dict:
+    """统计提示词的语言构成和丰富程度"""
+    cjk_chars = len(CJK_PATTERN.findall(prompt))
+    words = WORD_PATTERN.findall(prompt)
+    # 逗号分隔的描述片段数量，常见于详细的英文提示词
+    phrases = [part for part in re.split(r"[,，;；]", prompt) if part.strip()]
+    return {
+        "cjk_chars": cjk_chars,
+        "words": len(words),
+        "phrases": len(phrases),
+    }
+
+
+def should_skip_optimization(prompt: str, min_words: int = 8) -> Tuple[bool, str]:
+    """判断提示词是否已经是足够详细的英文，无需再调用 LLM 优化"""
+    info = classify_prompt(prompt)
+    if info["cjk_chars"]:
+        return False, "包含中日韩文字"
+    if info["words"] >= min_words:
+        return True, f"英文提示词已足够详细({info['words']}词)"
+    if info["words"] >= min_words // 2 and info["phrases"] >= 3:
+        return True, f"英文提示词包含{info['phrases']}个描述片段"
+    return False, "提示词过短"
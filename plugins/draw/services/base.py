@@ -1,10 +1,20 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+import asyncio
+from typing import Dict, Any, Optional, Callable, Awaitable
 from pathlib import Path
 
+# 进度回调：接收一条进度描述文本，如排队位置、生成中、预计剩余时间
+ProgressCallback = Callable[[str], Awaitable[None]]
+
+# 对冲落败等被主动放弃的任务取消时使用的消息，用于区分关机等其他取消原因
+SUPERSEDED = "superseded"
+
 class DrawingService(ABC):
     """绘画服务基类"""
     
+    # 快速预览使用的步数，为 None 表示服务不支持预览
+    preview_steps: Optional[int] = None
+    
     @abstractmethod
     async def generate_image(
         self,
@@ -20,9 +30,37 @@ class DrawingService(ABC):
             prompt (str): 提示词
             size (str): 图片尺寸
             steps (int): 生成步数
-            **kwargs: 其他参数
+            **kwargs: 其他参数，可包含 progress_callback (ProgressCallback)，
+                支持进度查询的服务会通过它推送节流后的进度；
+                以及 job_context (dict)，记录请求者和目标会话，供任务日志恢复使用
             
         Returns:
             tuple[bytes, float]: (图片数据, 生成用时)
         """
-        pass 
\ No newline at end of file
+        pass
+        
+    async def generate_images(
+        self,
+        prompt: str,
+        size: str,
+        steps: int,
+        count: int,
+        **kwargs
+    ) -> tuple[list[bytes], float]:
+        """
+        一次生成多张图片，默认并发调用 generate_image，支持批量接口的服务可覆盖
+        
+        Returns:
+            tuple[list[bytes], float]: (图片数据列表, 最长生成用时)
+        """
+        results = await asyncio.gather(*(
+            self.generate_image(prompt, size, steps, **kwargs)
+            for _ in range(count)
+        ))
+        return [image for image, _ in results], max(cost for _, cost in results)
+        
+    async def generate_preview(self, prompt: str, size: str, **kwargs) -> tuple[bytes, float]:
+        """以极低步数快速生成预览图，仅在 preview_steps 不为 None 时可用"""
+        if self.preview_steps is None:
+            raise NotImplementedError("该服务不支持预览")
+        return await self.generate_image(prompt, size, self.preview_steps, **kwargs)
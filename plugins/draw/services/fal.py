@@ -1,9 +1,19 @@
-from .base import DrawingService
+from .base import DrawingService, ProgressCallback, SUPERSEDED
+from ..journal import JobJournal
 import fal_client
+from fal_client.client import FalClientError
+import httpx
+import time
 import base64
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, Optional
 import os
 from nonebot.log import logger
+from utils.http import get_client
+
+class JobFailed(Exception):
+    """远端明确返回失败的任务，重试也不会成功"""
+
 
 class FALService(DrawingService):
     def __init__(
@@ -17,7 +27,10 @@ class FALService(DrawingService):
         aspect_ratios: Dict[str, str] = None,
         timeout: int = 60,
         max_retries: int = 3,
-        retry_delay: int = 5
+        retry_delay: int = 5,
+        progress_interval: float = 5,
+        poll_interval: float = 1,
+        journal: Optional[JobJournal] = None
     ):
         self.model = model
         self.enable_safety_checker = enable_safety_checker
@@ -32,6 +45,11 @@ class FALService(DrawingService):
         self.timeout = timeout
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.progress_interval = progress_interval
+        self.poll_interval = poll_interval
+        self.journal = journal
+        # 最近请求的平均总耗时，用于估算剩余时间
+        self.avg_duration: Optional[float] = None
         # 设置 FAL API key
         os.environ["FAL_KEY"] = api_key
         
@@ -56,6 +74,18 @@ class FALService(DrawingService):
         **kwargs
     ) -> tuple[bytes, float]:
         """调用 FAL API 生成图片"""
+        images, inference_time = await self.generate_images(prompt, size, steps, 1, **kwargs)
+        return images[0], inference_time
+        
+    async def generate_images(
+        self,
+        prompt: str,
+        size: str,
+        steps: int,
+        count: int,
+        **kwargs
+    ) -> tuple[list[bytes], float]:
+        """调用 FAL API 生成图片，多张图片通过 num_images 一次请求"""
         try:
             # 准备参数
             arguments = {
@@ -66,46 +96,127 @@ class FALService(DrawingService):
                 "aspect_ratio": self._get_aspect_ratio(size),
                 "sync_mode": self.sync_mode
             }
+            if count > 1:
+                arguments["num_images"] = count
             
             logger.info(f"调用 FAL API，模型：{self.model}")
             logger.info(f"参数：{arguments}")
             
-            # 提交请求
-            result = fal_client.submit(
+            # 提交请求（使用异步客户端，避免阻塞事件循环，也便于取消）
+            handle = await fal_client.submit_async(
                 self.model,
                 arguments=arguments
             )
             
-            request_id = result.request_id
+            request_id = handle.request_id
             logger.info(f"FAL 请求 ID: {request_id}")
             
+            # 记录到任务日志，重启后可恢复
+            job_context = kwargs.get("job_context")
+            if self.journal is not None and job_context:
+                self.journal.add(request_id, model=self.model, **job_context)
+            
             # 获取结果
-            result = fal_client.result(self.model, request_id)
+            try:
+                start = time.monotonic()
+                await self._wait_for_completion(handle, start, kwargs.get("progress_callback"))
+                result = await handle.get()
+                duration = time.monotonic() - start
+                self.avg_duration = duration if self.avg_duration is None else 0.3 * duration + 0.7 * self.avg_duration
+            except asyncio.CancelledError as e:
+                if e.args and e.args[0] == SUPERSEDED:
+                    # 被其他服务抢先完成，取消远端请求
+                    logger.info(f"FAL 请求 {request_id} 已取消")
+                    self._forget(request_id)
+                    try:
+                        await handle.cancel()
+                    except Exception as cancel_error:
+                        logger.warning(f"取消 FAL 请求失败: {cancel_error}")
+                # 其他原因（如关机）取消时保留任务日志，重启后恢复
+                raise
+            except Exception:
+                self._forget(request_id)
+                raise
+            self._forget(request_id)
             
             if not result.get('images'):
                 raise Exception("未获取到图片结果")
             
-            # 获取第一张图片的数据并记录日志
-            image_data = result['images'][0]['url']
-            # 只输出数据格式类型
-            data_format = "base64格式" if image_data.startswith("data:image") else "URL格式"
-            logger.info(f"获取到{data_format}的图片数据")
-            
-            # 修改图片数据处理逻辑
-            if image_data.startswith("data:image"):
-                base64_data = image_data.split(",")[1]
-                image_bytes = base64.b64decode(base64_data)
-            else:
-                import httpx
-                async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    response = await client.get(image_data)
-                    if response.status_code != 200:
-                        raise Exception(f"下载图片失败: {response.status_code}")
-                    image_bytes = response.content
-                    logger.info("成功下载图片")
-            
-            return image_bytes, 0.0
+            images = await asyncio.gather(*(
+                self._load_image(image['url']) for image in result['images']
+            ))
+            return list(images), 0.0
             
         except Exception as e:
             logger.error(f"FAL 服务生成图片失败: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+            
+    def _forget(self, request_id: str):
+        if self.journal is not None:
+            self.journal.remove(request_id)
+            
+    async def resume(self, request_id: str, model: Optional[str] = None) -> list[bytes]:
+        """重启后继续等待之前提交的请求，返回图片数据；任务在远端已失败时抛出 JobFailed"""
+        try:
+            result = await fal_client.result_async(model or self.model, request_id)
+        except FalClientError as e:
+            # 4xx（超时和限流除外）说明任务不存在或已失败，其他错误可能只是暂时的
+            cause = e.__cause__
+            status = cause.response.status_code if isinstance(cause, httpx.HTTPStatusError) else None
+            if status is not None and 400 <= status < 500 and status not in (408, 429):
+                raise JobFailed(str(e)) from e
+            raise
+        if not result.get('images'):
+            raise JobFailed("未获取到图片结果")
+        images = await asyncio.gather(*(
+            self._load_image(image['url']) for image in result['images']
+        ))
+        return list(images)
+            
+    async def _wait_for_completion(
+        self,
+        handle: fal_client.AsyncRequestHandle,
+        start: float,
+        progress_callback: Optional[ProgressCallback]
+    ):
+        """轮询队列状态，状态变化时按节流间隔推送进度"""
+        last_state = None
+        last_sent = 0.0
+        async for status in handle.iter_events(interval=self.poll_interval):
+            if isinstance(status, fal_client.Completed) or progress_callback is None:
+                continue
+            # 只在排队位置或状态变化时推送
+            if isinstance(status, fal_client.Queued):
+                state = status.position
+                text = f"排队中，前面还有 {status.position} 个任务"
+            else:
+                state = "in_progress"
+                text = "正在生成中"
+            now = time.monotonic()
+            if state == last_state or now - last_sent < self.progress_interval:
+                continue
+            if self.avg_duration is not None:
+                remaining = self.avg_duration - (now - start)
+                if remaining > 0:
+                    text += f"，预计还需 {remaining:.0f} 秒"
+            last_state, last_sent = state, now
+            try:
+                await progress_callback(text)
+            except Exception as e:
+                logger.warning(f"推送进度失败: {e}")
+            
+    async def _load_image(self, image_data: str) -> bytes:
+        """解析 base64 图片或下载图片 URL"""
+        # 只输出数据格式类型
+        data_format = "base64格式" if image_data.startswith("data:image") else "URL格式"
+        logger.info(f"获取到{data_format}的图片数据")
+        
+        if image_data.startswith("data:image"):
+            base64_data = image_data.split(",")[1]
+            return base64.b64decode(base64_data)
+        
+        response = await get_client().get(image_data, timeout=self.timeout)
+        if response.status_code != 200:
+            raise Exception(f"下载图片失败: {response.status_code}")
+        logger.info("成功下载图片")
+        return response.content
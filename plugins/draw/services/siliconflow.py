@@ -1,8 +1,10 @@
 from .base import DrawingService
 import httpx
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import asyncio
 from nonebot.log import logger
+from utils import jsonlib
+from utils.http import get_client
 
 class SiliconFlowService(DrawingService):
     def __init__(
@@ -12,7 +14,8 @@ class SiliconFlowService(DrawingService):
         model: str,
         timeout: int = 60,
         max_retries: int = 3,
-        retry_delay: int = 5
+        retry_delay: int = 5,
+        preview_steps: Optional[int] = 4
     ):
         self.api_key = api_key
         self.api_url = api_url
@@ -20,6 +23,7 @@ class SiliconFlowService(DrawingService):
         self.timeout = timeout
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.preview_steps = preview_steps
         
     async def generate_image(
         self,
@@ -29,6 +33,18 @@ class SiliconFlowService(DrawingService):
         **kwargs
     ) -> tuple[bytes, float]:
         """调用 Silicon Flow API 生成图片"""
+        images, inference_time = await self.generate_images(prompt, size, steps, 1, **kwargs)
+        return images[0], inference_time
+        
+    async def generate_images(
+        self,
+        prompt: str,
+        size: str,
+        steps: int,
+        count: int,
+        **kwargs
+    ) -> tuple[list[bytes], float]:
+        """调用 Silicon Flow API 生成图片，多张图片通过 batch_size 一次请求"""
         
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -41,38 +57,42 @@ class SiliconFlowService(DrawingService):
             "image_size": size,
             "num_inference_steps": steps
         }
+        if count > 1:
+            payload["batch_size"] = count
         
         # 重试逻辑
         for i in range(self.max_retries):
             try:
-                async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    response = await client.post(
-                        self.api_url,
-                        json=payload,
-                        headers=headers
-                    )
-                    
-                    if response.status_code != 200:
-                        logger.error(f"API 错误响应: {response.text}")
-                        raise Exception(f"API返回错误: {response.status_code}")
-                        
-                    result = response.json()
-                    image_url = result["images"][0]["url"]
-                    inference_time = result["timings"]["inference"]
-                    
-                    # 下载图片
-                    img_response = await client.get(image_url)
+                client = get_client()
+                response = await client.post(
+                    self.api_url,
+                    content=jsonlib.dumpb(payload),
+                    headers=headers,
+                    timeout=self.timeout
+                )
+                
+                if response.status_code != 200:
+                    logger.error(f"API 错误响应: {response.text}")
+                    raise Exception(f"API返回错误: {response.status_code}")
                     
+                result = jsonlib.response_json(response)
+                image_urls = [image["url"] for image in result["images"]]
+                inference_time = result["timings"]["inference"]
+                
+                # 并发下载图片
+                img_responses = await asyncio.gather(*(client.get(url, timeout=self.timeout) for url in image_urls))
+                
+                for img_response in img_responses:
                     if img_response.status_code != 200:
                         logger.error(f"图片下载失败: {img_response.text}")
                         raise Exception("图片下载失败")
-                        
-                    return img_response.content, inference_time
                     
+                return [img_response.content for img_response in img_responses], inference_time
+                
             except Exception as e:
                 if i < self.max_retries - 1:
                     logger.warning(f"第{i+1}次重试失败: {str(e)}")
                     await asyncio.sleep(self.retry_delay)
                 else:
                     logger.error("已达到最大重试次数，放弃重试")
-                    raise
\ No newline at end of file
+                    raise
@@ -0,0 +1,81 @@
+from .base import DrawingService
+import asyncio
+import hashlib
+import io
+import random
+import time
+from typing import Optional
+from PIL import Image, ImageDraw
+from nonebot.log import logger
+
+class StubDrawingService(DrawingService):
+    """本地模拟绘画服务，生成确定性的图片，用于压测和基准测试，不产生任何费用"""
+
+    def __init__(
+        self,
+        latency: str = "fixed",
+        latency_mean: float = 1.0,
+        latency_jitter: float = 0.5,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+        image_format: str = "PNG",
+        preview_steps: Optional[int] = 4
+    ):
+        if latency not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"不支持的延迟分布: {latency}")
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.image_format = image_format
+        self.preview_steps = preview_steps
+        self.random = random.Random(seed)
+
+    def _sample_latency(self) -> float:
+        """按配置的分布采样一次延迟"""
+        if self.latency == "uniform":
+            return max(0.0, self.random.uniform(
+                self.latency_mean - self.latency_jitter,
+                self.latency_mean + self.latency_jitter
+            ))
+        if self.latency == "lognormal":
+            # latency_jitter 作为对数标准差，使中位数等于 latency_mean
+            return self.random.lognormvariate(0, self.latency_jitter) * self.latency_mean
+        return self.latency_mean
+
+    def _render(self, prompt: str, size: str, steps: int) -> bytes:
+        """根据提示词哈希生成固定颜色和图案的图片"""
+        try:
+            width, height = map(int, size.split("x"))
+        except ValueError:
+            width, height = 1024, 1024
+        digest = hashlib.sha256(f"{prompt}|{steps}".encode()).digest()
+        image = Image.new("RGB", (width, height), tuple(digest[:3]))
+        draw = ImageDraw.Draw(image)
+        for i in range(8):
+            x, y = digest[3 + i] * width // 256, digest[11 + i] * height // 256
+            radius = max(8, digest[19 + i] * min(width, height) // 1024)
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=tuple(digest[i:i + 3]))
+        buffer = io.BytesIO()
+        image.save(buffer, format=self.image_format)
+        return buffer.getvalue()
+
+    async def generate_image(
+        self,
+        prompt: str,
+        size: str,
+        steps: int,
+        **kwargs
+    ) -> tuple[bytes, float]:
+        """模拟生成图片，按配置注入延迟和失败"""
+        delay = self._sample_latency()
+        progress_callback = kwargs.get("progress_callback")
+        if progress_callback is not None:
+            await progress_callback("正在生成中")
+        await asyncio.sleep(delay)
+        if self.random.random() < self.failure_rate:
+            logger.warning("模拟服务注入失败")
+            raise Exception("模拟服务注入的失败")
+        start = time.monotonic()
+        image = await asyncio.to_thread(self._render, prompt, size, steps)
+        return image, delay + time.monotonic() - start
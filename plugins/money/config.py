@@ -7,6 +7,10 @@ class Config(BaseModel):
     keywords: list = ["冰冰v我", "冰冰vwo", "冰冰V我", "冰冰Vwo"]
     image_dir: str = str(Path(__file__).parent / "images")
     max_amount: int = 10000
+    # 合成图片的最大高度(像素)，钞票叠放超出时改为每种面额画一小叠并标注张数
+    max_canvas_height: int = 2000
+    # 超出高度上限时每种面额最多画几张
+    pile_depth: int = 3
     exceed_messages: list = [
         "这么多钱，你怎么不去抢银行？",
         "这么多钱，你咋不上天呢？",
@@ -35,24 +39,46 @@ class Config(BaseModel):
         "好人一生平安~",
         "有钱能使鬼推磨~有钱也能使冰冰推磨~"
     ]
+    # 渲染任务过多时的回复
+    busy_messages: list = [
+        "钱太多数不过来了，等会儿再来吧~",
+        "排队领钱的人太多啦，稍后再试~",
+        "财务正忙着呢，一会儿再说"
+    ]
+    # 进程池渲染配置
+    render: dict = {}
+    # 输出编码配置
+    encoder: dict = {}
+    # 图片后处理配置，与绘图插件的 [draw.postprocess] 相同
+    postprocess: dict = {}
+    # 编码后图片的缓存配置
+    cache: dict = {}
 
 # 读取 TOML 配置文件
 config_file = Path("config.toml")
 if not config_file.exists():
     raise ValueError("配置文件 config.toml 不存在")
 
-try:
-    # 读取配置文件
+def load_config() -> Config:
+    """读取配置文件并与默认配置合并"""
     with open(config_file, "rb") as f:
         toml_config = tomli.load(f)
         money_config = toml_config.get("money", {})
     
     # 合并默认配置和配置文件中的配置
-    config = Config(**{
+    return Config(**{
         **Config().dict(),  # 默认配置
         **money_config      # 配置文件中的配置
     })
-    
+
+def reload_config() -> None:
+    """重新读取配置文件，原地更新 config，使已导入的引用同样生效"""
+    new_config = load_config()
+    for field in Config.__fields__:
+        setattr(config, field, getattr(new_config, field))
+
+try:
+    config = load_config()
 except Exception as e:
     # 如果获取失败，使用默认配置
     config = Config()
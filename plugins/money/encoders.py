@@ -0,0 +1,81 @@
+import io
+from typing import Callable, Dict, Tuple
+
+from PIL import Image
+
+from utils.image_pipeline import _flatten
+
+# 各编码器的默认参数，配置中同名键覆盖
+DEFAULT_OPTIONS: Dict[str, dict] = {
+    # 无损 PNG，只设压缩等级，不做耗时的 optimize 搜索
+    "png": {"compress_level": 3},
+    # 调色板 PNG，先量化为最多 colors 种颜色
+    "png8": {"colors": 256, "compress_level": 6},
+    # method 越小编码越快，体积略大
+    "webp": {"quality": 80, "method": 2, "lossless": False},
+    # 合成到纯色背景后编码
+    "jpeg": {"quality": 80, "background": [255, 255, 255]},
+    # 旧版行为：PNG + optimize，仅用于对比
+    "png_optimize": {},
+}
+
+# 钞票图片不透明，JPEG 编码最快且体积与 WebP 相当（见 benchmarks/bench_money_encode.py）
+DEFAULT_FORMAT = "jpeg"
+
+
+def _encode_png(image: Image.Image, options: dict, buffer: io.BytesIO) -> None:
+    image.save(buffer, format="PNG", compress_level=options["compress_level"])
+
+
+def _encode_png8(image: Image.Image, options: dict, buffer: io.BytesIO) -> None:
+    # RGBA 图片只能用 FASTOCTREE 量化，同时保留透明度
+    method = Image.Quantize.FASTOCTREE if image.mode == "RGBA" else Image.Quantize.MEDIANCUT
+    quantized = image.quantize(colors=options["colors"], method=method)
+    quantized.save(buffer, format="PNG", compress_level=options["compress_level"])
+
+
+def _encode_webp(image: Image.Image, options: dict, buffer: io.BytesIO) -> None:
+    image.save(
+        buffer,
+        format="WEBP",
+        quality=options["quality"],
+        method=options["method"],
+        lossless=options["lossless"]
+    )
+
+
+def _encode_jpeg(image: Image.Image, options: dict, buffer: io.BytesIO) -> None:
+    flattened = _flatten(image, tuple(options["background"]))
+    flattened.save(buffer, format="JPEG", quality=options["quality"])
+
+
+def _encode_png_optimize(image: Image.Image, options: dict, buffer: io.BytesIO) -> None:
+    image.save(buffer, format="PNG", optimize=True)
+
+
+ENCODERS: Dict[str, Callable[[Image.Image, dict, io.BytesIO], None]] = {
+    "png": _encode_png,
+    "png8": _encode_png8,
+    "webp": _encode_webp,
+    "jpeg": _encode_jpeg,
+    "png_optimize": _encode_png_optimize,
+}
+
+
+def resolve_encoder(config: dict) -> Tuple[str, tuple]:
+    """根据 [money.encoder] 配置返回 (格式, 参数)，参数为可哈希的元组，可直接作为缓存键"""
+    name = str(config.get("format", DEFAULT_FORMAT)).lower()
+    if name == "jpg":
+        name = "jpeg"
+    if name not in ENCODERS:
+        raise ValueError(f"不支持的编码格式: {name}，可选：{', '.join(ENCODERS)}")
+    options = {**DEFAULT_OPTIONS[name], **config.get(name, {})}
+    return name, tuple(sorted((key, tuple(value) if isinstance(value, list) else value)
+                              for key, value in options.items()))
+
+
+def encode(image: Image.Image, name: str, options: tuple) -> bytes:
+    """按指定格式编码图片"""
+    buffer = io.BytesIO()
+    ENCODERS[name](image, dict(options), buffer)
+    return buffer.getvalue()
@@ -0,0 +1,37 @@
+from collections import deque
+from typing import Deque, Dict
+
+
+class RenderMetrics:
+    """记录最近若干次渲染的各阶段耗时，以及超时、拒绝等计数"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self.timings: Dict[str, Deque[float]] = {}
+        self.counters: Dict[str, int] = {"rendered": 0, "timeout": 0, "rejected": 0, "failed": 0}
+
+    def record(self, timings: Dict[str, float]) -> None:
+        self.counters["rendered"] += 1
+        for stage, cost in timings.items():
+            self.timings.setdefault(stage, deque(maxlen=self.window)).append(cost)
+
+    def incr(self, name: str) -> None:
+        self.counters[name] = self.counters.get(name, 0) + 1
+
+    @staticmethod
+    def _percentile(values: Deque[float], ratio: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+    def report(self) -> str:
+        lines = [
+            f"渲染：完成 {self.counters['rendered']}，超时 {self.counters['timeout']}，"
+            f"繁忙拒绝 {self.counters['rejected']}，失败 {self.counters['failed']}"
+        ]
+        for stage, values in self.timings.items():
+            if values:
+                lines.append(
+                    f"  {stage}: p50 {self._percentile(values, 0.5) * 1000:.1f}ms，"
+                    f"p95 {self._percentile(values, 0.95) * 1000:.1f}ms"
+                )
+        return "\n".join(lines)
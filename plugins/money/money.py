@@ -3,117 +3,300 @@ import random
 import os
 import base64
 from pathlib import Path
-from nonebot import on_message
+from nonebot import on_message, on_command
+from nonebot.permission import SUPERUSER
 from nonebot.rule import Rule
 from nonebot.adapters.onebot.v11 import MessageSegment, Message
 from nonebot.typing import T_State
 from nonebot.adapters.onebot.v11 import Bot, Event
-from PIL import Image
-import io
+from PIL import Image, ImageDraw, ImageFont
+import time
+import asyncio
 import logging
+import multiprocessing
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
 
-from .config import config
+from .config import config, reload_config
+from .sprites import DENOMINATIONS, sprite_cache
+from .render_cache import RenderCache
+from .metrics import RenderMetrics
+from .encoders import DEFAULT_FORMAT, encode, resolve_encoder
+from utils.dispatcher import dispatcher
+from utils.image_pipeline import ImagePipeline, process_image
+from utils.perf import perf
+from utils.process_pool import PoolUnavailable, configure_pool, run_in_pool, run_in_thread
+from utils.shutdown import coordinator
 
-def merge_money_images(amount: int, offset_x: int = 60, offset_y: int = 40) -> Image.Image:
-    """根据金额合成重叠的人民币图片"""
-    try:
-        if not 1 <= amount <= config.max_amount:
-            return None
+# 图片后处理，启用时替代默认的 PNG 编码
+image_pipeline = ImagePipeline.from_config(config.postprocess)
+
+def load_encoder() -> tuple:
+    """读取 [money.encoder] 配置，返回 (格式, 参数)"""
+    return resolve_encoder(config.encoder)
+
+# 未启用图片后处理时使用的编码器
+try:
+    money_encoder = load_encoder()
+except Exception as e:
+    logging.error(f"编码器配置错误，使用默认编码: {str(e)}")
+    money_encoder = resolve_encoder({"format": DEFAULT_FORMAT})
+
+# 编码后图片的缓存，热门金额直接复用
+render_cache = RenderCache(
+    max_bytes=int(config.cache.get("max_mb", 32) * 1024 * 1024),
+    persist_dir=config.cache.get("persist_dir") or None
+) if config.cache.get("enable", True) else None
+
+# 合成和编码放到进程池中执行，避免阻塞事件循环
+RENDER_TIMEOUT = float(config.render.get("timeout", 10))
+# 同时提交到进程池的渲染任务数
+render_slots = asyncio.Semaphore(max(1, int(config.render.get("max_concurrency", 2))))
+# 正在执行和排队的任务总数上限，超出时直接回复繁忙，防止刷屏堆积任务
+MAX_PENDING = max(1, int(config.render.get("max_pending", 8)))
+pending_renders = 0
+render_metrics = RenderMetrics()
+configure_pool(config.render.get("workers", 2))
 
-        image_dir = Path(config.image_dir)
-        images = {
-            1: str(image_dir / "1.png"),
-            5: str(image_dir / "5.png"),
-            10: str(image_dir / "10.png"),
-            20: str(image_dir / "20.png"),
-            50: str(image_dir / "50.png"),
-            100: str(image_dir / "100.png"),
-        }
+class RenderBusyError(Exception):
+    """排队的渲染任务过多"""
 
-        counts = {denomination: 0 for denomination in images}
-        remaining_amount = amount
+# 插件加载时预先解码所有面额图片
+try:
+    sprite_cache.load(config.image_dir)
+except Exception as e:
+    logging.error(f"加载钞票图片失败: {str(e)}")
 
-        for denomination in sorted(images.keys(), reverse=True):
-            while remaining_amount >= denomination:
-                counts[denomination] += 1
-                remaining_amount -= denomination
+def decompose_amount(amount: int) -> dict:
+    """用 divmod 按面额从大到小拆分金额，返回各面额张数"""
+    counts = {}
+    remaining_amount = amount
+    for denomination in DENOMINATIONS:
+        counts[denomination], remaining_amount = divmod(remaining_amount, denomination)
+    return counts
+
+def merge_money_images(
+    amount: int,
+    offset_x: int = 60,
+    offset_y: int = 40,
+    max_amount: Optional[int] = None,
+    max_canvas_height: Optional[int] = None,
+    pile_depth: Optional[int] = None
+) -> Image.Image:
+    """根据金额合成重叠的人民币图片，张数过多时每种面额只画一小叠并标注张数
+
+    max_amount、max_canvas_height、pile_depth 未传入时使用当前配置。
+    """
+    max_amount = config.max_amount if max_amount is None else max_amount
+    max_canvas_height = config.max_canvas_height if max_canvas_height is None else max_canvas_height
+    pile_depth = config.pile_depth if pile_depth is None else pile_depth
+    try:
+        if not 1 <= amount <= max_amount:
+            return None
+
+        # 只读取一次，重新加载时替换的是整个字典，合成过程中不会混用新旧图片
+        sprites = sprite_cache.sprites
+        counts = decompose_amount(amount)
+        total_count = sum(counts.values())
 
         # 如果只需要一张钞票，直接返回该面额的图片
-        if sum(counts.values()) == 1:
+        if total_count == 1:
             denomination = next(d for d, c in counts.items() if c > 0)
-            try:
-                with Image.open(images[denomination]) as img:
-                    # 创建副本避免文件锁定
-                    return img.copy().convert("RGBA")
-            except Exception as e:
-                logging.error(f"打开图片失败: {str(e)}")
-                return None
-
-        # 多张钞票的合成逻辑
-        first_image_path = next((path for path in images.values() if os.path.exists(path)), None)
-        if not first_image_path:
-            return None
+            return sprites[denomination].image.copy()
 
-        with Image.open(first_image_path) as first_image:
-            width, height = first_image.size
-            total_offset_y = offset_y * (sum(counts.values()) - 1) if sum(counts.values()) > 1 else 0
-            base_image = Image.new("RGBA", (width, height + total_offset_y), (255, 255, 255, 0))
+        # 画布高度上限内最多能叠放的钞票张数
+        width, height = sprites[DENOMINATIONS[0]].image.size
+        max_count = max(1, (max_canvas_height - height) // offset_y + 1)
+        piled = total_count > max_count
 
-            x_offset = 0
-            y_offset = 0
+        # 从小面额到大面额依次叠放，超出上限时每种面额最多画 pile_depth 张
+        layers = []
+        for denomination in reversed(DENOMINATIONS):
+            count = counts[denomination]
+            if count > 0:
+                drawn = min(count, pile_depth) if piled else count
+                layers.append((denomination, count, drawn))
 
-            for denomination, count in counts.items():
-                if count > 0:
-                    try:
-                        with Image.open(images[denomination]) as money_image:
-                            for _ in range(count):
-                                base_image.paste(money_image, (x_offset, y_offset), money_image)
-                                y_offset += offset_y
-                    except Exception as e:
-                        logging.error(f"处理面额 {denomination} 时出错: {str(e)}")
-                        return None
+        drawn_total = sum(drawn for _, _, drawn in layers)
+        base_image = Image.new("RGBA", (width, height + offset_y * (drawn_total - 1)), (255, 255, 255, 0))
 
-            return base_image
+        y_offset = 0
+        labels = []
+        for denomination, count, drawn in layers:
+            sprite = sprites[denomination]
+            for _ in range(drawn):
+                base_image.paste(sprite.image, (0, y_offset), sprite.mask)
+                y_offset += offset_y
+            if piled:
+                # 标注写在这叠最上面一张露出的边缘上（默认字体不含“×”，使用 x）
+                labels.append((f"x{count}", y_offset - offset_y))
+
+        if labels:
+            draw_count_labels(base_image, labels, offset_y)
+
+        return base_image
 
     except Exception as e:
         logging.error(f"合成图片时出错: {str(e)}")
         return None
 
-def image_to_base64(image: Image.Image) -> str:
-    """将 PIL Image 对象转换为 base64 字符串"""
+def draw_count_labels(image: Image.Image, labels: list, strip_height: int) -> None:
+    """在每叠钞票露出的边缘右侧写上张数"""
+    font = ImageFont.load_default(size=max(12, int(strip_height * 0.8)))
+    draw = ImageDraw.Draw(image)
+    for text, y in labels:
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font, stroke_width=3)
+        x = image.width - (right - left) - 16
+        draw.text(
+            (x - left, y + (strip_height - (bottom - top)) // 2 - top),
+            text,
+            font=font,
+            fill=(255, 255, 255, 255),
+            stroke_width=3,
+            stroke_fill=(0, 0, 0, 255)
+        )
+
+def encode_image(
+    image: Image.Image,
+    encoder: Optional[tuple] = None,
+    pipeline_options: Optional[tuple] = None
+) -> bytes:
+    """将 PIL Image 对象编码为图片数据，传入后处理参数时使用图片后处理"""
+    if pipeline_options is not None:
+        return process_image(image, *pipeline_options)[0]
+    name, options = encoder or money_encoder
+    return encode(image, name, options)
+
+def encoder_tag() -> str:
+    """当前编码参数的标识，参数变化后缓存自动失效"""
+    if image_pipeline.enable:
+        return "pipeline:" + ":".join(map(str, image_pipeline.options))
+    name, options = money_encoder
+    return f"{name}:{options}"
+
+def render_settings() -> dict:
+    """渲染所需的配置快照，随任务一起传给子进程，保证重新加载后子进程同样生效"""
+    return {
+        "image_dir": config.image_dir,
+        "digest": sprite_cache.digest,
+        "max_amount": config.max_amount,
+        "max_canvas_height": config.max_canvas_height,
+        "pile_depth": config.pile_depth,
+        "encoder": money_encoder,
+        "pipeline": image_pipeline.options if image_pipeline.enable else None,
+    }
+
+def render_and_encode(
+    amount: int,
+    offset_x: int,
+    offset_y: int,
+    settings: dict
+) -> Tuple[Optional[bytes], Dict[str, float]]:
+    """在子进程中合成并编码图片，返回图片数据和各阶段耗时
+
+    进程池不可用时也会在主进程的线程中执行，因此只通过参数使用配置，不修改全局状态。
+    """
+    if multiprocessing.parent_process() is not None:
+        # 子进程按任务携带的摘要加载图片，主进程中的图片由插件加载和 /money reload 维护
+        sprite_cache.ensure(settings["image_dir"], settings["digest"])
+
+    timings = {}
+    start = time.perf_counter()
+    image = merge_money_images(
+        amount, offset_x, offset_y,
+        settings["max_amount"], settings["max_canvas_height"], settings["pile_depth"]
+    )
+    timings["render"] = time.perf_counter() - start
+    if not image:
+        return None, timings
+
+    start = time.perf_counter()
+    data = encode_image(image, settings["encoder"], settings["pipeline"])
+    timings["encode"] = time.perf_counter() - start
+    return data, timings
+
+async def render_money_image(amount: int, offset_x: int = 60, offset_y: int = 40) -> Optional[bytes]:
+    """返回金额对应的编码后图片，优先从缓存读取，未命中时在进程池中渲染"""
+    global pending_renders
+    key = RenderCache.make_key(amount, offset_x, offset_y, sprite_cache.digest, encoder_tag())
+    if render_cache is not None:
+        data = render_cache.get(key)
+        if data is not None:
+            return data
+
+    if pending_renders >= MAX_PENDING:
+        render_metrics.incr("rejected")
+        raise RenderBusyError(f"渲染任务已达上限 {MAX_PENDING}")
+
+    pending_renders += 1
+    begin = time.perf_counter()
+    args = (amount, offset_x, offset_y, render_settings())
     try:
-        buffer = io.BytesIO()
-        # 优化保存参数
-        image.save(buffer, format="PNG", optimize=True, quality=85)
-        return f"base64://{base64.b64encode(buffer.getvalue()).decode()}"
-    except Exception as e:
-        logging.error(f"图片转base64失败: {str(e)}")
-        raise
+        try:
+            # 槽位在进程中的任务真正结束后才释放，超时的渲染仍占用名额
+            data, timings = await run_in_pool(
+                render_and_encode, *args, timeout=RENDER_TIMEOUT, slot=render_slots
+            )
+        except asyncio.TimeoutError:
+            render_metrics.incr("timeout")
+            raise
+        except (PoolUnavailable, BrokenProcessPool) as e:
+            # 进程池不可用时退回线程中执行，同样不阻塞事件循环；渲染本身出错时直接报错，不再重试
+            logging.warning(f"进程池渲染失败，改用线程执行: {str(e)}")
+            data, timings = await run_in_thread(
+                render_and_encode, *args, timeout=RENDER_TIMEOUT, slot=render_slots
+            )
+    finally:
+        pending_renders -= 1
+
+    if data is None:
+        render_metrics.incr("failed")
+        return None
+    total = time.perf_counter() - begin
+    # 排队等待槽位以及进程间传输的耗时
+    queued = max(0.0, total - sum(timings.values()))
+    render_metrics.record({"queue": queued, **timings, "total": total})
+    if render_cache is not None:
+        render_cache.put(key, data)
+    return data
+
+# 所有关键词编译成的单个正则，以及关键词首字符集合，用于快速预筛
+keyword_pattern: Optional[re.Pattern] = None
+keyword_initials: frozenset = frozenset()
+
+def compile_keywords() -> None:
+    """将关键词列表编译为单个正则，配置重新加载后需再次调用"""
+    global keyword_pattern, keyword_initials
+    keywords = sorted({k for k in config.keywords if k}, key=len, reverse=True)
+    if not keywords:
+        keyword_pattern, keyword_initials = None, frozenset()
+        return
+    keyword_pattern = re.compile(f"(?:{'|'.join(map(re.escape, keywords))})(-?\\d+)")
+    keyword_initials = frozenset(k[0] for k in keywords)
+
+compile_keywords()
 
-async def check_money_message(event: Event) -> bool:
-    """检查消息是否匹配转账模式"""
+async def check_money_message(event: Event, state: T_State) -> bool:
+    """检查消息是否匹配转账模式，匹配时将金额存入 state"""
     msg = event.get_plaintext()
-    for keyword in config.keywords:
-        pattern = f"{keyword}(-?\\d+)"
-        match = re.search(pattern, msg)
-        if match:
-            return True
-    return False
+    # 绝大多数消息不含任何关键词首字符，直接跳过正则
+    if keyword_pattern is None or not any(c in msg for c in keyword_initials):
+        return False
+    match = keyword_pattern.search(msg)
+    if match is None:
+        return False
+    state["money_amount"] = int(match.group(1))
+    return True
 
 money_matcher = on_message(rule=Rule(check_money_message))
+coordinator.install()
+dispatcher.install()
 
 @money_matcher.handle()
+@coordinator.tracked("money")
 async def handle_money(bot: Bot, event: Event, state: T_State):
-    msg = event.get_plaintext()
-    amount = 0
-    
-    # 提取金额
-    for keyword in config.keywords:
-        pattern = f"{keyword}(-?\\d+)"
-        match = re.search(pattern, msg)
-        if match:
-            amount = int(match.group(1))
-            break
+    # 金额已在匹配规则中解析
+    amount = state.get("money_amount", 0)
     
     # 检查负数
     if amount < 0:
@@ -131,13 +314,24 @@ async def handle_money(bot: Bot, event: Event, state: T_State):
         return
     
     # 合成图片
-    result_image = merge_money_images(amount)
-    if not result_image:
+    try:
+        image_data = await render_money_image(amount)
+    except RenderBusyError as e:
+        logging.warning(str(e))
+        await money_matcher.finish(random.choice(config.busy_messages))
+        return
+    except asyncio.TimeoutError:
+        logging.error(f"合成图片超时({RENDER_TIMEOUT}秒)，金额: {amount}")
+        image_data = None
+    except Exception as e:
+        logging.error(f"合成图片失败: {str(e)}")
+        image_data = None
+    if not image_data:
         await money_matcher.finish(random.choice(config.error_messages))
         return
         
     try:
-        base64_str = image_to_base64(result_image)
+        base64_str = f"base64://{base64.b64encode(image_data).decode()}"
         success_msg = random.choice(config.success_messages)
         
         # 合并图片和文字消息
@@ -150,4 +344,47 @@ async def handle_money(bot: Bot, event: Event, state: T_State):
         
     except Exception as e:
         logging.error(f"发送消息时出错: {str(e)}")
-        await money_matcher.finish(random.choice(config.error_messages)) 
\ No newline at end of file
+        await money_matcher.finish(random.choice(config.error_messages))
+
+def perf_report() -> str:
+    """/perf 中的钞票部分：缓存命中率、渲染排队和各阶段耗时"""
+    cache = f"图片缓存命中率 {render_cache.hit_ratio * 100:.0f}%" if render_cache is not None else "图片缓存未启用"
+    return f"- {cache}，渲染排队中 {pending_renders}/{MAX_PENDING}\n{render_metrics.report()}"
+
+perf.add_source("钞票", perf_report)
+
+money_reload = on_command("money", permission=SUPERUSER, priority=5, block=True)
+
+@money_reload.handle()
+async def handle_money_reload(event: Event):
+    args = event.get_plaintext().strip().split()[1:]
+    if args == ["stats"]:
+        stats = render_cache.stats() if render_cache is not None else "图片缓存未启用"
+        await money_reload.finish(
+            f"钞票图片版本：{sprite_cache.version} ({sprite_cache.digest})\n{stats}\n"
+            f"{render_metrics.report()}\n排队中：{pending_renders}/{MAX_PENDING}"
+        )
+        return
+    if args != ["reload"]:
+        await money_reload.finish(
+            "使用方法：\n"
+            "/money reload - 重新加载配置和钞票图片\n"
+            "/money stats - 查看图片缓存和渲染耗时统计"
+        )
+        return
+    global money_encoder
+    try:
+        reload_config()
+        money_encoder = load_encoder()
+        compile_keywords()
+        sprite_cache.load(config.image_dir)
+        # 缓存键包含图片摘要，旧条目不会再命中，直接释放内存
+        if render_cache is not None:
+            render_cache.clear()
+    except Exception as e:
+        logging.error(f"重新加载失败: {str(e)}")
+        await money_reload.finish(f"重新加载失败：{str(e)}")
+        return
+    await money_reload.finish(
+        f"已重新加载配置和钞票图片（版本 {sprite_cache.version}，编码 {money_encoder[0]}）"
+    )
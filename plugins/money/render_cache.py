@@ -0,0 +1,140 @@
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+import logging
+
+
+class RenderCache:
+    """按金额缓存最终编码后的图片数据，LRU 淘汰，可选持久化到磁盘
+
+    磁盘上的文件和内存一样受 max_bytes 限制：淘汰、清空时同时删除对应文件，
+    启动时按修改时间只保留最近的文件，其余删除，避免不同金额的请求把磁盘写满。
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, persist_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self.entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self.total_bytes = 0
+        # 磁盘上的缓存文件：文件名 -> 大小，按最近使用排列
+        self.files: "OrderedDict[str, int]" = OrderedDict()
+        self.disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.persist_dir is not None:
+            self.persist_dir.mkdir(parents=True, exist_ok=True)
+            self._scan()
+
+    @staticmethod
+    def make_key(amount: int, offset_x: int, offset_y: int, sprite_version: str, encoder: str) -> tuple:
+        return (amount, offset_x, offset_y, sprite_version, encoder)
+
+    @staticmethod
+    def _name(key: tuple) -> str:
+        return f"{hashlib.sha1(repr(key).encode()).hexdigest()}.bin"
+
+    def _scan(self) -> None:
+        """登记已有的缓存文件，超出上限的按修改时间从旧到新删除"""
+        try:
+            found = sorted(
+                (stat.st_mtime, path.name, stat.st_size)
+                for path, stat in ((path, path.stat()) for path in self.persist_dir.glob("*.bin"))
+            )
+        except Exception as e:
+            logging.warning(f"读取图片缓存目录失败: {str(e)}")
+            return
+        for _, name, size in found:
+            self.files[name] = size
+            self.disk_bytes += size
+        self._trim_disk()
+
+    def _remove_file(self, name: str) -> None:
+        size = self.files.pop(name, None)
+        if size is None:
+            return
+        self.disk_bytes -= size
+        try:
+            (self.persist_dir / name).unlink(missing_ok=True)
+        except Exception as e:
+            logging.warning(f"删除图片缓存失败: {str(e)}")
+
+    def _trim_disk(self) -> None:
+        while self.disk_bytes > self.max_bytes and self.files:
+            self._remove_file(next(iter(self.files)))
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+            if self.persist_dir is not None and self._name(key) in self.files:
+                self.files.move_to_end(self._name(key))
+            self.hits += 1
+            return data
+        if self.persist_dir is not None and self._name(key) in self.files:
+            name = self._name(key)
+            try:
+                data = (self.persist_dir / name).read_bytes()
+            except Exception as e:
+                logging.warning(f"读取图片缓存失败: {str(e)}")
+                self._remove_file(name)
+                data = None
+            if data is not None:
+                self.disk_hits += 1
+                self.files.move_to_end(name)
+                self._insert(key, data)
+                return data
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        self._insert(key, data)
+        if self.persist_dir is not None and key in self.entries:
+            name = self._name(key)
+            try:
+                (self.persist_dir / name).write_bytes(data)
+            except Exception as e:
+                logging.warning(f"写入图片缓存失败: {str(e)}")
+                return
+            self.disk_bytes += len(data) - self.files.pop(name, 0)
+            self.files[name] = len(data)
+            self._trim_disk()
+
+    def _insert(self, key: tuple, data: bytes) -> None:
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= len(old)
+        self.entries[key] = data
+        self.total_bytes += len(data)
+        while self.total_bytes > self.max_bytes:
+            evicted_key, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+            self.evictions += 1
+            if self.persist_dir is not None:
+                self._remove_file(self._name(evicted_key))
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.total_bytes = 0
+        if self.persist_dir is not None:
+            for name in list(self.files):
+                self._remove_file(name)
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def stats(self) -> str:
+        usage = f"缓存条目：{len(self.entries)}，占用 {self.total_bytes / 1024 / 1024:.1f}MB / {self.max_bytes / 1024 / 1024:.0f}MB"
+        if self.persist_dir is not None:
+            usage += f"，磁盘 {self.disk_bytes / 1024 / 1024:.1f}MB（{len(self.files)} 个文件）"
+        return (
+            f"{usage}\n"
+            f"命中：内存 {self.hits}，磁盘 {self.disk_hits}，未命中 {self.misses}，"
+            f"命中率 {self.hit_ratio * 100:.0f}%，淘汰 {self.evictions}"
+        )
@@ -0,0 +1,63 @@
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from PIL import Image
+import logging
+
+# 支持的面额，从大到小
+DENOMINATIONS = (100, 50, 20, 10, 5, 1)
+
+
+class Sprite:
+    """解码后的钞票图片及其预先提取的透明度蒙版"""
+    __slots__ = ("image", "mask")
+
+    def __init__(self, image: Image.Image):
+        self.image = image
+        # paste 时直接使用，避免每次合成都从 RGBA 中重新提取 alpha 通道
+        self.mask = image.getchannel("A")
+
+
+class SpriteCache:
+    """插件加载时一次性解码所有面额图片，合成时只在内存中操作"""
+
+    def __init__(self):
+        self.sprites: Dict[int, Sprite] = {}
+        self.size: Optional[Tuple[int, int]] = None
+        self.image_dir: Optional[str] = None
+        # 每次重新加载递增
+        self.version = 0
+        # 图片文件内容的摘要，跨进程重启保持不变，用作渲染缓存键的一部分
+        self.digest = ""
+
+    def load(self, image_dir: str) -> None:
+        """加载并校验所有面额图片，失败时保留原有缓存并抛出异常"""
+        sprites = {}
+        size = None
+        digest = hashlib.sha1()
+        for denomination in DENOMINATIONS:
+            path = Path(image_dir) / f"{denomination}.png"
+            digest.update(path.read_bytes())
+            with Image.open(path) as image:
+                sprite = Sprite(image.convert("RGBA"))
+            if size is None:
+                size = sprite.image.size
+            elif sprite.image.size != size:
+                raise ValueError(f"面额 {denomination} 的图片尺寸 {sprite.image.size} 与其他图片 {size} 不一致")
+            sprites[denomination] = sprite
+
+        self.sprites = sprites
+        self.size = size
+        self.image_dir = image_dir
+        self.digest = digest.hexdigest()[:12]
+        self.version += 1
+        logging.info(f"已加载 {len(sprites)} 张钞票图片，尺寸 {size}，版本 {self.version}")
+
+    def ensure(self, image_dir: str, digest: Optional[str] = None) -> Dict[int, Sprite]:
+        """返回已加载的图片，图片目录或内容摘要变化时重新加载"""
+        if image_dir != self.image_dir or (digest and digest != self.digest):
+            self.load(image_dir)
+        return self.sprites
+
+
+sprite_cache = SpriteCache()
@@ -5,15 +5,30 @@ from nonebot import get_driver
 from nonebot.rule import to_me, Rule
 from typing import Optional, Set, List, Dict
 import openai
+from nonebot.log import logger
 import tomli
 from pathlib import Path
-from collections import defaultdict
-import json
 from datetime import datetime
 import os
 import asyncio
 import re
 import random
+import time
+
+from .semantic_cache import SemanticCache
+from .turns import (
+    ROLE_ASSISTANT, ROLE_SYSTEM, ROLE_USER, Turn,
+    build_messages, estimate_bytes, estimate_legacy_bytes, load_history
+)
+from utils.dispatcher import dispatcher
+from utils import jsonlib
+from utils.http import get_client
+from utils.locks import KeyBusy, KeyedLocks
+from utils.log_writer import LogWriter
+from utils.perf import perf
+from utils.shutdown import coordinator
+from utils.state import get_state
+from utils.workers import shares_conversations, worker_path
 
 __plugin_meta__ = PluginMetadata(
     name="OAI Chat",
@@ -54,6 +69,10 @@ temperature = float(oai_config.get("temperature", 0.7))
 max_tokens = int(oai_config.get("max_tokens", 2000))
 max_history = int(oai_config.get("max_history", 5))
 
+# 运行时设置和对话历史保存在状态存储中，多个工作进程共享；以下为配置文件中的默认值
+state = get_state()
+SETTINGS = "oai.settings"
+
 # 存储配置
 enabled_groups: Set[int] = set()
 private_chat_enabled: bool = trigger_config.get("enable_private", True)
@@ -64,19 +83,30 @@ enable_command: bool = trigger_config.get("enable_command", True)
 
 # 获取系统提示语
 system_prompt = oai_config.get("system_prompt", "")
+# 所有请求共享同一个系统提示消息，不再逐会话保存
+system_message = {"role": ROLE_SYSTEM, "content": system_prompt} if system_prompt else None
 
-# 添加对话历史存储
-chat_history = defaultdict(list)
+# 对话历史保存在状态存储中，键由 get_user_id 生成，内容为不含系统提示的 Turn 列表
 
 # 在配置部分添加
 separate_users = oai_config.get("separate_users", True)
 
+# 同一会话（get_user_id 返回的键）的请求依次处理，避免并发读写历史导致顺序错乱
+concurrency_config = oai_config.get("concurrency", {})
+conversation_locks = KeyedLocks()
+conversation_locks.configure(concurrency_config)
+if shares_conversations() and state.shared:
+    # 按连接分片时同一个群可能由多个进程处理，借助共享的状态存储跨进程互斥
+    conversation_locks.backend = state
+busy_message = concurrency_config.get("busy_message", "冰冰还在回上一条呢，等一下再问吧~")
+perf.add_source("会话", conversation_locks.report)
+
 # 修改用户标识获取函
-def get_user_id(event: MessageEvent) -> str:
+async def get_user_id(event: MessageEvent) -> str:
     if isinstance(event, GroupMessageEvent):
         group_id = event.group_id
         # 根据群设置决定是否隔离用户
-        if group_isolation.get(group_id, default_isolation):
+        if await is_group_isolated(group_id):
             return f"group_{group_id}_{event.user_id}"
         else:
             return f"group_{group_id}"
@@ -89,7 +119,7 @@ def check_prefix() -> Rule:
         # 如果消息以命令前缀开头，则不处理
         if msg.startswith('/'):
             return False
-        return any(msg.startswith(prefix.lower()) for prefix in trigger_prefixes)
+        return any(msg.startswith(prefix.lower()) for prefix in await get_trigger_prefixes())
     return Rule(_check_prefix)
 
 # 自定义规则：检查是否为命令
@@ -120,26 +150,27 @@ async def handle_command(event: MessageEvent):
     
     if cmd == "private":
         subcmd = args[1] if len(args) > 1 else ""
-        global private_chat_enabled
         if subcmd == "on":
-            private_chat_enabled = True
+            await state.set(SETTINGS, "private_chat_enabled", True)
             await command.finish("已启用私聊功能")
         elif subcmd == "off":
-            private_chat_enabled = False
+            await state.set(SETTINGS, "private_chat_enabled", False)
             await command.finish("已禁用私聊功能")
     
     elif cmd == "prefix":
         subcmd = args[1] if len(args) > 1 else ""
+        prefixes = await get_trigger_prefixes()
         if subcmd == "add" and len(args) > 2:
-            trigger_prefixes.add(args[2])
+            if args[2] not in prefixes:
+                await state.set(SETTINGS, "trigger_prefixes", prefixes + [args[2]])
             await command.finish(f"已添加触发前缀：{args[2]}")
         elif subcmd == "remove" and len(args) > 2:
-            if len(trigger_prefixes) <= 1:
+            if len(prefixes) <= 1:
                 await command.finish("至少需要保留一个触发前缀")
-            trigger_prefixes.discard(args[2])
+            await state.set(SETTINGS, "trigger_prefixes", [p for p in prefixes if p != args[2]])
             await command.finish(f"已删除触发前缀：{args[2]}")
         elif subcmd == "list":
-            prefix_list = "、".join(trigger_prefixes)
+            prefix_list = "、".join(prefixes)
             await command.finish(f"当前触发前缀：{prefix_list}")
     
     elif cmd == "toggle":
@@ -167,20 +198,12 @@ async def handle_command(event: MessageEvent):
         if subcmd == "on":
             separate_users = True
             # 清当前群的历史记录
-            group_prefix = f"group_{event.group_id}"
-            for key in list(chat_history.keys()):
-                if key.startswith(group_prefix):
-                    chat_history.pop(key)
+            await clear_group_history(event.group_id)
             await command.finish("已启用群聊用户分离，历史记录已清理")
         elif subcmd == "off":
             separate_users = False
             # 清理当前群的历史记录
-            group_prefix = f"group_{event.group_id}"
-            for key in list(chat_history.keys()):
-                if key.startswith(group_prefix):
-                    chat_history.pop(key)
-            # 创建新的群组共享历史记录
-            chat_history[f"group_{event.group_id}"] = []
+            await clear_group_history(event.group_id)
             await command.finish("已禁用群聊用户分离，历史记录已清理")
 
 # 创建消息响应器，调整优先级并添加命令检查
@@ -209,15 +232,10 @@ log_format = log_config.get("format", "markdown")
 if enable_log:
     log_path.mkdir(parents=True, exist_ok=True)
 
-# 添加日志文件处理函数
-async def ensure_log_file(log_file: Path) -> bool:
-    try:
-        log_file.parent.mkdir(parents=True, exist_ok=True)
-        
-        if not log_file.exists():
-            initial_content = ""
-            if log_format == "markdown":
-                initial_content = f"""# AI 对话日志
+# 新日志文件的文件头
+def log_header(log_file: Path) -> str:
+    if log_format == "markdown":
+        return f"""# AI 对话日志
 
 > 创建时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 > 文件说明：此文件记录 AI 助手的对话记录，包含用户信息、对话内容和相关元数据。
@@ -231,18 +249,48 @@ async def ensure_log_file(log_file: Path) -> bool:
 # 对话记录
 
 """
-            else:
-                initial_content = f"""=============== AI 对话日志 ===============
+    return f"""=============== AI 对话日志 ===============
 创建时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 说明：此文件记录 AI 助手的对话记录
 
 """
-            log_file.write_text(initial_content, encoding='utf-8')
-        
-        return os.access(log_file, os.W_OK)
-    except Exception as e:
-        print(f"日志文件初始化失败：{e}")
-        return False
+
+# 日志由后台任务批量写入，退出前会等待队列写完
+log_writer = LogWriter(header=log_header)
+coordinator.add_hook("聊天日志", log_writer.close)
+
+# 语义缓存（可选）：没有或只有很短历史的问题先按向量检索，与之前的问题足够相似时直接复用回答；
+# 只缓存没有历史时生成的回答，这些回答与上下文无关，可以提供给其他会话
+semantic_config = oai_config.get("semantic_cache", {})
+semantic_cache: Optional[SemanticCache] = None
+if semantic_config.get("enable", False):
+    embedding_model = semantic_config.get("model", "text-embedding-3-small")
+    embedding_base = semantic_config.get("api_base") or openai.base_url
+    embedding_key = semantic_config.get("api_key") or openai.api_key
+    embedding_timeout = float(semantic_config.get("timeout", 5))
+    semantic_max_history = int(semantic_config.get("max_history", 2))
+    semantic_max_length = int(semantic_config.get("max_question_length", 200))
+    persist_path = semantic_config.get("persist_path", "data/semantic_cache.npz")
+    try:
+        semantic_cache = SemanticCache(
+            SemanticCache.make_namespace(system_prompt, model, embedding_model),
+            threshold=float(semantic_config.get("threshold", 0.92)),
+            max_entries=int(semantic_config.get("max_entries", 5000)),
+            ttl=float(semantic_config.get("ttl", 86400)),
+            persist_path=str(worker_path(persist_path)) if persist_path else ""
+        )
+    except RuntimeError as e:
+        logger.warning(f"语义缓存未启用：{e}")
+
+if semantic_cache is not None:
+    async def save_semantic_cache() -> None:
+        await asyncio.to_thread(semantic_cache.save)
+
+    coordinator.add_hook("语义缓存", save_semantic_cache)
+    perf.add_source("语义缓存", lambda: f"- {semantic_cache.stats()}")
+
+coordinator.install()
+dispatcher.install()
 
 # 修改日志记录函数
 async def save_chat_log(
@@ -274,10 +322,6 @@ async def save_chat_log(
         
         log_file = date_dir / filename
         
-        if not await ensure_log_file(log_file):
-            print(f"无法写入日志文件：{log_file}")
-            return
-        
         # 获取额外元数据
         meta = {
             "timestamp": now.timestamp(),
@@ -335,7 +379,7 @@ async def save_chat_log(
             content += f"""
 ### 🔍 元数据
 ```json
-{json.dumps(meta, ensure_ascii=False, indent=2)}
+{jsonlib.dumps(meta, indent=True)}
 ```
 
 ---
@@ -364,34 +408,15 @@ async def save_chat_log(
             
             content += f"""
 [元数据]
-{json.dumps(meta, ensure_ascii=False, indent=2)}
+{jsonlib.dumps(meta, indent=True)}
 
 {"=" * 50}
 
 """
         
-        # 写入日志
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                async with asyncio.Lock():
-                    # 检查文件大小并处理
-                    if log_file.exists() and log_file.stat().st_size > 10 * 1024 * 1024:  # 10MB
-                        # 创建新的日志文件，使用时间戳区分
-                        timestamp = now.strftime("%H%M%S")
-                        new_file = log_file.with_name(f"{log_file.stem}_{timestamp}{log_file.suffix}")
-                        log_file.rename(new_file)
-                        await ensure_log_file(log_file)
-                    
-                    with open(log_file, 'a', encoding='utf-8') as f:
-                        f.write(content)
-                break
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    print(f"写入日志失败（尝试 {attempt + 1}/{max_retries}）：{e}")
-                else:
-                    await asyncio.sleep(0.1)
-                    
+        # 写入日志（入队后由后台任务写入，超过 10MB 的文件会自动归档）
+        log_writer.write(log_file, content)
+
     except Exception as e:
         print(f"日志记录失败：{e}")
 
@@ -415,20 +440,68 @@ max_retries = int(oai_config.get("max_retries", 3))
 retry_delay = float(oai_config.get("retry_delay", 2))
 retry_codes = oai_config.get("retry_codes", [429, 500, 502, 503, 504])
 
+async def embed_question(text: str):
+    """调用向量接口，失败时返回 None（本次不使用缓存）"""
+    start = time.monotonic()
+    try:
+        response = await get_client().post(
+            f"{embedding_base}/v1/embeddings",
+            headers={"Authorization": f"Bearer {embedding_key}", "Content-Type": "application/json"},
+            content=jsonlib.dumpb({"model": embedding_model, "input": text}),
+            timeout=embedding_timeout
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"状态码 {response.status_code}")
+        vector = jsonlib.response_json(response)["data"][0]["embedding"]
+    except Exception as e:
+        logger.warning(f"获取问题向量失败: {e}")
+        perf.incr("embed.errors")
+        return None
+    perf.record("embed", time.monotonic() - start)
+    return SemanticCache.normalize(vector)
+
+async def append_history(user_id: str, question: str, reply: str) -> None:
+    """把一问一答追加到对话历史，超出 max_history 轮时丢弃最早的"""
+    try:
+        # 重新读取，期间可能有其他请求更新了同一会话
+        history = load_history(await state.get_history(user_id))
+        history.append(Turn(ROLE_USER, question))
+        history.append(Turn(ROLE_ASSISTANT, reply))
+        
+        # 保持历史记录在限定条数内
+        if len(history) > max_history * 2:
+            history = history[-max_history * 2:] if max_history > 0 else []
+        await state.set_history(user_id, history)
+    except Exception as e:
+        print(f"更新对话历史时发生错误：{e}")
+        # 继续处理，不影响回复
+
+@coordinator.tracked("chat")
 async def handle_chat_common(event: MessageEvent, msg_text: str):
     # 检查群聊功能是否开启
     if isinstance(event, GroupMessageEvent):
         group_id = event.group_id
-        if not chat_enabled.get(group_id, default_chat_enabled):
+        if not await is_chat_enabled(group_id):
             return "小冰已读，不回！。"
     
     # 检查私聊权限
-    if isinstance(event, PrivateMessageEvent) and not private_chat_enabled:
+    if isinstance(event, PrivateMessageEvent) and not await is_private_chat_enabled():
         return "禁止私聊哦，加群685618193一起玩吧！也可以自己部署！"
     
     # 使用新的用户标识获取函数
-    user_id = get_user_id(event)
+    user_id = await get_user_id(event)
     
+    try:
+        async with conversation_locks.hold(user_id, msg_text, sender=event.user_id) as text:
+            if text is None:
+                # 已合并到同一会话排在前面的请求中，由它统一回复
+                return None
+            return await request_chat(event, user_id, text)
+    except KeyBusy:
+        return busy_message
+
+async def request_chat(event: MessageEvent, user_id: str, msg_text: str):
+    """读取历史、请求模型并写回历史，调用方需持有该会话的锁"""
     # 获取用户信息
     user_name = event.sender.nickname or str(event.user_id)
     group_id = None
@@ -444,19 +517,12 @@ async def handle_chat_common(event: MessageEvent, msg_text: str):
             "Content-Type": "application/json"
         }
         
-        # 准备消息历史
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        
-        # 添加历史消息（不包 system prompt）
-        user_messages = [msg for msg in chat_history[user_id] if msg["role"] != "system"]
-        messages.extend(user_messages)
-        # 添加当前消息
-        messages.append({"role": "user", "content": msg_text})
+        # 准备消息：共享的系统提示 + 历史消息 + 当前消息
+        history = load_history(await state.get_history(user_id))
+        messages = build_messages(system_message, history, msg_text)
         
         data = {
-            "model": model,
+            "model": await get_model(),
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens
@@ -478,148 +544,165 @@ async def handle_chat_common(event: MessageEvent, msg_text: str):
             )
             return error_msg
         
+        # 与上下文无关的短问题先查语义缓存
+        question_vector = None
+        cache_namespace = None
+        if (
+            semantic_cache is not None
+            and len(history) <= semantic_max_history
+            and len(msg_text) <= semantic_max_length
+        ):
+            # 运行中可能通过 /chat model 更换了模型，其他模型生成的回答不再复用
+            cache_namespace = SemanticCache.make_namespace(system_prompt, data["model"], embedding_model)
+            semantic_cache.use_namespace(cache_namespace)
+            question_vector = await embed_question(msg_text)
+            cached = semantic_cache.lookup(question_vector) if question_vector is not None else None
+            if cached is not None:
+                reply, score, cached_question = cached
+                logger.info(f"语义缓存命中（相似度 {score:.3f}）：{msg_text} ≈ {cached_question}")
+                await save_chat_log(
+                    str(event.user_id), user_name, group_id, group_name,
+                    msg_text, reply,
+                    metadata={"semantic_cache": {"score": round(score, 4), "question": cached_question}}
+                )
+                await append_history(user_id, msg_text, reply)
+                return Message(reply)
+        
         # 发送请求(添加重试逻辑)
         import httpx
-        async with httpx.AsyncClient() as client:
-            for retry in range(max_retries):
-                try:
-                    response = await client.post(
-                        f"{openai.base_url}/v1/chat/completions",
-                        headers=headers,
-                        json=data,
-                        timeout=30.0
-                    )
-                    
-                    # 如果请求成功,跳出重试循环
-                    if response.status_code == 200:
-                        break
-                        
-                    # 如果状态码在重试列表中,等待后重试
-                    if response.status_code in retry_codes:
-                        if retry < max_retries - 1:  # 如果不是最后一次重试
-                            wait_time = retry_delay * (retry + 1)  # 递增等待时间
-                            print(f"请求失败(状态码:{response.status_code}),{wait_time}秒后重试({retry + 1}/{max_retries})")
-                            await asyncio.sleep(wait_time)
-                            continue
-                            
-                    # 其他错误直接返回错误信息
-                    error_msg = f"API 请求失败：{response.status_code} - {response.text}"
-                    await save_chat_log(
-                        str(event.user_id), user_name, group_id, group_name,
-                        msg_text, "", error_msg
-                    )
-                    return error_msg
-                        
-                except httpx.TimeoutException:
-                    if retry < max_retries - 1:  # 如果不是最后一次重试
-                        wait_time = retry_delay * (retry + 1)
-                        print(f"请求超时,{wait_time}秒后重试({retry + 1}/{max_retries})")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    error_msg = "请求超时,请稍后重试"
-                    await save_chat_log(
-                        str(event.user_id), user_name, group_id, group_name,
-                        msg_text, "", error_msg
-                    )
-                    return error_msg
+        client = get_client()
+        llm_start = time.monotonic()
+        for retry in range(max_retries):
+            try:
+                response = await client.post(
+                    f"{openai.base_url}/v1/chat/completions",
+                    headers=headers,
+                    content=jsonlib.dumpb(data),
+                    timeout=30.0
+                )
+                
+                # 如果请求成功,跳出重试循环
+                if response.status_code == 200:
+                    perf.record("llm", time.monotonic() - llm_start)
+                    break
                     
-                except httpx.NetworkError:
+                # 如果状态码在重试列表中,等待后重试
+                if response.status_code in retry_codes:
                     if retry < max_retries - 1:  # 如果不是最后一次重试
-                        wait_time = retry_delay * (retry + 1)
-                        print(f"网络错误,{wait_time}秒后重试({retry + 1}/{max_retries})")
+                        wait_time = retry_delay * (retry + 1)  # 递增等待时间
+                        print(f"请求失败(状态码:{response.status_code}),{wait_time}秒后重试({retry + 1}/{max_retries})")
+                        perf.incr("llm.retries")
                         await asyncio.sleep(wait_time)
                         continue
-                    error_msg = "网络错误,请检查网络连接"
-                    await save_chat_log(
-                        str(event.user_id), user_name, group_id, group_name,
-                        msg_text, "", error_msg
-                    )
-                    return error_msg
-            
-            if response.status_code != 200:
+                        
+                # 其他错误直接返回错误信息
+                perf.incr("llm.errors")
                 error_msg = f"API 请求失败：{response.status_code} - {response.text}"
                 await save_chat_log(
                     str(event.user_id), user_name, group_id, group_name,
                     msg_text, "", error_msg
                 )
                 return error_msg
-            
-            try:
-                result = response.json()
-            except json.JSONDecodeError:
-                error_msg = "API 返回的数据格式错误"
-                await save_chat_log(
-                    str(event.user_id), user_name, group_id, group_name,
-                    msg_text, "", error_msg
-                )
-                return error_msg
-            
-            # 检查返回数据的完整性
-            if not result:
-                error_msg = "API 返回空数据"
+                    
+            except httpx.TimeoutException:
+                if retry < max_retries - 1:  # 如果不是最后一次重试
+                    wait_time = retry_delay * (retry + 1)
+                    print(f"请求超时,{wait_time}秒后重试({retry + 1}/{max_retries})")
+                    perf.incr("llm.retries")
+                    await asyncio.sleep(wait_time)
+                    continue
+                perf.incr("llm.errors")
+                error_msg = "请求超时,请稍后重试"
                 await save_chat_log(
                     str(event.user_id), user_name, group_id, group_name,
                     msg_text, "", error_msg
                 )
                 return error_msg
                 
-            if "choices" not in result or not result["choices"]:
-                error_msg = "API 返回数据不完整"
+            except httpx.NetworkError:
+                if retry < max_retries - 1:  # 如果不是最后一次重试
+                    wait_time = retry_delay * (retry + 1)
+                    print(f"网络错误,{wait_time}秒后重试({retry + 1}/{max_retries})")
+                    perf.incr("llm.retries")
+                    await asyncio.sleep(wait_time)
+                    continue
+                perf.incr("llm.errors")
+                error_msg = "网络错误,请检查网络连接"
                 await save_chat_log(
                     str(event.user_id), user_name, group_id, group_name,
                     msg_text, "", error_msg
                 )
                 return error_msg
-            
-            # 获回复内容并清理
-            try:
-                reply = result["choices"][0]["message"]["content"]
-                reply = clean_message(reply)  # 清理回复内容
-            except (KeyError, IndexError):
-                error_msg = "API 返回数据结构异常"
-                await save_chat_log(
-                    str(event.user_id), user_name, group_id, group_name,
-                    msg_text, "", error_msg
-                )
-                return error_msg
-            
-            # 检查回复内容
-            if not reply or not reply.strip():
-                error_msg = "API 返回空回复"
-                await save_chat_log(
-                    str(event.user_id), user_name, group_id, group_name,
-                    msg_text, "", error_msg
-                )
-                return error_msg
-            
-            # 记录成功的对话（使用清理后的回复）
+        
+        if response.status_code != 200:
+            error_msg = f"API 请求失败：{response.status_code} - {response.text}"
             await save_chat_log(
                 str(event.user_id), user_name, group_id, group_name,
-                msg_text, reply
+                msg_text, "", error_msg
             )
+            return error_msg
+        
+        try:
+            result = jsonlib.response_json(response)
+        except jsonlib.JSONDecodeError:
+            error_msg = "API 返回的数据格式错误"
+            await save_chat_log(
+                str(event.user_id), user_name, group_id, group_name,
+                msg_text, "", error_msg
+            )
+            return error_msg
+        
+        # 检查返回数据的完整性
+        if not result:
+            error_msg = "API 返回空数据"
+            await save_chat_log(
+                str(event.user_id), user_name, group_id, group_name,
+                msg_text, "", error_msg
+            )
+            return error_msg
             
-            # 更新对话历史（使用清理后的回复）
-            try:
-                # 确保历史记录中包含 system prompt
-                if system_prompt and (not chat_history[user_id] or chat_history[user_id][0]["role"] != "system"):
-                    chat_history[user_id].insert(0, {"role": "system", "content": system_prompt})
-                
-                chat_history[user_id].append({"role": "user", "content": msg_text})
-                chat_history[user_id].append({"role": "assistant", "content": reply})
-                
-                # 保持历史记录在限定条数内，但保留 system prompt
-                if system_prompt:
-                    while len(chat_history[user_id]) > (max_history * 2) + 1:
-                        chat_history[user_id].pop(1)
-                        chat_history[user_id].pop(1)
-                else:
-                    while len(chat_history[user_id]) > max_history * 2:
-                        chat_history[user_id].pop(0)
-            except Exception as e:
-                print(f"更新对话历史时发生错误：{e}")
-                # 继续处理，不影响回复
-            
-            return Message(reply)  # 返回清理后的回复
+        if "choices" not in result or not result["choices"]:
+            error_msg = "API 返回数据不完整"
+            await save_chat_log(
+                str(event.user_id), user_name, group_id, group_name,
+                msg_text, "", error_msg
+            )
+            return error_msg
+        
+        # 获回复内容并清理
+        try:
+            reply = result["choices"][0]["message"]["content"]
+            reply = clean_message(reply)  # 清理回复内容
+        except (KeyError, IndexError):
+            error_msg = "API 返回数据结构异常"
+            await save_chat_log(
+                str(event.user_id), user_name, group_id, group_name,
+                msg_text, "", error_msg
+            )
+            return error_msg
+        
+        # 检查回复内容
+        if not reply or not reply.strip():
+            error_msg = "API 返回空回复"
+            await save_chat_log(
+                str(event.user_id), user_name, group_id, group_name,
+                msg_text, "", error_msg
+            )
+            return error_msg
+        
+        # 记录成功的对话（使用清理后的回复）
+        await save_chat_log(
+            str(event.user_id), user_name, group_id, group_name,
+            msg_text, reply
+        )
+        
+        # 更新对话历史（使用清理后的回复）
+        await append_history(user_id, msg_text, reply)
+        # 只缓存没有历史时的回答，带上下文生成的回答不能提供给其他会话
+        if question_vector is not None and not history and semantic_cache.namespace == cache_namespace:
+            semantic_cache.add(msg_text, question_vector, reply)
+        
+        return Message(reply)  # 返回清理后的回复
         
     except Exception as e:
         error_msg = f"发生未知错误：{str(e)}"
@@ -634,16 +717,9 @@ clear_history = on_command("clear", priority=10, block=True)
 
 @clear_history.handle()
 async def handle_clear_history(event: MessageEvent):
-    user_id = get_user_id(event)
-    # 保留 system prompt
-    if system_prompt and chat_history[user_id] and chat_history[user_id][0]["role"] == "system":
-        system_message = chat_history[user_id][0]
-        chat_history[user_id].clear()
-        chat_history[user_id].append(system_message)
-    else:
-        chat_history[user_id].clear()
-        if system_prompt:
-            chat_history[user_id].append({"role": "system", "content": system_prompt})
+    user_id = await get_user_id(event)
+    # 系统提示不保存在历史中，清空即可
+    await state.set_history(user_id, [])
     await clear_history.finish("已清除对话历史记录！（系统提示已保留）")
 
 if enable_at:
@@ -652,7 +728,7 @@ if enable_at:
         # 检查群聊功能
         if isinstance(event, GroupMessageEvent):
             group_id = event.group_id
-            if not chat_enabled.get(group_id, default_chat_enabled):
+            if not await is_chat_enabled(group_id):
                 await chat_at.finish("冰冰收到，已读不回！。")
                 return
         
@@ -676,7 +752,7 @@ if enable_prefix:
         # 检查群聊功能
         if isinstance(event, GroupMessageEvent):
             group_id = event.group_id
-            if not chat_enabled.get(group_id, default_chat_enabled):
+            if not await is_chat_enabled(group_id):
                 await chat_prefix.finish("冰冰收到，已读不回！。")
                 return
         
@@ -688,7 +764,7 @@ if enable_prefix:
             
         msg_text = event.get_plaintext().strip()
         # 移除触发前缀
-        for prefix in trigger_prefixes:
+        for prefix in await get_trigger_prefixes():
             if msg_text.lower().startswith(prefix.lower()):
                 msg_text = msg_text[len(prefix):].strip()
                 break
@@ -703,7 +779,7 @@ if enable_command:
         # 检查群聊功能
         if isinstance(event, GroupMessageEvent):
             group_id = event.group_id
-            if not chat_enabled.get(group_id, default_chat_enabled):
+            if not await is_chat_enabled(group_id):
                 await chat_command.finish("冰冰收到，已读不回！")
                 return
         
@@ -733,10 +809,11 @@ def is_superuser(event: MessageEvent) -> bool:
 # 修改私聊权限检查
 async def check_private_chat(event: PrivateMessageEvent) -> bool:
     is_super = is_superuser(event)
-    print(f"用户 {event.user_id} 的权限检查：是否超级用户={is_super}, admin_private_chat={admin_private_chat}, private_chat_enabled={private_chat_enabled}")
+    private_enabled = await is_private_chat_enabled()
+    print(f"用户 {event.user_id} 的权限检查：是否超级用户={is_super}, admin_private_chat={admin_private_chat}, private_chat_enabled={private_enabled}")
     if is_super:
         return admin_private_chat
-    return private_chat_enabled
+    return private_enabled
 
 # 修改令权限检查
 async def check_command_permission(event: MessageEvent) -> bool:
@@ -748,11 +825,72 @@ async def check_command_permission(event: MessageEvent) -> bool:
 from typing import Dict
 
 # 在全局变量部分添加
-group_isolation: Dict[int, bool] = {}  # 存储每个群的隔离状态
 default_isolation = oai_config.get("group_isolation", True)  # 从配置文件获取默认值
-chat_enabled: Dict[int, bool] = {}  # 存储每个群的聊天功能状态
 default_chat_enabled = True  # 默认开聊天功能
 
+# 以下设置读写状态存储，未设置时使用配置文件中的默认值
+async def is_chat_enabled(group_id: int) -> bool:
+    default = await state.get(SETTINGS, "default_chat_enabled", default_chat_enabled)
+    return await state.get("oai.chat_enabled", str(group_id), default)
+
+async def is_group_isolated(group_id: int) -> bool:
+    default = await state.get(SETTINGS, "default_isolation", default_isolation)
+    return await state.get("oai.group_isolation", str(group_id), default)
+
+async def is_private_chat_enabled() -> bool:
+    return await state.get(SETTINGS, "private_chat_enabled", private_chat_enabled)
+
+async def get_trigger_prefixes() -> List[str]:
+    return await state.get(SETTINGS, "trigger_prefixes", sorted(trigger_prefixes))
+
+async def get_model() -> str:
+    return await state.get(SETTINGS, "model", model)
+
+async def clear_group_history(group_id: int) -> None:
+    """清理某个群的共享历史和所有成员的隔离历史"""
+    await state.clear_history(f"group_{group_id}_")
+    await state.set_history(f"group_{group_id}", [])
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+async def memory_report(limit: int = 5) -> str:
+    """统计对话历史的会话数、消息条数和估算内存，按群汇总"""
+    histories = await state.all_histories()
+    by_group: Dict[str, List[int]] = {}
+    conversations = turns = total = legacy = 0
+    for key, items in histories.items():
+        history = load_history(items)
+        if not history:
+            continue
+        size = estimate_bytes(history)
+        conversations += 1
+        turns += len(history)
+        total += size
+        legacy += estimate_legacy_bytes(history, bool(system_prompt))
+        # 键为 group_{群号} 或 group_{群号}_{QQ}，私聊统一归为一类
+        group = f"群 {key.split('_')[1]}" if key.startswith("group_") else "私聊"
+        stats = by_group.setdefault(group, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += len(history)
+        stats[2] += size
+    lines = [
+        f"对话历史：{conversations} 个会话，{turns} 条消息",
+        f"估算内存：{format_bytes(total)}（旧格式约 {format_bytes(legacy)}）",
+    ]
+    if conversations:
+        lines.append(f"平均每个会话：{format_bytes(total / conversations)}")
+    ranked = sorted(by_group.items(), key=lambda item: -item[1][2])
+    for group, (count, group_turns, size) in ranked[:limit]:
+        lines.append(f"- {group}：{count} 个会话，{group_turns} 条，{format_bytes(size)}")
+    if len(ranked) > limit:
+        lines.append(f"- 其余 {len(ranked) - limit} 组：{format_bytes(sum(item[1][2] for item in ranked[limit:]))}")
+    return "\n".join(lines)
+
 # 添加新的命令处理器
 chat_settings = on_command(
     "chat",
@@ -763,7 +901,7 @@ chat_settings = on_command(
 
 @chat_settings.handle()
 async def handle_chat_settings(event: MessageEvent):
-    global group_isolation, chat_enabled, model, default_isolation, default_chat_enabled
+    current_model = await get_model()
     
     msg_text = str(event.get_message()).strip()
     
@@ -771,21 +909,23 @@ async def handle_chat_settings(event: MessageEvent):
     if msg_text == "/chat":
         if isinstance(event, GroupMessageEvent):
             group_id = event.group_id
-            isolation_status = "开启" if group_isolation.get(group_id, default_isolation) else "关闭"
-            chat_status = "开启" if chat_enabled.get(group_id, default_chat_enabled) else "关闭"
-            current_model = recommended_models.get(model, model)
+            isolation_status = "开启" if await is_group_isolated(group_id) else "关闭"
+            chat_status = "开启" if await is_chat_enabled(group_id) else "关闭"
+            chat_default = await state.get(SETTINGS, "default_chat_enabled", default_chat_enabled)
+            isolation_default = await state.get(SETTINGS, "default_isolation", default_isolation)
             
             await chat_settings.finish(f"""群聊设置状态：
-- 聊天功能：{chat_status} (默认: {'开启' if default_chat_enabled else '关闭'})
-- 对话隔离：{isolation_status} (默认: {'开启' if default_isolation else '关闭'})
-- 当前模型：{current_model}
+- 聊天功能：{chat_status} (默认: {'开启' if chat_default else '关闭'})
+- 对话隔离：{isolation_status} (默认: {'开启' if isolation_default else '关闭'})
+- 当前模型：{recommended_models.get(current_model, current_model)}
 
 使用方法：
 /chat true/false         - 开启/关闭当前群聊功能
 /chat all true/false    - 开启/关闭所有群聊功能
 /chat group true/false   - 开启/关闭当前群隔离
 /chat group all true/false - 开启/关闭所有群隔离
-/chat model <模型名称>    - 切换对话模型""")
+/chat model <模型名称>    - 切换对话模型
+/chat mem                - 查看对话历史占用的内存""")
         else:
             await chat_settings.finish("此命令只能在群聊中使用。")
         return
@@ -797,7 +937,13 @@ async def handle_chat_settings(event: MessageEvent):
 /chat all true/false    - 开启/关闭所有群聊功能
 /chat group true/false   - 开启/关闭当前群隔离
 /chat group all true/false - 开启/关闭所有群隔离
-/chat model <模型名称>    - 切换对话模型""")
+/chat model <模型名称>    - 切换对话模型
+/chat mem                - 查看对话历史占用的内存""")
+        return
+    
+    # 内存统计不限群聊
+    if args[0] == "mem":
+        await chat_settings.finish(await memory_report())
         return
     
     # 确保是群聊环境
@@ -810,8 +956,8 @@ async def handle_chat_settings(event: MessageEvent):
     # 处理全局开关群聊功能
     if args[0] == "all" and len(args) > 1 and args[1].lower() in ['true', 'false']:
         enabled = args[1].lower() == 'true'
-        default_chat_enabled = enabled
-        chat_enabled.clear()  # 清除所有单独设置
+        await state.set(SETTINGS, "default_chat_enabled", enabled)
+        await state.clear("oai.chat_enabled")  # 清除所有单独设置
         status = "开启" if enabled else "关闭"
         await chat_settings.finish(f"已{status}所有群的聊天功能。")
         return
@@ -819,7 +965,7 @@ async def handle_chat_settings(event: MessageEvent):
     # 处理单群开关群聊功能
     if args[0].lower() in ['true', 'false']:
         enabled = args[0].lower() == 'true'
-        chat_enabled[group_id] = enabled
+        await state.set("oai.chat_enabled", str(group_id), enabled)
         status = "开启" if enabled else "关闭"
         await chat_settings.finish(f"已{status}群 {group_id} 的聊天功能。")
         return
@@ -832,17 +978,19 @@ async def handle_chat_settings(event: MessageEvent):
 推荐模型列表：
 {model_list}
 
-当前模��：{recommended_models.get(model, model)}
+当前模��：{recommended_models.get(current_model, current_model)}
 
 注意：可以使用任何模型名称，不限于推荐列表。""")
             return
             
         new_model = args[1].lower()
-        old_model = model
-        model = new_model
+        old_model = current_model
+        await state.set(SETTINGS, "model", new_model)
         
-        # 清理所有对话历史
-        chat_history.clear()
+        # 清理所有对话历史，缓存的回答也来自旧模型
+        await state.clear_history()
+        if semantic_cache is not None:
+            semantic_cache.clear()
         
         # 获取模型显示名称
         old_model_display = recommended_models.get(old_model, old_model)
@@ -860,11 +1008,11 @@ async def handle_chat_settings(event: MessageEvent):
         # 处理全局群聊隔离设置
         if args[1] == "all" and len(args) > 2 and args[2].lower() in ['true', 'false']:
             enabled = args[2].lower() == 'true'
-            default_isolation = enabled
-            group_isolation.clear()  # 清除所有单独设置
+            await state.set(SETTINGS, "default_isolation", enabled)
+            await state.clear("oai.group_isolation")  # 清除所有单独设置
             
             # 清理所有群的历史记录
-            chat_history.clear()
+            await state.clear_history()
             
             status = "开���" if enabled else "关闭"
             await chat_settings.finish(f"已{status}所有群的对话隔离。\n所有群的对话历史已清理。")
@@ -873,13 +1021,10 @@ async def handle_chat_settings(event: MessageEvent):
         # 处理单群隔离设置
         if args[1].lower() in ['true', 'false']:
             enabled = args[1].lower() == 'true'
-            group_isolation[group_id] = enabled
+            await state.set("oai.group_isolation", str(group_id), enabled)
             
             # 清理当前群的历史记录
-            group_prefix = f"group_{group_id}"
-            for key in list(chat_history.keys()):
-                if key.startswith(group_prefix):
-                    chat_history.pop(key)
+            await clear_group_history(group_id)
             
             status = "开启" if enabled else "关闭"
             await chat_settings.finish(f"已{status}群 {group_id} 的对话隔离。\n该群的对话历史已清理。")
@@ -890,7 +1035,8 @@ async def handle_chat_settings(event: MessageEvent):
 /chat all true/false    - 开启/关闭所有群聊功能
 /chat group true/false   - 开启/关闭当前群隔离
 /chat group all true/false - 开启/关闭所有群隔离
-/chat model <模型名称>    - 切换对话模型""")
+/chat model <模型名称>    - 切换对话模型
+/chat mem                - 查看对话历史占用的内存""")
 
 # 修改 available_models 为推荐模型列表
 recommended_models = {
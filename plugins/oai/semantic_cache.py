@@ -0,0 +1,176 @@
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from nonebot.log import logger
+
+from utils import jsonlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class SemanticCache:
+    """语义答案缓存：按问题的向量做余弦相似度检索，足够相似时直接返回之前的回答
+
+    向量归一化后存放在预先分配的 NumPy 矩阵中，检索是一次矩阵乘法；写满后按环形覆盖最早的条目，
+    超过 ttl 的条目在检索时忽略。namespace 由系统提示、对话模型和向量模型决定，变化后旧的条目全部作废。
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        threshold: float = 0.92,
+        max_entries: int = 5000,
+        ttl: float = 86400,
+        persist_path: str = ""
+    ):
+        if np is None:
+            raise RuntimeError("语义缓存需要安装 numpy（pip install numpy 或 uv sync --extra semantic）")
+        self.namespace = namespace
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_path = Path(persist_path) if persist_path else None
+        self.vectors = None
+        self.created = np.zeros(max_entries, dtype=np.float64)
+        self.questions: List[str] = [""] * max_entries
+        self.answers: List[str] = [""] * max_entries
+        self.size = 0
+        self.cursor = 0
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self._load()
+
+    @staticmethod
+    def make_namespace(*parts: str) -> str:
+        return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()[:12]
+
+    def use_namespace(self, namespace: str) -> None:
+        """切换到新的 namespace（如运行中更换了对话模型），旧条目是在不同条件下生成的，直接清空"""
+        if namespace != self.namespace:
+            logger.info("系统提示或模型已变化，清空语义缓存")
+            self.clear()
+            self.namespace = namespace
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @staticmethod
+    def normalize(vector) -> "np.ndarray":
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def lookup(self, vector: "np.ndarray") -> Optional[Tuple[str, float, str]]:
+        """返回 (回答, 相似度, 原问题)，没有足够相似的条目时返回 None"""
+        result = None
+        if self.size and self.vectors is not None and vector.shape[0] == self.vectors.shape[1]:
+            scores = self.vectors[:self.size] @ vector
+            if self.ttl > 0:
+                expired = self.created[:self.size] < time.time() - self.ttl
+                scores[expired] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                result = (self.answers[best], float(scores[best]), self.questions[best])
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        total = self.hits + self.misses
+        if total % 100 == 0:
+            logger.info(f"语义缓存：{total} 次查询，命中率 {self.hit_ratio * 100:.1f}%，条目 {self.size}")
+        return result
+
+    def add(self, question: str, vector: "np.ndarray", answer: str) -> None:
+        if self.vectors is None:
+            self.vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        elif vector.shape[0] != self.vectors.shape[1]:
+            logger.warning(f"向量维度变化（{self.vectors.shape[1]} -> {vector.shape[0]}），清空语义缓存")
+            self.clear()
+            self.vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        index = self.cursor
+        self.vectors[index] = vector
+        self.created[index] = time.time()
+        self.questions[index] = question
+        self.answers[index] = answer
+        self.cursor = (self.cursor + 1) % self.max_entries
+        self.size = min(self.size + 1, self.max_entries)
+        self.dirty = True
+
+    def clear(self) -> None:
+        self.vectors = None
+        self.created[:] = 0
+        self.questions = [""] * self.max_entries
+        self.answers = [""] * self.max_entries
+        self.size = 0
+        self.cursor = 0
+        self.dirty = True
+
+    def stats(self) -> str:
+        return (
+            f"条目 {self.size}/{self.max_entries}，命中 {self.hits}，未命中 {self.misses}，"
+            f"命中率 {self.hit_ratio * 100:.0f}%"
+        )
+
+    def save(self) -> None:
+        """写入 persist_path：向量和时间戳存 .npz，问题和回答存同名 .json"""
+        if self.persist_path is None or not self.dirty:
+            return
+        self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+        order = [(self.cursor + i) % self.max_entries for i in range(self.max_entries)] \
+            if self.size == self.max_entries else list(range(self.size))
+        vectors = self.vectors[order] if self.vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        tmp_path = self.persist_path.with_name(self.persist_path.name + ".tmp.npz")
+        np.savez(tmp_path, vectors=vectors, created=self.created[order])
+        os.replace(tmp_path, self.persist_path)
+        meta_path = self.persist_path.with_suffix(".json")
+        meta_tmp = meta_path.with_name(meta_path.name + ".tmp")
+        meta_tmp.write_bytes(jsonlib.dumpb({
+            "namespace": self.namespace,
+            "questions": [self.questions[i] for i in order],
+            "answers": [self.answers[i] for i in order],
+        }))
+        os.replace(meta_tmp, meta_path)
+        self.dirty = False
+        logger.info(f"语义缓存已保存：{self.size} 条")
+
+    def _load(self) -> None:
+        if self.persist_path is None or not self.persist_path.exists():
+            return
+        meta_path = self.persist_path.with_suffix(".json")
+        try:
+            meta = jsonlib.loads(meta_path.read_bytes())
+            if meta.get("namespace") != self.namespace:
+                logger.info("系统提示或模型已变化，不加载旧的语义缓存")
+                return
+            with np.load(self.persist_path) as data:
+                vectors, created = data["vectors"], data["created"]
+            keep = created >= time.time() - self.ttl if self.ttl > 0 else np.ones(len(created), dtype=bool)
+            # 只保留未过期的最新 max_entries 条
+            indices = np.nonzero(keep)[0][-self.max_entries:]
+            if len(indices) == 0:
+                return
+            self.vectors = np.zeros((self.max_entries, vectors.shape[1]), dtype=np.float32)
+            self.vectors[:len(indices)] = vectors[indices]
+            self.created[:len(indices)] = created[indices]
+            for slot, index in enumerate(indices):
+                self.questions[slot] = meta["questions"][index]
+                self.answers[slot] = meta["answers"][index]
+            self.size = len(indices)
+            self.cursor = self.size % self.max_entries
+            logger.info(f"已加载语义缓存：{self.size} 条")
+        except Exception as e:
+            logger.error(f"加载语义缓存失败: {e}")
+            self.clear()
+            self.dirty = False
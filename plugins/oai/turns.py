@@ -0,0 +1,71 @@
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# 角色字符串全局只保留一份
+ROLE_SYSTEM = sys.intern("system")
+ROLE_USER = sys.intern("user")
+ROLE_ASSISTANT = sys.intern("assistant")
+ROLES = {role: role for role in (ROLE_SYSTEM, ROLE_USER, ROLE_ASSISTANT)}
+
+
+class Turn:
+    """一轮对话中的一条消息
+
+    使用 __slots__ 代替 {"role": ..., "content": ...} 字典，单条开销从 184 字节降到 48 字节；
+    只在构建请求时才转换为 API 需要的字典格式。存储到共享状态后端时序列化为 [role, content]。
+    """
+
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: str):
+        self.role = ROLES.get(role) or sys.intern(role)
+        self.content = content
+
+    @classmethod
+    def load(cls, item: Any) -> "Turn":
+        """从状态存储读出的数据还原：已是 Turn 时原样返回，兼容旧的字典格式"""
+        if isinstance(item, Turn):
+            return item
+        if isinstance(item, dict):
+            return cls(item["role"], item["content"])
+        role, content = item
+        return cls(role, content)
+
+    def to_api(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+    def to_json(self) -> List[str]:
+        return [self.role, self.content]
+
+    def __repr__(self) -> str:
+        return f"Turn({self.role!r}, {self.content!r})"
+
+
+def load_history(items: Iterable[Any]) -> List[Turn]:
+    """读取对话历史，跳过旧版本存入的 system 消息（系统提示不再逐会话保存）"""
+    turns = [Turn.load(item) for item in items]
+    return [turn for turn in turns if turn.role is not ROLE_SYSTEM]
+
+
+def build_messages(system_message: Optional[Dict[str, str]], history: Sequence[Turn], question: str) -> List[dict]:
+    """构建请求用的 messages，系统提示使用所有请求共享的同一个字典"""
+    messages = [system_message] if system_message else []
+    messages.extend(turn.to_api() for turn in history)
+    messages.append({"role": ROLE_USER, "content": question})
+    return messages
+
+
+def estimate_bytes(history: Sequence[Turn]) -> int:
+    """估算一段对话历史占用的内存：列表、Turn 对象和消息文本，角色字符串共享不计"""
+    return sys.getsizeof(history) + sum(sys.getsizeof(turn) + sys.getsizeof(turn.content) for turn in history)
+
+
+def estimate_legacy_bytes(history: Sequence[Turn], with_system: bool) -> int:
+    """按旧格式（每条一个字典，每个会话再存一份系统提示字典）估算，用于对比"""
+    dict_size = sys.getsizeof({"role": "", "content": ""})
+    count = len(history) + (1 if with_system else 0)
+    return (
+        sys.getsizeof([None] * count)
+        + count * dict_size
+        + sum(sys.getsizeof(turn.content) for turn in history)
+    )
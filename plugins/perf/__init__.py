@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import tomli
+from nonebot import on_command, get_driver
+from nonebot.adapters.onebot.v11 import MessageEvent
+from nonebot.plugin import PluginMetadata
+
+from utils.dispatcher import dispatcher
+from utils.ingest import event_filter
+from utils.perf import LoopLagMonitor, load_perf_config, perf
+from utils.shutdown import coordinator
+
+__plugin_meta__ = PluginMetadata(
+    name="性能统计",
+    description="在聊天中查看最近一段时间的延迟、排队和错误率",
+    usage="""管理命令：
+- /perf：查看性能统计
+- /perf reset：清空统计窗口""",
+    config=None,
+)
+
+config_file = Path("config.toml")
+with open(config_file, "rb") as f:
+    config = tomli.load(f)
+superusers = set(config.get("admin", {}).get("superusers", []))
+
+perf_config = load_perf_config()
+perf.configure(perf_config)
+
+# 定时测量事件循环的唤醒延迟
+loop_monitor = LoopLagMonitor(
+    perf,
+    interval=float(perf_config.get("loop_interval", 0.5)),
+    warn_threshold=float(perf_config.get("loop_warn", 0.5))
+)
+get_driver().on_startup(loop_monitor.start)
+coordinator.add_hook("事件循环监控", loop_monitor.stop)
+
+
+def queue_report() -> str:
+    """进行中的任务和入口过滤统计"""
+    in_flight = "，".join(f"{kind} {count}" for kind, count in coordinator.in_flight.items()) or "无"
+    return (
+        f"- 进行中：{in_flight}\n"
+        f"- 入口过滤：{event_filter.report()}"
+    )
+
+
+def dispatch_report() -> str:
+    """出站队列的发送、合并、失败计数，以及延迟最高的几个会话"""
+    return "\n".join(f"- {line}" for line in dispatcher.report().splitlines())
+
+
+perf.add_source("队列", queue_report)
+perf.add_source("消息发送", dispatch_report)
+
+
+def is_superuser(event: MessageEvent) -> bool:
+    return event.user_id in superusers
+
+
+perf_command = on_command("perf", permission=is_superuser, priority=5, block=True)
+
+
+@perf_command.handle()
+async def handle_perf(event: MessageEvent):
+    args = event.get_plaintext().strip().split()[1:]
+    if args == ["reset"]:
+        perf.reset()
+        await perf_command.finish("已清空性能统计窗口")
+        return
+    if args:
+        await perf_command.finish("使用方法：\n/perf - 查看性能统计\n/perf reset - 清空统计窗口")
+        return
+    await perf_command.finish(await perf.report())
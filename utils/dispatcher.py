@@ -0,0 +1,318 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import tomli
+from nonebot.log import logger
+
+from .perf import perf
+
+# 经过发送队列的接口及其目标会话
+SEND_APIS = {"send_msg", "send_group_msg", "send_private_msg"}
+
+# 优先级，数值越小越先发送：短文本（多为错误提示）> 普通文本 > 图片、语音等大消息
+PRIORITY_SHORT = 0
+PRIORITY_TEXT = 1
+PRIORITY_MEDIA = 2
+MEDIA_SEGMENTS = {"image", "record", "video"}
+
+
+class TokenBucket:
+    """令牌桶：平均每秒 rate 条，最多连续发送 burst 条"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """距离下一个可用令牌的秒数"""
+        self._refill()
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+
+class Outgoing:
+    """一条排队中的消息，由 API 调用钩子创建，发送完成后在 on_called_api 中结束"""
+
+    __slots__ = ("target", "api", "data", "priority", "seq", "queued", "go", "done", "mergeable")
+
+    def __init__(self, target: Tuple[str, int], api: str, data: Dict[str, Any], priority: int, seq: int,
+                 mergeable: bool):
+        loop = asyncio.get_running_loop()
+        self.target = target
+        self.api = api
+        self.data = data
+        self.priority = priority
+        self.seq = seq
+        self.queued = time.monotonic()
+        self.mergeable = mergeable
+        # go：轮到发送时置位，结果为 None 表示自行发送，否则为合并到的那条消息
+        self.go: asyncio.Future = loop.create_future()
+        # done：实际发送完成，结果为接口返回值
+        self.done: asyncio.Future = loop.create_future()
+
+    def merge_key(self) -> tuple:
+        # 只有接口和除消息外的参数都相同的消息才能合并
+        return self.api, repr(sorted((k, v) for k, v in self.data.items() if k != "message"))
+
+
+class TargetQueue:
+    """单个群或私聊的发送队列和统计"""
+
+    def __init__(self, rate: float, burst: int):
+        self.bucket = TokenBucket(rate, burst)
+        self.pending: List[Outgoing] = []
+        self.task: Optional[asyncio.Task] = None
+        self.latencies: Deque[float] = deque(maxlen=200)
+        self.sent = 0
+        self.merged = 0
+        self.failed = 0
+        self.max_depth = 0
+
+
+class OutboundDispatcher:
+    """出站消息调度：按群限速、合并相邻文本、短消息优先于图片，并统计每个群的发送延迟
+
+    通过 Bot 的 API 调用钩子接管 send_msg / send_group_msg / send_private_msg，
+    插件里的 matcher.send / finish / bot.send 都会自动排队，无需修改调用方式。
+    同一会话的消息依次发送，前一条发送完成后才发下一条；排队期间到达的纯文本消息会合并成一条。
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.rate = 1.0
+        self.burst = 5
+        self.global_bucket = TokenBucket(10.0, 20)
+        self.merge = True
+        self.merge_max_length = 1500
+        self.short_length = 120
+        self.aging = 10.0
+        self.send_timeout = 15.0
+        self.targets: Dict[Tuple[str, int], TargetQueue] = {}
+        self.active: Dict[int, Outgoing] = {}
+        self._seq = itertools.count()
+        self._installed = False
+
+    def configure(self, config: dict) -> None:
+        self.enabled = config.get("enable", self.enabled)
+        self.rate = float(config.get("rate", self.rate))
+        self.burst = int(config.get("burst", self.burst))
+        self.global_bucket = TokenBucket(
+            float(config.get("global_rate", self.global_bucket.rate)),
+            int(config.get("global_burst", self.global_bucket.burst))
+        )
+        self.merge = config.get("merge", self.merge)
+        self.merge_max_length = int(config.get("merge_max_length", self.merge_max_length))
+        self.short_length = int(config.get("short_length", self.short_length))
+        self.aging = float(config.get("aging", self.aging))
+        self.send_timeout = float(config.get("send_timeout", self.send_timeout))
+
+    def install(self) -> None:
+        """注册 API 调用钩子，多次调用只生效一次"""
+        if self._installed:
+            return
+        self._installed = True
+        from nonebot.adapters import Bot
+
+        self.configure(load_dispatch_config())
+        Bot.on_calling_api(self._before_send)
+        Bot.on_called_api(self._after_send)
+        if self.enabled:
+            logger.info(f"出站消息队列：每个会话 {self.rate:g} 条/秒，突发 {self.burst} 条")
+
+    @staticmethod
+    def _target(api: str, data: Dict[str, Any]) -> Optional[Tuple[str, int]]:
+        if api == "send_group_msg" or (api == "send_msg" and data.get("message_type") == "group"):
+            return ("group", int(data["group_id"])) if data.get("group_id") is not None else None
+        if data.get("user_id") is not None:
+            return "private", int(data["user_id"])
+        return None
+
+    def _classify(self, message: Any) -> Tuple[int, bool]:
+        """返回 (优先级, 是否为可合并的纯文本)"""
+        from nonebot.adapters.onebot.v11 import Message, MessageSegment
+
+        if isinstance(message, MessageSegment):
+            message = Message(message)
+        if not isinstance(message, Message):
+            # 字符串消息可能带 CQ 码，只按长度分级，不参与合并
+            return (PRIORITY_SHORT if len(str(message)) <= self.short_length else PRIORITY_TEXT), False
+        types = {segment.type for segment in message}
+        if types & MEDIA_SEGMENTS:
+            return PRIORITY_MEDIA, False
+        text_only = types <= {"text"}
+        length = len(message.extract_plain_text())
+        return (PRIORITY_SHORT if length <= self.short_length else PRIORITY_TEXT), text_only
+
+    async def _before_send(self, bot, api: str, data: Dict[str, Any]) -> None:
+        if not self.enabled or api not in SEND_APIS:
+            return
+        target = self._target(api, data)
+        if target is None:
+            return
+        from nonebot.exception import MockApiException
+
+        priority, text_only = self._classify(data.get("message"))
+        item = Outgoing(target, api, data, priority, next(self._seq), self.merge and text_only)
+        queue = self.targets.get(target)
+        if queue is None:
+            queue = self.targets[target] = TargetQueue(self.rate, self.burst)
+
+        while True:
+            queue.pending.append(item)
+            queue.max_depth = max(queue.max_depth, len(queue.pending))
+            if queue.task is None or queue.task.done():
+                queue.task = asyncio.create_task(self._run(queue))
+
+            leader = await item.go
+            if leader is None:
+                # 轮到自己，返回后由 nonebot 实际调用接口
+                self.active[id(data)] = item
+                return
+            # 内容已合并到 leader 中，等它发送完成后直接返回其结果
+            try:
+                result = await asyncio.wait_for(asyncio.shield(leader.done), timeout=self.send_timeout)
+            except asyncio.TimeoutError:
+                # leader 仍可能发送成功，内容已包含在其中，单独重发会重复
+                logger.warning(f"合并发送的消息 {self.send_timeout:g} 秒未完成，不再单独发送")
+                raise MockApiException(None)
+            except Exception:
+                # 合并的消息确实发送失败，重新排队单独发送，仍然受限速约束
+                item.go = asyncio.get_running_loop().create_future()
+                item.mergeable = False
+                continue
+            queue.merged += 1
+            raise MockApiException(result)
+
+    async def _after_send(self, bot, exception: Optional[Exception], api: str, data: Dict[str, Any],
+                          result: Any) -> None:
+        item = self.active.pop(id(data), None)
+        if item is None:
+            return
+        queue = self.targets[item.target]
+        latency = time.monotonic() - item.queued
+        queue.latencies.append(latency)
+        if exception is not None:
+            queue.failed += 1
+            perf.incr("send.errors")
+            if not item.done.done():
+                item.done.set_exception(exception)
+                # 没有合并的消息在等待时避免“未获取的异常”警告
+                item.done.exception()
+        else:
+            queue.sent += 1
+            perf.record("send", latency)
+            if not item.done.done():
+                item.done.set_result(result)
+
+    def _pick(self, queue: TargetQueue) -> Outgoing:
+        # 等待越久优先级越高，避免图片在持续的文本消息中一直排不上
+        now = time.monotonic()
+        return min(queue.pending, key=lambda item: (item.priority - (now - item.queued) / self.aging, item.seq))
+
+    def _collect_merge(self, queue: TargetQueue, first: Outgoing) -> List[Outgoing]:
+        """取出与 first 可合并的排队文本，按到达顺序排列，总长度不超过 merge_max_length"""
+        key = first.merge_key()
+        candidates = sorted(
+            (item for item in queue.pending if item.mergeable and item.merge_key() == key),
+            key=lambda item: item.seq
+        )
+        group: List[Outgoing] = []
+        length = 0
+        for item in candidates:
+            size = len(item.data["message"].extract_plain_text())
+            if group and length + size > self.merge_max_length:
+                break
+            group.append(item)
+            length += size
+        return group if first in group else [first]
+
+    async def _run(self, queue: TargetQueue) -> None:
+        from nonebot.adapters.onebot.v11 import Message, MessageSegment
+
+        while queue.pending:
+            # 先等令牌，期间到达的高优先级消息可以插到前面
+            wait = max(queue.bucket.wait_time(), self.global_bucket.wait_time())
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            # 跳过调用方已取消的消息
+            queue.pending = [item for item in queue.pending if not item.go.done()]
+            if not queue.pending:
+                break
+            first = self._pick(queue)
+            group = self._collect_merge(queue, first) if first.mergeable else [first]
+            for item in group:
+                queue.pending.remove(item)
+            leader = group[0]
+            if len(group) > 1:
+                merged = Message()
+                for index, item in enumerate(group):
+                    if index:
+                        merged += MessageSegment.text("\n")
+                    merged += Message(item.data["message"])
+                leader.data["message"] = merged
+            queue.bucket.take()
+            self.global_bucket.take()
+            leader.go.set_result(None)
+            for item in group[1:]:
+                item.go.set_result(leader)
+            # 等这一条发送完成再发下一条，保证同一会话内的顺序
+            try:
+                await asyncio.wait_for(asyncio.shield(leader.done), timeout=self.send_timeout)
+            except Exception:
+                pass
+            finally:
+                self.active.pop(id(leader.data), None)
+
+    def pending(self) -> int:
+        return sum(len(queue.pending) for queue in self.targets.values())
+
+    def report(self, limit: int = 5) -> str:
+        """发送统计，按平均延迟列出最慢的几个会话"""
+        if not self.enabled:
+            return "出站队列未启用"
+        sent = sum(queue.sent for queue in self.targets.values())
+        merged = sum(queue.merged for queue in self.targets.values())
+        failed = sum(queue.failed for queue in self.targets.values())
+        lines = [f"已发送 {sent} 条，合并 {merged} 条，失败 {failed} 条，排队中 {self.pending()} 条"]
+        ranked = sorted(
+            ((target, queue) for target, queue in self.targets.items() if queue.latencies),
+            key=lambda pair: -sum(pair[1].latencies) / len(pair[1].latencies)
+        )
+        for (kind, target_id), queue in ranked[:limit]:
+            latencies = sorted(queue.latencies)
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            name = "群" if kind == "group" else "私聊"
+            lines.append(
+                f"{name} {target_id}：p50 {p50 * 1000:.0f}ms，p95 {p95 * 1000:.0f}ms，最大排队 {queue.max_depth}"
+            )
+        return "\n".join(lines)
+
+
+def load_dispatch_config() -> dict:
+    """读取 config.toml 中的 [dispatch] 配置"""
+    config_file = Path("config.toml")
+    if not config_file.exists():
+        return {}
+    with open(config_file, "rb") as f:
+        return tomli.load(f).get("dispatch", {})
+
+
+dispatcher = OutboundDispatcher()
@@ -0,0 +1,30 @@
+from typing import Optional
+
+import httpx
+
+from .shutdown import coordinator
+
+# 所有插件共享的 HTTP 客户端，复用连接池，避免每次请求重新建立 TCP/TLS 连接
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """获取（必要时创建）共享的 HTTP 客户端，请求超时由调用方按请求传入"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=60.0,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+# 只注册一次，客户端重建后关闭的仍是当前的那个
+coordinator.add_hook("HTTP 连接池", close_client)
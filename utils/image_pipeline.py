@@ -0,0 +1,203 @@
+import io
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+from nonebot.log import logger
+
+from .perf import perf
+from .process_pool import configure_pool, run_in_pool
+
+# 支持的输出格式，original 表示保持原格式
+OUTPUT_FORMATS = {
+    "jpeg": "JPEG",
+    "jpg": "JPEG",
+    "webp": "WEBP",
+    "png": "PNG",
+    "original": None,
+}
+
+
+def _flatten(image: Image.Image, background=(255, 255, 255)) -> Image.Image:
+    """将带透明通道的图片合成到纯色背景上"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        canvas = Image.new("RGB", image.size, background)
+        canvas.paste(image, mask=image.getchannel("A"))
+        return canvas
+    return image.convert("RGB")
+
+
+def process_image(
+    image: Image.Image,
+    max_dimension: int = 0,
+    output_format: str = "jpeg",
+    quality: int = 85,
+    strip_metadata: bool = True,
+    optimize: bool = False,
+) -> Tuple[bytes, Dict[str, float]]:
+    """缩放、转换格式并去除元数据，返回 (图片数据, 各阶段耗时)
+
+    optimize 为 True 时 JPEG 额外做一遍 Huffman 表优化，体积略小但编码更慢。
+    """
+    timings: Dict[str, float] = {}
+    source_format = image.format or "PNG"
+
+    start = time.perf_counter()
+    if max_dimension and max(image.size) > max_dimension:
+        image = image.copy()
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    timings["resize"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pil_format = OUTPUT_FORMATS.get(output_format.lower(), "JPEG") or source_format
+    if pil_format == "JPEG":
+        image = _flatten(image)
+    elif image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA")
+    timings["convert"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    save_kwargs = {}
+    if pil_format in ("JPEG", "WEBP"):
+        save_kwargs["quality"] = quality
+    if pil_format == "JPEG" and optimize:
+        save_kwargs["optimize"] = True
+    if not strip_metadata:
+        for key in ("exif", "icc_profile"):
+            if key in image.info:
+                save_kwargs[key] = image.info[key]
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, **save_kwargs)
+    timings["encode"] = time.perf_counter() - start
+
+    return buffer.getvalue(), timings
+
+
+def process_image_bytes(
+    data: bytes,
+    max_dimension: int = 0,
+    output_format: str = "jpeg",
+    quality: int = 85,
+    strip_metadata: bool = True,
+    optimize: bool = False,
+) -> Tuple[bytes, Dict[str, float]]:
+    """解码图片数据后执行后处理，供进程池调用"""
+    start = time.perf_counter()
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        decode_time = time.perf_counter() - start
+        result, timings = process_image(
+            image, max_dimension, output_format, quality, strip_metadata, optimize
+        )
+    return result, {"decode": decode_time, **timings}
+
+
+def compose_grid(
+    images: List[bytes],
+    gap: int = 8,
+    background=(255, 255, 255),
+    quality: int = 90,
+) -> bytes:
+    """将多张图片拼接为网格图（按第一张图的尺寸排列），供进程池调用"""
+    decoded = []
+    for data in images:
+        with Image.open(io.BytesIO(data)) as image:
+            decoded.append(_flatten(image))
+
+    cell_width, cell_height = decoded[0].size
+    columns = math.ceil(math.sqrt(len(decoded)))
+    rows = math.ceil(len(decoded) / columns)
+    canvas = Image.new(
+        "RGB",
+        (columns * cell_width + (columns - 1) * gap, rows * cell_height + (rows - 1) * gap),
+        background,
+    )
+    for index, image in enumerate(decoded):
+        if image.size != (cell_width, cell_height):
+            image = image.resize((cell_width, cell_height), Image.Resampling.LANCZOS)
+        row, column = divmod(index, columns)
+        canvas.paste(image, (column * (cell_width + gap), row * (cell_height + gap)))
+
+    buffer = io.BytesIO()
+    canvas.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class ImagePipeline:
+    """出站图片后处理：缩放、格式转换、去除元数据"""
+
+    def __init__(
+        self,
+        enable: bool = False,
+        max_dimension: int = 1280,
+        output_format: str = "jpeg",
+        quality: int = 85,
+        strip_metadata: bool = True,
+        optimize: bool = False,
+        timeout: float = 30,
+        workers: int = 2,
+    ):
+        if output_format.lower() not in OUTPUT_FORMATS:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        self.enable = enable
+        self.max_dimension = max_dimension
+        self.output_format = output_format.lower()
+        self.quality = quality
+        self.strip_metadata = strip_metadata
+        self.optimize = optimize
+        self.timeout = timeout
+        configure_pool(workers)
+        # 最近一次及累计的各阶段耗时
+        self.last_timings: Dict[str, float] = {}
+        self.total_timings: Dict[str, float] = {}
+        self.processed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> "ImagePipeline":
+        """从配置段创建"""
+        config = config or {}
+        return cls(
+            enable=config.get("enable", False),
+            max_dimension=config.get("max_dimension", 1280),
+            output_format=config.get("format", "jpeg"),
+            quality=config.get("quality", 85),
+            strip_metadata=config.get("strip_metadata", True),
+            optimize=config.get("optimize", False),
+            timeout=config.get("timeout", 30),
+            workers=config.get("workers", 2),
+        )
+
+    @property
+    def options(self) -> tuple:
+        return (self.max_dimension, self.output_format, self.quality, self.strip_metadata, self.optimize)
+
+    def _record(self, size_in: int, size_out: int, timings: Dict[str, float]) -> None:
+        self.processed += 1
+        self.bytes_in += size_in
+        self.bytes_out += size_out
+        self.last_timings = timings
+        for stage, cost in timings.items():
+            self.total_timings[stage] = self.total_timings.get(stage, 0.0) + cost
+            perf.record(f"postprocess_{stage}", cost)
+        stage_text = ", ".join(f"{stage}={cost * 1000:.1f}ms" for stage, cost in timings.items())
+        logger.info(f"图片后处理完成：{size_in / 1024:.1f}KB -> {size_out / 1024:.1f}KB ({stage_text})")
+
+    async def process(self, data: bytes) -> bytes:
+        """在进程池中处理图片数据，未启用或失败时返回原图"""
+        if not self.enable:
+            return data
+        start = time.monotonic()
+        try:
+            result, timings = await run_in_pool(process_image_bytes, data, *self.options, timeout=self.timeout)
+        except Exception as e:
+            perf.incr("postprocess.errors")
+            logger.warning(f"图片后处理失败，使用原图: {e}")
+            return data
+        # 含排队和进程间传输的总耗时，各阶段耗时在 _record 中记录
+        perf.record("postprocess", time.monotonic() - start)
+        self._record(len(data), len(result), timings)
+        return result
@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+import tomli
+from nonebot.log import logger
+
+
+class EventFilter:
+    """入口过滤：丢弃重复投递和积压过久的事件，避免重复调用付费接口、重复回复
+
+    OneBot 实现重连或重试时可能把同一条消息推送两次，按 (self_id, 事件类型, message_id) 在时间窗口内去重；
+    撤回通知带的是被撤回消息的 message_id，键中包含事件类型，不会和原消息冲突。
+    长时间断线恢复后推送的积压事件按事件时间判断，超过 max_event_age 秒的直接丢弃。
+    """
+
+    def __init__(self):
+        self.window = 300.0
+        self.max_entries = 10000
+        self.max_event_age = 120.0
+        self.seen: "OrderedDict[Tuple[str, str, str, int], float]" = OrderedDict()
+        self.duplicates = 0
+        self.stale = 0
+        self.passed = 0
+        self._installed = False
+
+    def configure(self, config: dict) -> None:
+        self.window = float(config.get("dedup_window", self.window))
+        self.max_entries = int(config.get("dedup_max_entries", self.max_entries))
+        self.max_event_age = float(config.get("max_event_age", self.max_event_age))
+
+    def install(self) -> None:
+        """注册事件预处理器，多次调用只生效一次"""
+        if self._installed:
+            return
+        self._installed = True
+        from nonebot.adapters import Event
+        from nonebot.exception import IgnoredException
+        from nonebot.message import event_preprocessor
+
+        self.configure(load_ingest_config())
+
+        @event_preprocessor
+        async def drop_duplicate_and_stale(event: Event):
+            reason = self.check(event)
+            if reason is not None:
+                raise IgnoredException(reason)
+
+    def _evict(self, now: float) -> None:
+        # 按到达顺序排列，从最早的开始淘汰过期和超出上限的记录
+        while self.seen:
+            key, arrived = next(iter(self.seen.items()))
+            if arrived >= now - self.window and len(self.seen) < self.max_entries:
+                break
+            del self.seen[key]
+
+    def check(self, event) -> Optional[str]:
+        """返回丢弃原因，应正常处理时返回 None"""
+        if event.get_type() == "meta_event":
+            return None
+        now = time.time()
+        event_time = getattr(event, "time", None)
+        if self.max_event_age > 0 and event_time and now - event_time > self.max_event_age:
+            self.stale += 1
+            logger.debug(f"丢弃积压事件：{now - event_time:.0f} 秒前")
+            return "事件已过期"
+
+        message_id = getattr(event, "message_id", None)
+        if message_id is not None and self.window > 0:
+            key = (
+                str(getattr(event, "self_id", "")),
+                getattr(event, "post_type", ""),
+                getattr(event, "notice_type", ""),
+                message_id
+            )
+            self._evict(now)
+            if key in self.seen:
+                self.duplicates += 1
+                logger.debug(f"丢弃重复事件：{key}")
+                return "重复事件"
+            self.seen[key] = now
+        self.passed += 1
+        return None
+
+    def report(self) -> str:
+        return f"已处理 {self.passed} 个，丢弃重复 {self.duplicates} 个、过期 {self.stale} 个"
+
+
+def load_ingest_config() -> dict:
+    """读取 config.toml 中的 [ingest] 配置"""
+    config_file = Path("config.toml")
+    if not config_file.exists():
+        return {}
+    with open(config_file, "rb") as f:
+        return tomli.load(f).get("ingest", {})
+
+
+event_filter = EventFilter()
@@ -0,0 +1,54 @@
+import json
+from typing import Any, Union
+
+# JSON 序列化：安装了 orjson 时使用 orjson，否则退回标准库 json
+# 输出与标准库 ensure_ascii=False 一致（中文不转义），无法直接序列化的对象（如 datetime）转成字符串
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+# orjson 的解析错误是 json.JSONDecodeError 的子类，统一捕获这一个即可
+JSONDecodeError = json.JSONDecodeError
+
+
+def _default(obj: Any) -> Any:
+    # 自定义类型可以提供 to_json() 返回可序列化的值
+    to_json = getattr(obj, "to_json", None)
+    if callable(to_json):
+        return to_json()
+    return str(obj)
+
+
+if orjson is not None:
+    def dumpb(obj: Any, indent: bool = False) -> bytes:
+        """序列化为 UTF-8 字节，用于请求体和文件写入"""
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def dumps(obj: Any, indent: bool = False) -> str:
+        return dumpb(obj, indent).decode("utf-8")
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        return orjson.loads(data)
+else:
+    def dumps(obj: Any, indent: bool = False) -> str:
+        if indent:
+            return json.dumps(obj, ensure_ascii=False, default=_default, indent=2)
+        return json.dumps(obj, ensure_ascii=False, default=_default, separators=(",", ":"))
+
+    def dumpb(obj: Any, indent: bool = False) -> bytes:
+        """序列化为 UTF-8 字节，用于请求体和文件写入"""
+        return dumps(obj, indent).encode("utf-8")
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+
+def response_json(response) -> Any:
+    """解析 httpx 响应体，替代 response.json()"""
+    return loads(response.content)
@@ -0,0 +1,134 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Hashable, List, Optional
+
+MODES = ("wait", "merge", "reject")
+
+
+class KeyBusy(RuntimeError):
+    """reject 模式下会话正在处理，或排队的请求已达上限"""
+
+
+class _Pending:
+    __slots__ = ("sender", "text", "taken")
+
+    def __init__(self, sender: Hashable, text: str):
+        self.sender = sender
+        self.text = text
+        self.taken = False
+
+
+class _Entry:
+    __slots__ = ("lock", "users", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+        self.pending: List[_Pending] = []
+
+
+class KeyedLocks:
+    """按会话键加锁：同一会话的请求依次执行，不同会话互不影响
+
+    每个键只在有请求持有或等待时才保留，最后一个请求结束后立即移除，锁的数量不会随会话数增长。
+    会话忙时的处理方式由 mode 决定：
+    - wait：排队等待前一个请求完成
+    - merge：同一发送者排队期间的消息合并成一条，由其中最早排队的请求一起发送，其余请求不再回复；
+      共享历史的群里其他人的消息不合并，按顺序排在后面
+    - reject：直接拒绝
+    设置 backend 后，持有进程内的锁时还会占用状态存储中的同名槽位，用于同一会话可能由多个工作进程处理的情况。
+    """
+
+    def __init__(self, mode: str = "wait", max_waiters: int = 0, separator: str = "\n"):
+        self.mode = mode
+        self.max_waiters = max_waiters
+        self.separator = separator
+        # 跨进程互斥使用的状态存储（StateBackend），为 None 时只在进程内加锁
+        self.backend: Any = None
+        self.backend_ttl = 180.0
+        self.poll_interval = 0.2
+        self.entries: Dict[str, _Entry] = {}
+        self.waited = 0
+        self.merged = 0
+        self.rejected = 0
+
+    def configure(self, config: dict) -> None:
+        mode = config.get("mode", self.mode)
+        if mode not in MODES:
+            raise ValueError(f"未知的会话排队方式: {mode}（可选 {' / '.join(MODES)}）")
+        self.mode = mode
+        self.max_waiters = int(config.get("max_waiters", self.max_waiters))
+        self.separator = config.get("merge_separator", self.separator)
+        self.backend_ttl = float(config.get("lock_ttl", self.backend_ttl))
+
+    async def _acquire_backend(self, key: str) -> str:
+        """占用状态存储中的槽位，其他进程持有时轮询等待，reject 模式下直接拒绝"""
+        while True:
+            token = await self.backend.acquire_slot(f"lock.{key}", 1, self.backend_ttl)
+            if token is not None:
+                return token
+            if self.mode == "reject":
+                self.rejected += 1
+                raise KeyBusy(key)
+            await asyncio.sleep(self.poll_interval)
+
+    def _take(self, entry: _Entry, item: _Pending) -> Optional[str]:
+        """取出与 item 同一发送者的所有排队消息合并，item 已被合并到更早的请求中时返回 None"""
+        if item.taken:
+            return None
+        batch = [pending for pending in entry.pending if pending.sender == item.sender]
+        for pending in batch:
+            pending.taken = True
+        entry.pending = [pending for pending in entry.pending if not pending.taken]
+        self.merged += len(batch) - 1
+        return self.separator.join(pending.text for pending in batch)
+
+    @asynccontextmanager
+    async def hold(self, key: str, text: str, sender: Hashable = None) -> AsyncIterator[Optional[str]]:
+        """持有 key 的锁期间执行，返回本次要处理的文本
+
+        merge 模式下可能是同一 sender 多条消息合并后的文本；为 None 时表示消息已并入其他请求，调用方不必回复。
+        会话忙且被拒绝时抛出 KeyBusy。
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = _Entry()
+        if entry.lock.locked():
+            if self.mode == "reject" or (self.max_waiters and entry.users - 1 >= self.max_waiters):
+                self.rejected += 1
+                raise KeyBusy(key)
+            self.waited += 1
+        entry.users += 1
+        item = _Pending(sender, text)
+        if self.mode == "merge":
+            entry.pending.append(item)
+        try:
+            async with entry.lock:
+                if self.mode == "merge":
+                    text = self._take(entry, item)
+                token = None
+                if text is not None and self.backend is not None:
+                    token = await self._acquire_backend(key)
+                try:
+                    yield text
+                finally:
+                    if token is not None:
+                        await self.backend.release_slot(f"lock.{key}", token)
+        finally:
+            if not item.taken and item in entry.pending:
+                # 等待期间被取消，消息不再处理
+                entry.pending.remove(item)
+            entry.users -= 1
+            if entry.users == 0 and self.entries.get(key) is entry:
+                del self.entries[key]
+
+    def busy(self) -> int:
+        return sum(1 for entry in self.entries.values() if entry.lock.locked())
+
+    def report(self) -> str:
+        waiting = sum(max(0, entry.users - 1) for entry in self.entries.values())
+        scope = "跨进程" if self.backend is not None else "进程内"
+        return (
+            f"- 方式：{self.mode}（{scope}），处理中 {self.busy()} 个会话，排队 {waiting} 条\n"
+            f"- 累计：等待 {self.waited}，合并 {self.merged}，拒绝 {self.rejected}"
+        )
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from nonebot.log import logger
+
+
+class LogWriter:
+    """后台写日志文件：调用方只负责入队，由单个任务在线程中批量追加写入
+
+    避免在事件循环中做文件 IO，也保证同一文件的内容不会交错；退出时 flush 等待队列写完。
+    """
+
+    def __init__(
+        self,
+        header: Optional[Callable[[Path], str]] = None,
+        max_file_size: int = 10 * 1024 * 1024
+    ):
+        self.header = header
+        self.max_file_size = max_file_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.failed = 0
+
+    def write(self, path: Path, content: str) -> None:
+        """追加一段内容，立即返回"""
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        self.queue.put_nowait((path, content))
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self.queue.get()]
+            # 把已排队的内容一次取完，按文件合并后写入
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"写入日志失败: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write_batch(self, batch: List[Tuple[Path, str]]) -> None:
+        grouped: Dict[Path, List[str]] = {}
+        for path, content in batch:
+            grouped.setdefault(path, []).append(content)
+        for path, contents in grouped.items():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 文件过大时重命名归档，使用时间戳区分
+            if path.exists() and path.stat().st_size > self.max_file_size:
+                timestamp = datetime.now().strftime("%H%M%S")
+                path.rename(path.with_name(f"{path.stem}_{timestamp}{path.suffix}"))
+            with open(path, "a", encoding="utf-8") as f:
+                if self.header is not None and f.tell() == 0:
+                    f.write(self.header(path))
+                f.write("".join(contents))
+            self.written += len(contents)
+
+    async def flush(self) -> None:
+        """等待已入队的内容全部写完"""
+        if self.queue is not None and self.task is not None and not self.task.done():
+            await self.queue.join()
+
+    async def close(self) -> None:
+        await self.flush()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
@@ -0,0 +1,171 @@
+import asyncio
+import time
+from collections import deque
+from pathlib import Path
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+import tomli
+from nonebot.log import logger
+
+# 报告中按此顺序列出的阶段及显示名称，其他阶段排在后面
+STAGES = {
+    "parse": "参数解析",
+    "filter": "违禁词过滤",
+    "llm": "LLM 对话",
+    "prompt_opt": "提示词优化",
+    "image_gen": "图片生成",
+    "embed": "问题向量化",
+    "postprocess": "图片后处理",
+    "postprocess_decode": "后处理·解码",
+    "postprocess_resize": "后处理·缩放",
+    "postprocess_convert": "后处理·转换",
+    "postprocess_encode": "后处理·编码",
+    "send": "消息发送",
+    "loop_lag": "事件循环延迟",
+}
+
+# 以毫秒显示的阶段，其余以秒显示
+FAST_STAGES = ("parse", "filter", "send", "embed", "loop_lag")
+
+
+class PerfWindow:
+    """进程内的滚动窗口统计：最近 window 秒内各阶段的耗时样本，以及重试、错误等计数
+
+    调用方只需 record(阶段, 秒数) 记录成功调用的耗时，失败时 incr("阶段.errors")，
+    重试时 incr("阶段.retries")；各插件还可以注册报告来源，补充排队数、缓存命中率等即时状态。
+    """
+
+    def __init__(self, window: float = 600, max_samples: int = 5000):
+        self.window = window
+        self.max_samples = max_samples
+        self.samples: Dict[str, Deque[Tuple[float, float]]] = {}
+        self.events: Dict[str, Deque[float]] = {}
+        self.sources: List[Tuple[str, Callable[[], Union[str, Awaitable[str]]]]] = []
+        self.since = time.time()
+
+    def configure(self, config: dict) -> None:
+        self.window = float(config.get("window", self.window))
+        self.max_samples = int(config.get("max_samples", self.max_samples))
+
+    def record(self, stage: str, seconds: float) -> None:
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples[stage] = deque(maxlen=self.max_samples)
+        samples.append((time.monotonic(), seconds))
+
+    def incr(self, name: str) -> None:
+        events = self.events.get(name)
+        if events is None:
+            events = self.events[name] = deque(maxlen=self.max_samples)
+        events.append(time.monotonic())
+
+    def add_source(self, name: str, func: Callable[[], Union[str, Awaitable[str]]]) -> None:
+        """注册报告中的一节，返回文本（可以是协程）"""
+        self.sources.append((name, func))
+
+    def values(self, stage: str) -> List[float]:
+        cutoff = time.monotonic() - self.window
+        return [value for stamp, value in self.samples.get(stage, ()) if stamp >= cutoff]
+
+    def count(self, name: str) -> int:
+        cutoff = time.monotonic() - self.window
+        return sum(1 for stamp in self.events.get(name, ()) if stamp >= cutoff)
+
+    @staticmethod
+    def _percentile(ordered: List[float], ratio: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+    @staticmethod
+    def _format(value: float, unit: str) -> str:
+        # 毫秒级阶段通常取整显示，不足 1ms 的（参数解析、违禁词过滤）保留两位小数
+        if unit == "ms":
+            return f"{value:.0f}" if value >= 1 else f"{value:.2f}"
+        return f"{value:.1f}"
+
+    def reset(self) -> None:
+        self.samples.clear()
+        self.events.clear()
+        self.since = time.time()
+
+    def _stage_line(self, stage: str, name: str) -> Optional[str]:
+        values = sorted(self.values(stage))
+        errors = self.count(f"{stage}.errors")
+        retries = self.count(f"{stage}.retries")
+        if not values and not errors:
+            return None
+        fast = stage in FAST_STAGES or stage.startswith("postprocess")
+        unit, scale = ("ms", 1000) if fast else ("s", 1)
+        line = f"- {name}：{len(values)} 次"
+        if values:
+            line += "，" + "/".join(
+                self._format(self._percentile(values, ratio) * scale, unit)
+                for ratio in (0.5, 0.95, 0.99)
+            ) + f"{unit}"
+        calls = len(values) + errors
+        # 后处理的各阶段只记录耗时，错误计在 postprocess 上
+        if stage != "loop_lag" and not stage.startswith("postprocess_"):
+            line += f"，错误 {errors / calls * 100:.0f}%" if calls else ""
+            if retries:
+                line += f"，重试 {retries / calls * 100:.0f}%"
+        return line
+
+    async def report(self) -> str:
+        span = min(self.window, time.time() - self.since)
+        span_text = f"{span / 60:.0f} 分钟" if span >= 60 else f"{span:.0f} 秒"
+        lines = [f"最近 {span_text}（p50/p95/p99）："]
+        stages = [*STAGES, *sorted(set(self.samples) - set(STAGES))]
+        for stage in stages:
+            line = self._stage_line(stage, STAGES.get(stage, stage))
+            if line is not None:
+                lines.append(line)
+        if len(lines) == 1:
+            lines.append("- 暂无数据")
+        for name, func in self.sources:
+            try:
+                result = func()
+                if asyncio.iscoroutine(result):
+                    result = await result
+            except Exception as e:
+                result = f"获取失败: {e}"
+            lines.append(f"\n{name}：\n{result}")
+        return "\n".join(lines)
+
+
+class LoopLagMonitor:
+    """定时 sleep 并测量实际唤醒的延迟，延迟高说明有代码阻塞了事件循环"""
+
+    def __init__(self, recorder: PerfWindow, interval: float = 0.5, warn_threshold: float = 0.5):
+        self.recorder = recorder
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.interval > 0 and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - start - self.interval)
+            self.recorder.record("loop_lag", lag)
+            if lag > self.warn_threshold:
+                logger.warning(f"事件循环阻塞 {lag * 1000:.0f}ms")
+
+    def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+def load_perf_config() -> dict:
+    """读取 config.toml 中的 [perf] 配置"""
+    config_file = Path("config.toml")
+    if not config_file.exists():
+        return {}
+    with open(config_file, "rb") as f:
+        return tomli.load(f).get("perf", {})
+
+
+perf = PerfWindow()
@@ -0,0 +1,101 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+from nonebot.log import logger
+
+from .shutdown import coordinator
+
+# 全局共享的进程池，首次使用时才创建
+_pool: Optional[ProcessPoolExecutor] = None
+_max_workers = 2
+
+
+class PoolUnavailable(RuntimeError):
+    """任务无法提交到进程池（进程池已关闭或已损坏）"""
+
+
+def configure_pool(max_workers: int) -> None:
+    """设置进程池大小，多个插件配置时取最大值，进程池创建后不再生效"""
+    global _max_workers
+    if _pool is not None:
+        return
+    _max_workers = max(_max_workers, int(max_workers))
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """获取（必要时创建）共享进程池"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=_max_workers)
+        coordinator.add_hook("图片处理进程池", shutdown_pool)
+        logger.info(f"图片处理进程池已启动，进程数：{_max_workers}")
+    return _pool
+
+
+async def _run_tracked(
+    submit: Callable[[], asyncio.Future],
+    timeout: Optional[float],
+    slot: Optional[asyncio.Semaphore]
+) -> Any:
+    """占用 slot 后提交任务，slot 在任务真正结束时才释放，调用方只等待 timeout 秒"""
+    if slot is not None:
+        await slot.acquire()
+    try:
+        future = submit()
+    except BaseException:
+        if slot is not None:
+            slot.release()
+        raise
+
+    def finished(done: asyncio.Future) -> None:
+        if slot is not None:
+            slot.release()
+        # 调用方已不再等待时，避免“未获取的异常”警告
+        if not done.cancelled():
+            done.exception()
+
+    future.add_done_callback(finished)
+    return await asyncio.wait_for(asyncio.shield(future), timeout=timeout or None)
+
+
+async def run_in_pool(
+    func: Callable[..., Any],
+    *args,
+    timeout: Optional[float] = None,
+    slot: Optional[asyncio.Semaphore] = None
+) -> Any:
+    """在进程池中执行函数，避免阻塞事件循环
+
+    进程中的任务无法中途取消，超时或调用方被取消后仍会运行到结束。传入 slot 时先占用该信号量，
+    直到进程中的任务真正结束才释放，超时的任务不会让调用方误以为有空闲进程而继续提交。
+    任务无法提交时抛出 PoolUnavailable；子进程意外退出时抛出 BrokenProcessPool；函数自身抛出的异常原样传出。
+    """
+    loop = asyncio.get_running_loop()
+
+    def submit() -> asyncio.Future:
+        try:
+            return loop.run_in_executor(get_pool(), func, *args)
+        except Exception as e:
+            raise PoolUnavailable(str(e)) from e
+
+    return await _run_tracked(submit, timeout, slot)
+
+
+async def run_in_thread(
+    func: Callable[..., Any],
+    *args,
+    timeout: Optional[float] = None,
+    slot: Optional[asyncio.Semaphore] = None
+) -> Any:
+    """在默认线程池中执行函数，slot 和超时的处理与 run_in_pool 相同"""
+    loop = asyncio.get_running_loop()
+    return await _run_tracked(lambda: loop.run_in_executor(None, func, *args), timeout, slot)
+
+
+def shutdown_pool(wait: bool = True) -> None:
+    """关闭进程池"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
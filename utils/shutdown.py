@@ -0,0 +1,163 @@
+import asyncio
+import functools
+import signal
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+import tomli
+from nonebot.log import logger
+
+
+class ShutdownCoordinator:
+    """优雅退出：收到退出信号后不再接受新请求，等进行中的聊天和绘图完成后再关闭连接
+
+    uvicorn 在执行 on_shutdown 钩子之前就会断开所有 WebSocket 连接，那时已无法回复消息，
+    因此在启动时接管退出信号：第一次信号先排空进行中的任务，再交给 uvicorn 正常退出；
+    再次收到信号时立即退出。连接断开后依次执行注册的钩子，刷新日志、关闭存储和连接池。
+    """
+
+    def __init__(self):
+        self.draining = False
+        self.deadline = 25.0
+        self.maintenance_message = "冰冰正在重启维护，请稍后再试~"
+        self.in_flight: Dict[str, int] = {}
+        self.hooks: List[Tuple[str, Callable[[], Union[Awaitable[None], None]]]] = []
+        self._installed = False
+        self._drained = False
+        self._drain_task: Optional[asyncio.Task] = None
+        self._last_notified = None
+
+    def configure(self, config: dict) -> None:
+        self.deadline = float(config.get("deadline", self.deadline))
+        self.maintenance_message = config.get("maintenance_message", self.maintenance_message)
+
+    @asynccontextmanager
+    async def track(self, kind: str):
+        """标记一个进行中的任务，退出时会等待其完成"""
+        self.in_flight[kind] = self.in_flight.get(kind, 0) + 1
+        try:
+            yield
+        finally:
+            self.in_flight[kind] -= 1
+
+    def tracked(self, kind: str):
+        """装饰器形式的 track，用于整个处理函数"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                async with self.track(kind):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def pending(self) -> int:
+        return sum(self.in_flight.values())
+
+    def add_hook(self, name: str, func: Callable[[], Union[Awaitable[None], None]]) -> None:
+        """注册退出时执行的清理函数，按注册顺序执行"""
+        self.hooks.append((name, func))
+
+    def install(self) -> None:
+        """向驱动注册启动、退出钩子，多次调用只生效一次"""
+        if self._installed:
+            return
+        self._installed = True
+        from nonebot import get_driver
+        from nonebot.adapters import Bot, Event
+        from nonebot.exception import IgnoredException
+        from nonebot.message import run_preprocessor
+
+        self.configure(load_shutdown_config())
+        driver = get_driver()
+        driver.on_startup(self._install_signal_handlers)
+        driver.on_shutdown(self.shutdown)
+
+        @run_preprocessor
+        async def reject_when_draining(bot: Bot, event: Event):
+            if not self.draining:
+                return
+            # 同一条消息可能触发多个响应器，只回复一次
+            key = (bot.self_id, getattr(event, "message_id", None))
+            if key != self._last_notified:
+                self._last_notified = key
+                try:
+                    await bot.send(event, self.maintenance_message)
+                except Exception as e:
+                    logger.warning(f"发送维护提示失败: {e}")
+            raise IgnoredException("正在退出，不再处理新请求")
+
+    async def _install_signal_handlers(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            previous = signal.getsignal(sig)
+            if not callable(previous):
+                continue
+
+            def handler(signum, frame, previous=previous):
+                if self.draining:
+                    logger.warning("再次收到退出信号，立即退出")
+                    previous(signum, frame)
+                    return
+                loop.call_soon_threadsafe(self._start_drain, previous, signum, frame)
+
+            signal.signal(sig, handler)
+
+    def _start_drain(self, previous, signum, frame) -> None:
+        if self._drain_task is None:
+            self._drain_task = asyncio.create_task(self._drain_then_exit(previous, signum, frame))
+
+    async def _drain_then_exit(self, previous, signum, frame) -> None:
+        await self.drain()
+        # 交还给 uvicorn 的信号处理，断开连接并执行 on_shutdown
+        previous(signum, frame)
+
+    async def drain(self) -> None:
+        """停止接受新请求，等待进行中的任务完成或超过截止时间"""
+        if self._drained:
+            return
+        self.draining = True
+        start = time.monotonic()
+        logger.info(f"开始优雅退出，最多等待 {self.deadline:.0f} 秒，进行中的任务：{self.pending()}")
+        last_report = start
+        while self.pending():
+            elapsed = time.monotonic() - start
+            if elapsed >= self.deadline:
+                logger.warning(f"等待超时，放弃 {self._describe()}")
+                break
+            if time.monotonic() - last_report >= 2:
+                last_report = time.monotonic()
+                logger.info(f"等待进行中的任务完成：{self._describe()}（剩余 {self.deadline - elapsed:.0f} 秒）")
+            await asyncio.sleep(0.2)
+        else:
+            logger.info(f"进行中的任务已全部完成，用时 {time.monotonic() - start:.1f} 秒")
+        self._drained = True
+
+    def _describe(self) -> str:
+        return "，".join(f"{kind}={count}" for kind, count in self.in_flight.items() if count) or "无"
+
+    async def shutdown(self) -> None:
+        """on_shutdown 钩子：未经信号触发时也先排空，然后依次执行清理函数"""
+        await self.drain()
+        for name, func in self.hooks:
+            start = time.monotonic()
+            try:
+                result = func()
+                if asyncio.iscoroutine(result):
+                    await asyncio.wait_for(result, timeout=self.deadline)
+                logger.info(f"已关闭 {name}，用时 {time.monotonic() - start:.2f} 秒")
+            except Exception as e:
+                logger.error(f"关闭 {name} 失败: {e}")
+
+
+def load_shutdown_config() -> dict:
+    """读取 config.toml 中的 [shutdown] 配置"""
+    config_file = Path("config.toml")
+    if not config_file.exists():
+        return {}
+    with open(config_file, "rb") as f:
+        return tomli.load(f).get("shutdown", {})
+
+
+coordinator = ShutdownCoordinator()
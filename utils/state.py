@@ -0,0 +1,351 @@
+import asyncio
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import tomli
+from nonebot.log import logger
+
+from . import jsonlib
+
+
+class StateBackend(ABC):
+    """插件运行时状态的存储接口
+
+    包括设置项、冷却时间等键值数据，对话历史，以及跨进程的并发槽位（槽位上限为 1 时即为锁）。
+    所有值都需要能被 JSON 序列化（自定义对象可提供 to_json()），多个工作进程共享同一个后端时状态一致。
+    """
+
+    # 是否可以在多个进程之间共享
+    shared = False
+
+    @abstractmethod
+    async def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def clear(self, namespace: str, prefix: str = "") -> None:
+        """删除命名空间内以 prefix 开头的所有键"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def items(self, namespace: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_history(self, key: str) -> List[dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_history(self, key: str, messages: List[dict]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def clear_history(self, prefix: str = "") -> None:
+        """删除以 prefix 开头的对话历史，prefix 为空时全部删除"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def all_histories(self, prefix: str = "") -> Dict[str, List[Any]]:
+        """以 prefix 开头的所有对话历史，用于统计"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def acquire_slot(self, name: str, limit: int, ttl: float) -> Optional[str]:
+        """尝试占用一个槽位，成功返回令牌，已满返回 None；超过 ttl 未释放的槽位视为失效"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release_slot(self, name: str, token: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def slot_usage(self, name: str) -> int:
+        raise NotImplementedError
+
+    async def cooldown_remaining(self, namespace: str, key: str, seconds: float) -> float:
+        """距离冷却结束还剩多少秒，未在冷却中返回 0"""
+        last = await self.get(namespace, key)
+        if last is None:
+            return 0.0
+        return max(0.0, seconds - (time.time() - last))
+
+    async def start_cooldown(self, namespace: str, key: str, seconds: float) -> None:
+        await self.set(namespace, key, time.time(), ttl=seconds)
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryBackend(StateBackend):
+    """进程内存储，只适用于单进程运行"""
+
+    def __init__(self):
+        self.data: Dict[str, Dict[str, tuple]] = {}
+        self.histories: Dict[str, List[dict]] = {}
+        self.slots: Dict[str, Dict[str, float]] = {}
+
+    async def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        entry = self.data.get(namespace, {}).get(key)
+        if entry is None:
+            return default
+        value, expires = entry
+        if expires is not None and expires < time.time():
+            del self.data[namespace][key]
+            return default
+        return value
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.time() + ttl if ttl else None
+        self.data.setdefault(namespace, {})[key] = (value, expires)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        self.data.get(namespace, {}).pop(key, None)
+
+    async def clear(self, namespace: str, prefix: str = "") -> None:
+        entries = self.data.get(namespace, {})
+        for key in [k for k in entries if k.startswith(prefix)]:
+            del entries[key]
+
+    async def items(self, namespace: str) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            key: value
+            for key, (value, expires) in self.data.get(namespace, {}).items()
+            if expires is None or expires >= now
+        }
+
+    async def get_history(self, key: str) -> List[dict]:
+        return self.histories.get(key, [])
+
+    async def set_history(self, key: str, messages: List[dict]) -> None:
+        self.histories[key] = messages
+
+    async def clear_history(self, prefix: str = "") -> None:
+        if not prefix:
+            self.histories.clear()
+            return
+        for key in [k for k in self.histories if k.startswith(prefix)]:
+            del self.histories[key]
+
+    async def all_histories(self, prefix: str = "") -> Dict[str, List[Any]]:
+        return {key: messages for key, messages in self.histories.items() if key.startswith(prefix)}
+
+    async def acquire_slot(self, name: str, limit: int, ttl: float) -> Optional[str]:
+        now = time.time()
+        holders = self.slots.setdefault(name, {})
+        for token in [t for t, expires in holders.items() if expires < now]:
+            del holders[token]
+        if len(holders) >= limit:
+            return None
+        token = uuid.uuid4().hex
+        holders[token] = now + ttl
+        return token
+
+    async def release_slot(self, name: str, token: str) -> None:
+        self.slots.get(name, {}).pop(token, None)
+
+    async def slot_usage(self, name: str) -> int:
+        now = time.time()
+        return sum(1 for expires in self.slots.get(name, {}).values() if expires >= now)
+
+
+class SQLiteBackend(StateBackend):
+    """本地 SQLite 存储，同一台机器上的多个工作进程共享
+
+    所有语句都在一个专用线程中依次执行，写冲突时等待 busy_timeout 也不会阻塞事件循环；
+    WAL 模式下读写互不阻塞。
+    """
+
+    shared = True
+
+    def __init__(self, path: str = "data/state.db", busy_timeout: float = 5.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 连接只在 executor 的单个线程中使用，语句天然串行
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-sqlite")
+        self.conn = self.executor.submit(self._connect, busy_timeout).result()
+
+    def _connect(self, busy_timeout: float) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=busy_timeout, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires REAL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE TABLE IF NOT EXISTS history (
+                key TEXT PRIMARY KEY,
+                messages TEXT NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS slots (
+                name TEXT NOT NULL,
+                token TEXT NOT NULL,
+                expires REAL NOT NULL,
+                PRIMARY KEY (name, token)
+            );
+        """)
+        return conn
+
+    async def _run(self, func: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _fetchone(self, sql: str, params: tuple) -> Optional[tuple]:
+        return self.conn.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql: str, params: tuple) -> List[tuple]:
+        return self.conn.execute(sql, params).fetchall()
+
+    def _execute(self, sql: str, params: tuple) -> None:
+        self.conn.execute(sql, params)
+
+    async def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        row = await self._run(
+            self._fetchone, "SELECT value, expires FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return default
+        return jsonlib.loads(row[0])
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.time() + ttl if ttl else None
+        await self._run(
+            self._execute,
+            "INSERT OR REPLACE INTO kv (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+            (namespace, key, jsonlib.dumps(value), expires)
+        )
+
+    async def delete(self, namespace: str, key: str) -> None:
+        await self._run(self._execute, "DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    async def clear(self, namespace: str, prefix: str = "") -> None:
+        await self._run(
+            self._execute,
+            "DELETE FROM kv WHERE namespace = ? AND substr(key, 1, ?) = ?",
+            (namespace, len(prefix), prefix)
+        )
+
+    async def items(self, namespace: str) -> Dict[str, Any]:
+        rows = await self._run(
+            self._fetchall,
+            "SELECT key, value FROM kv WHERE namespace = ? AND (expires IS NULL OR expires >= ?)",
+            (namespace, time.time())
+        )
+        return {key: jsonlib.loads(value) for key, value in rows}
+
+    async def get_history(self, key: str) -> List[dict]:
+        row = await self._run(self._fetchone, "SELECT messages FROM history WHERE key = ?", (key,))
+        return jsonlib.loads(row[0]) if row else []
+
+    async def set_history(self, key: str, messages: List[dict]) -> None:
+        await self._run(
+            self._execute,
+            "INSERT OR REPLACE INTO history (key, messages, updated) VALUES (?, ?, ?)",
+            (key, jsonlib.dumps(messages), time.time())
+        )
+
+    async def clear_history(self, prefix: str = "") -> None:
+        await self._run(
+            self._execute, "DELETE FROM history WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+        )
+
+    async def all_histories(self, prefix: str = "") -> Dict[str, List[Any]]:
+        rows = await self._run(
+            self._fetchall, "SELECT key, messages FROM history WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+        )
+        return {key: jsonlib.loads(messages) for key, messages in rows}
+
+    def _acquire_slot(self, name: str, limit: int, ttl: float) -> Optional[str]:
+        now = time.time()
+        # IMMEDIATE 事务先拿到写锁，保证“统计-插入”在多进程间是原子的
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("DELETE FROM slots WHERE name = ? AND expires < ?", (name, now))
+            used = self.conn.execute("SELECT COUNT(*) FROM slots WHERE name = ?", (name,)).fetchone()[0]
+            if used >= limit:
+                self.conn.execute("COMMIT")
+                return None
+            token = uuid.uuid4().hex
+            self.conn.execute(
+                "INSERT INTO slots (name, token, expires) VALUES (?, ?, ?)", (name, token, now + ttl)
+            )
+            self.conn.execute("COMMIT")
+            return token
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    async def acquire_slot(self, name: str, limit: int, ttl: float) -> Optional[str]:
+        return await self._run(self._acquire_slot, name, limit, ttl)
+
+    async def release_slot(self, name: str, token: str) -> None:
+        await self._run(self._execute, "DELETE FROM slots WHERE name = ? AND token = ?", (name, token))
+
+    async def slot_usage(self, name: str) -> int:
+        row = await self._run(
+            self._fetchone, "SELECT COUNT(*) FROM slots WHERE name = ? AND expires >= ?", (name, time.time())
+        )
+        return row[0]
+
+    def close(self) -> None:
+        self.executor.submit(self.conn.close).result()
+        self.executor.shutdown()
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "sqlite": SQLiteBackend,
+}
+
+_backend: Optional[StateBackend] = None
+
+
+def load_state_config() -> dict:
+    """读取 config.toml 中的 [state] 配置"""
+    config_file = Path("config.toml")
+    if not config_file.exists():
+        return {}
+    with open(config_file, "rb") as f:
+        return tomli.load(f).get("state", {})
+
+
+def create_backend(state_config: dict) -> StateBackend:
+    name = state_config.get("backend", "memory")
+    if name not in BACKENDS:
+        raise ValueError(f"不支持的状态存储: {name}，可选：{', '.join(BACKENDS)}")
+    if name == "sqlite":
+        return SQLiteBackend(
+            state_config.get("path", "data/state.db"),
+            busy_timeout=state_config.get("busy_timeout", 5.0)
+        )
+    return MemoryBackend()
+
+
+def get_state() -> StateBackend:
+    """获取（必要时创建）全局共享的状态存储"""
+    global _backend
+    if _backend is None:
+        state_config = load_state_config()
+        _backend = create_backend(state_config)
+        # 延迟导入，避免与 shutdown 模块循环引用
+        from .shutdown import coordinator
+        coordinator.add_hook("状态存储", _backend.close)
+        logger.info(f"状态存储：{state_config.get('backend', 'memory')}")
+    return _backend
@@ -0,0 +1,46 @@
+import os
+from pathlib import Path
+
+from nonebot.adapters import Event
+
+# 由 bot.py 在启动工作进程时设置，单进程运行时为 0/1
+WORKER_INDEX = int(os.environ.get("BOT_WORKER_INDEX", "0"))
+WORKER_COUNT = int(os.environ.get("BOT_WORKER_COUNT", "1"))
+WORKER_SHARD = os.environ.get("BOT_WORKER_SHARD", "connection")
+
+
+def is_worker() -> bool:
+    """是否以多进程方式运行"""
+    return WORKER_COUNT > 1
+
+
+def shares_conversations() -> bool:
+    """同一个群的消息是否可能由多个工作进程处理
+
+    按连接分片时，加入同一个群的多个机器人账号可能连到不同进程；只有按群分片时同一个群固定在一个进程。
+    """
+    return is_worker() and WORKER_SHARD != "group"
+
+
+def worker_path(path: str) -> str:
+    """为每个工作进程生成独立的文件路径，如 data/jobs.json -> data/jobs.worker1.json"""
+    if not is_worker():
+        return path
+    p = Path(path)
+    return str(p.with_name(f"{p.stem}.worker{WORKER_INDEX}{p.suffix}"))
+
+
+def shard_of(event: Event) -> int:
+    """按群号（私聊按 QQ 号）计算事件所属的工作进程"""
+    group_id = getattr(event, "group_id", None)
+    target = group_id if group_id is not None else getattr(event, "user_id", None)
+    if target is None:
+        return WORKER_INDEX
+    return int(target) % WORKER_COUNT
+
+
+def owns_event(event: Event) -> bool:
+    """当前工作进程是否负责处理该事件，生命周期、心跳等元事件所有进程都处理"""
+    if not is_worker() or event.get_type() == "meta_event":
+        return True
+    return shard_of(event) == WORKER_INDEX